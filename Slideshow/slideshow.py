@@ -5,8 +5,10 @@ from PIL import Image, ImageTk
 import os
 import random
 import threading
-from queue import Queue
-import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Modes Image.reduce can box-average correctly
+REDUCIBLE_MODES = ('L', 'LA', 'RGB', 'RGBA', 'RGBX', 'CMYK', 'YCbCr', 'I', 'F')
 
 class SlideshowApp:
     def __init__(self, root):
@@ -37,9 +39,15 @@ class SlideshowApp:
         
         self.image_cache = {}
         self.cache_size = 10
-        self.preload_queue = Queue()
-        self.preload_thread = None
         self.preload_active = False
+        # Pillow releases the GIL while decoding and resampling, so plain threads scale
+        self.decode_workers = max(2, min(4, (os.cpu_count() or 2) - 1))
+        self.decode_pool = None
+        self.pending = {}
+        self.failed = set()
+        self.preload_generation = 0
+        self.direction = 1
+        self.closing = False
         
         self.canvas_size = (1920, 1080)
         self.loading = False
@@ -189,56 +197,111 @@ class SlideshowApp:
 
     def start_preloading(self):
         """Starts image preloading"""
-        if self.preload_thread and self.preload_thread.is_alive():
-            self.preload_active = False
-            self.preload_thread.join(timeout=1)
+        if self.decode_pool is None:
+            self.decode_pool = ThreadPoolExecutor(max_workers=self.decode_workers, thread_name_prefix="decode")
         
         self.preload_active = True
-        self.preload_thread = threading.Thread(target=self._preload_worker, daemon=True)
-        self.preload_thread.start()
+        self._reset_preload()
+        self._schedule_preload()
 
-    def _preload_worker(self):
-        """Worker thread for preloading"""
-        while self.preload_active and self.images:
-            try:
-                indices_to_preload = self._get_preload_indices()
-                
-                for idx in indices_to_preload:
-                    if not self.preload_active:
-                        break
-                    
-                    if idx not in self.image_cache:
-                        try:
-                            img_path = self.images[idx]
-                            img = Image.open(img_path)
-                            resized_img = self.resize_image(img)
-                            photo = ImageTk.PhotoImage(resized_img)
-                            self.image_cache[idx] = photo
-                            
-                            if len(self.image_cache) > self.cache_size * 2:
-                                self._cleanup_cache()
-                                
-                        except Exception as e:
-                            print(f"Preloading error for {img_path}: {e}")
-                            continue
-                
-                time.sleep(0.1)
+    def stop_preloading(self):
+        """Stops image preloading"""
+        self.preload_active = False
+        self._reset_preload()
+
+    def _reset_preload(self):
+        """Drops queued decodes; results still in flight are ignored when they arrive"""
+        self.preload_generation += 1
+        for future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        self.failed.clear()
+
+    def _schedule_preload(self):
+        """Hands the most wanted uncached images to the decode pool"""
+        if not self.preload_active or not self.images or self.decode_pool is None:
+            return
+        
+        wanted = self._get_preload_indices()
+        wanted_set = set(wanted)
+        
+        # A jump leaves queued neighbours of the old position behind
+        for idx, future in list(self.pending.items()):
+            if idx not in wanted_set and future.cancel():
+                del self.pending[idx]
+        
+        # Only as many decodes as workers are submitted, so the next free worker
+        # always takes the nearest image rather than whatever was queued first
+        for idx in wanted:
+            if len(self.pending) >= self.decode_workers:
+                break
+            if idx in self.image_cache or idx in self.pending or idx in self.failed:
+                continue
+            
+            future = self.decode_pool.submit(self._decode_image, self.images[idx])
+            self.pending[idx] = future
+            future.add_done_callback(
+                lambda f, idx=idx, generation=self.preload_generation:
+                    self._post_decoded(idx, generation, f)
+            )
+
+    def _post_decoded(self, idx, generation, future):
+        """Hands a finished decode back to the Tk thread (runs on a pool thread)"""
+        if self.closing:
+            return
+        try:
+            self.root.after(0, self._on_image_decoded, idx, generation, future)
+        except (RuntimeError, tk.TclError):
+            # The window went away between the check and the call
+            pass
+
+    def _decode_image(self, image_path):
+        """Decodes and resizes one image on a pool thread"""
+        with Image.open(image_path) as img:
+            return self.resize_image(img)
+
+    def _on_image_decoded(self, idx, generation, future):
+        """Caches a finished decode and schedules the next one"""
+        if self.pending.get(idx) is future:
+            del self.pending[idx]
+        
+        if generation != self.preload_generation or future.cancelled():
+            return
+        
+        try:
+            img = future.result()
+        except Exception as e:
+            print(f"Preloading error for {self.images[idx]}: {e}")
+            self.failed.add(idx)
+        else:
+            if idx not in self.image_cache and idx in self._get_preload_indices():
+                # PhotoImage has to be created on the Tk thread
+                self.image_cache[idx] = ImageTk.PhotoImage(img)
                 
-            except Exception as e:
-                print(f"Error in preloader: {e}")
-                time.sleep(1)
+                if len(self.image_cache) > self.cache_size * 2:
+                    self._cleanup_cache()
+        
+        self._schedule_preload()
 
     def _get_preload_indices(self):
-        """Gets indices of images to preload"""
+        """Gets indices of images to preload, most wanted first"""
         if not self.images:
             return []
         
-        indices = []
         half_cache = self.cache_size // 2
         
-        for i in range(-half_cache, half_cache + 1):
+        # Nearest first, and an image ahead in the direction of travel counts
+        # as half as far away as one behind
+        offsets = sorted(
+            range(-half_cache, half_cache + 1),
+            key=lambda i: (abs(i) * (1 if i * self.direction >= 0 else 2), i * self.direction < 0)
+        )
+        
+        indices = []
+        for i in offsets:
             idx = (self.current_index + i) % len(self.images)
-            indices.append(idx)
+            if idx not in indices:
+                indices.append(idx)
         
         return indices
 
@@ -269,6 +332,7 @@ class SlideshowApp:
                 self._load_image_immediately()
             
             self.show_image_info()
+            self._schedule_preload()
             
         except Exception as e:
             print(f"Error showing image: {e}")
@@ -291,9 +355,13 @@ class SlideshowApp:
     def _load_image_immediately(self):
         """Loads and displays an image immediately"""
         try:
-            image_path = self.images[self.current_index]
-            img = Image.open(image_path)
-            img = self.resize_image(img)
+            future = self.pending.get(self.current_index)
+            if future is not None and future.running():
+                # Already being decoded on the pool, so wait for it rather than start over
+                img = future.result()
+            else:
+                image_path = self.images[self.current_index]
+                img = self._decode_image(image_path)
             photo = ImageTk.PhotoImage(img)
             
             self.image_cache[self.current_index] = photo
@@ -326,6 +394,19 @@ class SlideshowApp:
             new_height = target_height
             new_width = int(target_height * img_ratio)
         
+        # JPEG can decode straight at 1/2, 1/4 or 1/8 scale; draft picks the
+        # smallest of those still at or above the target and does nothing
+        # for other formats or images that are already loaded
+        img.draft(img.mode, (new_width, new_height))
+        
+        # Other formats get a cheap integer box reduce first, so LANCZOS only
+        # works on an image at most twice the target size. reduce() rejects
+        # 16-bit modes and would average palette indices, so anything else
+        # goes straight to the resample
+        factor = min(img.size[0] // max(new_width, 1), img.size[1] // max(new_height, 1))
+        if factor >= 2 and hasattr(img, 'reduce') and img.mode in REDUCIBLE_MODES:
+            img = img.reduce(factor)
+        
         if hasattr(Image, 'Resampling'):
             resample = Image.Resampling.LANCZOS
         else:
@@ -377,12 +458,14 @@ class SlideshowApp:
     def previous_image(self, event=None):
         """Previous image"""
         if self.images and not self.loading:
+            self.direction = -1
             self.current_index = (self.current_index - 1) % len(self.images)
             self.show_image()
 
     def next_image(self, event=None):
         """Next image"""
         if self.images and not self.loading:
+            self.direction = 1
             self.current_index = (self.current_index + 1) % len(self.images)
             self.show_image()
 
@@ -391,6 +474,7 @@ class SlideshowApp:
         if self.images:
             if self.current_index in self.image_cache:
                 del self.image_cache[self.current_index]
+            self.failed.discard(self.current_index)
             self.show_image()
 
     def restart_slideshow_timer(self):
@@ -416,6 +500,7 @@ class SlideshowApp:
         self.shuffle_images = not self.shuffle_images
         
         self.image_cache.clear()
+        self._reset_preload()
         
         if self.shuffle_images:
             current_image = self.images[self.current_index]
@@ -496,11 +581,12 @@ class SlideshowApp:
         """Sets cache size"""
         self.cache_size = size
         self._cleanup_cache()
+        self._schedule_preload()
 
     def load_new_folder(self):
         """Loads new folder"""
         self.slideshow_running = False
-        self.preload_active = False
+        self.stop_preloading()
         
         if self.slideshow_timer:
             self.root.after_cancel(self.slideshow_timer)
@@ -514,13 +600,14 @@ class SlideshowApp:
 
     def exit_program(self, event=None):
         """Exits the program"""
-        self.preload_active = False
+        self.closing = True
+        self.stop_preloading()
         
         if self.slideshow_timer:
             self.root.after_cancel(self.slideshow_timer)
         
-        if self.preload_thread and self.preload_thread.is_alive():
-            self.preload_thread.join(timeout=1)
+        if self.decode_pool is not None:
+            self.decode_pool.shutdown(wait=False, cancel_futures=True)
         
         self.root.quit()
         self.root.destroy()
@@ -0,0 +1,42 @@
+import types
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+pytest.importorskip("tkinter")
+pytest.importorskip("ttkthemes")
+
+from slideshow import SlideshowApp
+
+
+def resize(img, canvas_size=(1920, 1080)):
+    # resize_image only reads canvas_size, so no Tk window is needed
+    return SlideshowApp.resize_image(types.SimpleNamespace(canvas_size=canvas_size), img)
+
+
+def test_resize_16bit_grayscale(tmp_path):
+    # reduce() rejects I;16, so these must fall through to the plain resample
+    path = tmp_path / "depth.png"
+    Image.new("I;16", (6000, 4000), 1000).save(path)
+    with Image.open(path) as img:
+        assert img.mode == "I;16"
+        result = resize(img)
+    assert result.size == (1560, 1040)
+
+
+def test_resize_palette_image(tmp_path):
+    path = tmp_path / "palette.gif"
+    Image.new("RGB", (3000, 2000), (200, 30, 30)).convert("P").save(path)
+    with Image.open(path) as img:
+        result = resize(img)
+    assert result.size == (1560, 1040)
+
+
+def test_resize_jpeg_uses_draft(tmp_path):
+    path = tmp_path / "photo.jpg"
+    Image.new("RGB", (6000, 4000), (10, 120, 200)).save(path)
+    with Image.open(path) as img:
+        result = resize(img)
+        # DCT scaling decoded at 1/2, the smallest scale still above 1560x1040
+        assert img.size == (3000, 2000)
+    assert result.size == (1560, 1040)
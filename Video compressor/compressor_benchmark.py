@@ -0,0 +1,201 @@
+import argparse
+import csv
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from compressor_engine import ENCODER_BACKENDS, PRESET_SETTINGS, build_encode_command, make_settings
+
+# Synthetic clips: moving test pattern plus temporal noise so the encoders
+# have real detail to spend bits on, and a tone so the audio path runs too
+CLIP_RESOLUTIONS = {"480p": "854x480", "720p": "1280x720", "1080p": "1920x1080"}
+CLIP_SECONDS = 5
+CLIP_FPS = 30
+CLIP_NOISE = 12
+
+# Regression mode flags a run this much slower or bigger than the baseline
+FPS_TOLERANCE = 0.10
+SIZE_TOLERANCE = 0.05
+
+RESULT_FIELDS = ["clip", "preset", "codec", "crf", "returncode", "frames", "wall_seconds", "fps",
+                 "cpu_seconds", "peak_rss_mb", "output_bytes"]
+
+
+def default_clip_folder():
+    return os.path.join(os.path.expanduser("~"), ".video_compressor", "bench_clips")
+
+
+def make_clip(ffmpeg_path, folder, name, size):
+    # Clips are cached; the noise seed is fixed so every run encodes identical input
+    path = os.path.join(folder, f"{name}_{CLIP_SECONDS}s.mkv")
+    if os.path.exists(path):
+        return path
+    os.makedirs(folder, exist_ok=True)
+    partial = f"{path}.partial.mkv"
+    cmd = [
+        ffmpeg_path,
+        "-f", "lavfi", "-i", f"testsrc2=size={size}:rate={CLIP_FPS}:duration={CLIP_SECONDS}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={CLIP_SECONDS}",
+        "-vf", f"noise=alls={CLIP_NOISE}:allf=t+u:all_seed=1",
+        "-c:v", "libx264", "-preset", "ultrafast", "-crf", "10", "-pix_fmt", "yuv420p",
+        "-c:a", "pcm_s16le",
+        "-y", partial
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        raise Exception(f"Failed to generate {name} clip\n{result.stderr[-2000:]}")
+    os.replace(partial, path)
+    return path
+
+
+def run_measured(cmd):
+    # Returns (returncode, wall_seconds, cpu_seconds, peak_rss_mb). CPU time and
+    # RSS come from wait4 on the encoder itself, so they need a POSIX host
+    with tempfile.TemporaryFile() as stderr_file:
+        start = time.perf_counter()
+        process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=stderr_file)
+        if hasattr(os, "wait4"):
+            _, status, usage = os.wait4(process.pid, 0)
+            wall_seconds = time.perf_counter() - start
+            process.returncode = os.waitstatus_to_exitcode(status)
+            cpu_seconds = usage.ru_utime + usage.ru_stime
+            # ru_maxrss is KiB on Linux and bytes on macOS
+            peak_rss_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+        else:
+            process.wait()
+            wall_seconds = time.perf_counter() - start
+            cpu_seconds = None
+            peak_rss_mb = None
+    return process.returncode, wall_seconds, cpu_seconds, peak_rss_mb
+
+
+def run_benchmark(ffmpeg_path, clips, presets, codecs, work_dir, threads=None, on_result=None):
+    results = []
+    frames = CLIP_SECONDS * CLIP_FPS
+    for clip_name, clip_path in clips:
+        for preset in presets:
+            for codec in codecs:
+                settings = make_settings(preset, codec=codec)
+                output_file = os.path.join(work_dir, f"{clip_name}_{preset}_{codec}.mp4")
+                cmd = build_encode_command(ffmpeg_path, clip_path, output_file, settings, threads=threads)
+                returncode, wall_seconds, cpu_seconds, peak_rss_mb = run_measured(cmd)
+                output_bytes = os.path.getsize(output_file) if returncode == 0 else None
+                result = {
+                    "clip": clip_name,
+                    "preset": preset,
+                    "codec": codec,
+                    "crf": settings["crf"],
+                    "returncode": returncode,
+                    "frames": frames,
+                    "wall_seconds": round(wall_seconds, 3),
+                    "fps": round(frames / wall_seconds, 2) if returncode == 0 and wall_seconds > 0 else None,
+                    "cpu_seconds": round(cpu_seconds, 3) if cpu_seconds is not None else None,
+                    "peak_rss_mb": round(peak_rss_mb, 1) if peak_rss_mb is not None else None,
+                    "output_bytes": output_bytes
+                }
+                results.append(result)
+                if os.path.exists(output_file):
+                    os.remove(output_file)
+                if on_result:
+                    on_result(result)
+    return results
+
+
+def result_key(result):
+    return result["clip"], result["preset"], result["codec"]
+
+
+def compare_to_baseline(results, baseline, fps_tolerance=FPS_TOLERANCE, size_tolerance=SIZE_TOLERANCE):
+    # Returns a list of human-readable regressions; combinations missing from
+    # either side are ignored so the matrix can grow without breaking old baselines
+    baseline_by_key = {result_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        old = baseline_by_key.get(result_key(result))
+        if old is None:
+            continue
+        name = "/".join(result_key(result))
+        if result["returncode"] != 0:
+            if old["returncode"] == 0:
+                regressions.append(f"{name}: encode now fails (exit {result['returncode']})")
+            continue
+        if old["fps"] and result["fps"] < old["fps"] * (1 - fps_tolerance):
+            regressions.append(f"{name}: {result['fps']:.1f} fps vs {old['fps']:.1f} baseline")
+        if old["output_bytes"] and result["output_bytes"] > old["output_bytes"] * (1 + size_tolerance):
+            regressions.append(f"{name}: {result['output_bytes']} bytes vs {old['output_bytes']} baseline")
+    return regressions
+
+
+def write_results(results, output_prefix):
+    with open(f"{output_prefix}.json", "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    with open(f"{output_prefix}.csv", "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def describe_result(result):
+    if result["returncode"] != 0:
+        return f"{result['clip']:>6} {result['preset']:>9} {result['codec']:>11}  failed (exit {result['returncode']})"
+    text = (f"{result['clip']:>6} {result['preset']:>9} {result['codec']:>11}  "
+            f"{result['fps']:7.1f} fps  {result['wall_seconds']:7.2f} s  "
+            f"{result['output_bytes'] / 1024:9.0f} KiB")
+    if result["cpu_seconds"] is not None:
+        text += f"  {result['cpu_seconds']:7.2f} cpu s  {result['peak_rss_mb']:7.1f} MB rss"
+    return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="compressor_benchmark",
+                                     description="Benchmark every preset and codec on synthetic clips.")
+    parser.add_argument("--ffmpeg", default=shutil.which("ffmpeg"), help="path to ffmpeg (default: from PATH)")
+    parser.add_argument("--resolutions", nargs="+", choices=list(CLIP_RESOLUTIONS), default=list(CLIP_RESOLUTIONS))
+    parser.add_argument("--presets", nargs="+", choices=list(PRESET_SETTINGS), default=list(PRESET_SETTINGS))
+    parser.add_argument("--codecs", nargs="+", choices=list(ENCODER_BACKENDS), default=list(ENCODER_BACKENDS))
+    parser.add_argument("--threads", type=int, help="encoder threads per run (default: encoder's choice)")
+    parser.add_argument("--clips", default=default_clip_folder(), help="folder for the cached synthetic clips")
+    parser.add_argument("-o", "--output", default="benchmark", help="write OUTPUT.csv and OUTPUT.json")
+    parser.add_argument("--baseline", help="results JSON to compare against; exit 1 on regressions")
+    parser.add_argument("--fps-tolerance", type=float, default=FPS_TOLERANCE)
+    parser.add_argument("--size-tolerance", type=float, default=SIZE_TOLERANCE)
+    args = parser.parse_args(argv)
+    
+    if not args.ffmpeg or not os.path.exists(args.ffmpeg):
+        parser.error("FFmpeg not found; pass --ffmpeg")
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    
+    clips = []
+    for name in args.resolutions:
+        print(f"Preparing {name} clip...", file=sys.stderr)
+        clips.append((name, make_clip(args.ffmpeg, args.clips, name, CLIP_RESOLUTIONS[name])))
+    
+    work_dir = tempfile.mkdtemp(prefix="compressor_bench_")
+    try:
+        results = run_benchmark(args.ffmpeg, clips, args.presets, args.codecs, work_dir, args.threads,
+                                lambda result: print(describe_result(result), flush=True))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    
+    write_results(results, args.output)
+    print(f"Wrote {args.output}.csv and {args.output}.json", file=sys.stderr)
+    
+    if baseline is not None:
+        regressions = compare_to_baseline(results, baseline, args.fps_tolerance, args.size_tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print("No regressions against the baseline", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
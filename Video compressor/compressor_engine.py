@@ -0,0 +1,3271 @@
+import argparse
+import subprocess
+import threading
+import os
+import re
+import sys
+import ctypes
+import ctypes.util
+import select
+import signal
+import struct
+import json
+import hashlib
+import http.client
+import sqlite3
+import time
+import shutil
+import tempfile
+from collections import deque, namedtuple
+from contextlib import contextmanager, nullcontext
+from itertools import count, islice
+from concurrent.futures import ThreadPoolExecutor
+
+# libx264 stops scaling well past a handful of threads per encode, so batch mode
+# runs several encodes side by side instead of one encode with every core
+X264_THREADS_PER_JOB = 4
+
+# Segment-parallel mode only pays off once the split/concat overhead is small
+SEGMENT_MIN_DURATION = 600
+SEGMENT_MIN_LENGTH = 30
+SEGMENTS_PER_JOB = 3
+
+# Progress updates reaching Tk are capped to a few per second per job
+PROGRESS_INTERVAL = 0.25
+STDERR_TAIL_LINES = 50
+
+
+class MediaProber:
+    def __init__(self):
+        self.cache = {}
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def get_ffprobe_path(ffmpeg_path):
+        # ffprobe ships next to ffmpeg in every FFmpeg build
+        folder, name = os.path.split(ffmpeg_path)
+        return os.path.join(folder, name.replace("ffmpeg", "ffprobe"))
+    
+    def probe(self, ffmpeg_path, filepath):
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None
+        
+        key = (os.path.abspath(filepath), stat.st_size, stat.st_mtime)
+        with self.lock:
+            if key in self.cache:
+                return self.cache[key]
+        
+        info = self.run_ffprobe(ffmpeg_path, filepath)
+        if info is None:
+            info = self.run_ffmpeg_fallback(ffmpeg_path, filepath)
+        if info is not None:
+            info["size"] = stat.st_size
+            with self.lock:
+                self.cache[key] = info
+        return info
+    
+    def run_ffprobe(self, ffmpeg_path, filepath):
+        ffprobe_path = self.get_ffprobe_path(ffmpeg_path)
+        if not os.path.exists(ffprobe_path):
+            return None
+        
+        cmd = [
+            ffprobe_path,
+            "-v", "error",
+            "-print_format", "json",
+            "-show_format",
+            "-show_streams",
+            filepath
+        ]
+        
+        try:
+            result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=30)
+            if result.returncode != 0:
+                return None
+            data = json.loads(result.stdout)
+        except (OSError, subprocess.SubprocessError, ValueError):
+            return None
+        
+        return self.parse_ffprobe(data)
+    
+    @staticmethod
+    def parse_rate(value):
+        try:
+            num, _, den = value.partition("/")
+            return float(num) / float(den or 1)
+        except (ValueError, ZeroDivisionError, AttributeError):
+            return None
+    
+    @staticmethod
+    def parse_number(value, cast=float):
+        try:
+            return cast(value)
+        except (TypeError, ValueError):
+            return None
+    
+    def parse_ffprobe(self, data):
+        fmt = data.get("format", {})
+        info = {
+            "format_name": fmt.get("format_name", ""),
+            "duration": self.parse_number(fmt.get("duration")),
+            "bit_rate": self.parse_number(fmt.get("bit_rate"), int),
+            "video": None,
+            "audio": [],
+            "subtitles": [],
+            "streams": len(data.get("streams", []))
+        }
+        
+        for stream in data.get("streams", []):
+            codec_type = stream.get("codec_type")
+            if codec_type == "video" and info["video"] is None:
+                # Cover art is exposed as a single-frame video stream
+                if stream.get("disposition", {}).get("attached_pic"):
+                    continue
+                fps = self.parse_rate(stream.get("avg_frame_rate")) or self.parse_rate(stream.get("r_frame_rate"))
+                info["video"] = {
+                    "index": stream.get("index"),
+                    "codec": stream.get("codec_name", ""),
+                    "profile": stream.get("profile", ""),
+                    "pix_fmt": stream.get("pix_fmt", ""),
+                    "width": stream.get("width"),
+                    "height": stream.get("height"),
+                    "fps": fps,
+                    "bit_rate": self.parse_number(stream.get("bit_rate"), int),
+                    "frame_count": self.parse_number(stream.get("nb_frames"), int),
+                    "duration": self.parse_number(stream.get("duration"))
+                }
+            elif codec_type == "audio":
+                info["audio"].append({
+                    "index": stream.get("index"),
+                    "codec": stream.get("codec_name", ""),
+                    "channels": stream.get("channels"),
+                    "sample_rate": self.parse_number(stream.get("sample_rate"), int),
+                    "bit_rate": self.parse_number(stream.get("bit_rate"), int)
+                })
+            elif codec_type == "subtitle":
+                info["subtitles"].append({
+                    "index": stream.get("index"),
+                    "codec": stream.get("codec_name", "")
+                })
+        
+        video = info["video"]
+        if info["duration"] is None and video:
+            info["duration"] = video["duration"]
+        if video and video["frame_count"] is None and video["fps"] and info["duration"]:
+            video["frame_count"] = int(info["duration"] * video["fps"])
+        
+        return info
+    
+    def run_ffmpeg_fallback(self, ffmpeg_path, filepath):
+        # Builds without ffprobe still print the duration in the ffmpeg banner
+        try:
+            result = subprocess.run([ffmpeg_path, "-i", filepath], stderr=subprocess.PIPE, text=True, timeout=30)
+        except (OSError, subprocess.SubprocessError):
+            return None
+        
+        duration_match = re.search(r'Duration: (\d{2}):(\d{2}):(\d{2}(?:\.\d+)?)', result.stderr)
+        if not duration_match:
+            return None
+        
+        hours, minutes, seconds = duration_match.groups()
+        return {
+            "format_name": "",
+            "duration": int(hours) * 3600 + int(minutes) * 60 + float(seconds),
+            "bit_rate": None,
+            "video": None,
+            "audio": [],
+            "subtitles": [],
+            "streams": 0
+        }
+
+
+FINGERPRINT_SAMPLE_SIZE = 1024 * 1024
+
+
+def fingerprint_file(filepath, sample_size=FINGERPRINT_SAMPLE_SIZE):
+    # Size plus head/middle/tail samples: cheap even on network shares, and
+    # stable across renames and copies of the same recording
+    size = os.path.getsize(filepath)
+    digest = hashlib.sha1(str(size).encode())
+    
+    with open(filepath, "rb") as f:
+        if size <= sample_size * 3:
+            digest.update(f.read())
+        else:
+            for offset in (0, size // 2 - sample_size // 2, size - sample_size):
+                f.seek(offset)
+                digest.update(f.read(sample_size))
+    
+    return f"{size}-{digest.hexdigest()}"
+
+
+def fingerprint_is_exact(fingerprint):
+    # Small files are hashed whole, so equal fingerprints already mean equal bytes
+    return int(fingerprint.split("-")[0]) <= FINGERPRINT_SAMPLE_SIZE * 3
+
+
+def hash_file(filepath, chunk_size=FINGERPRINT_SAMPLE_SIZE):
+    digest = hashlib.sha1()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DuplicateGroup:
+    def __init__(self, path):
+        self.path = path
+        self.done = threading.Event()
+        # The representative's output once it was encoded or found complete
+        self.output = None
+
+
+class DuplicateTracker:
+    # Groups one run's inputs by fingerprint so each recording is encoded once.
+    # Sampled fingerprints can't see edits between their samples, so a large
+    # file only joins a group once a full hash agrees with the representative
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.groups = {}
+        self.hashes = {}
+    
+    def full_hash(self, path):
+        with self.lock:
+            digest = self.hashes.get(path)
+        if digest is None:
+            digest = hash_file(path)
+            with self.lock:
+                self.hashes[path] = digest
+        return digest
+    
+    def same_content(self, path, other, fingerprint):
+        if fingerprint_is_exact(fingerprint):
+            return True
+        try:
+            return self.full_hash(path) == self.full_hash(other)
+        except OSError:
+            return False
+    
+    def claim(self, fingerprint, path):
+        # Returns (group, True) if path should be encoded, or (group, False) if
+        # it should wait for that group's output. Hashing happens outside the
+        # lock, so groups added meanwhile are checked before opening a new one
+        checked = 0
+        while True:
+            with self.lock:
+                groups = self.groups.setdefault(fingerprint, [])
+                if checked == len(groups):
+                    group = DuplicateGroup(path)
+                    groups.append(group)
+                    return group, True
+                pending = groups[checked:]
+            for group in pending:
+                checked += 1
+                # Groups whose representative failed take no new members
+                if group.done.is_set() and group.output is None:
+                    continue
+                if self.same_content(group.path, path, fingerprint):
+                    return group, False
+    
+    def resolve(self, group, output):
+        group.output = output
+        group.done.set()
+
+
+def link_or_copy(source, destination):
+    # Hard link when the filesystem allows it, a copy across devices; either
+    # way the output only appears under its real name once it is whole
+    partial = partial_output_path(destination)
+    remove_partial_output(partial)
+    try:
+        os.link(source, partial)
+    except OSError:
+        shutil.copyfile(source, partial)
+    os.replace(partial, destination)
+
+
+class BatchIndex:
+    FILENAME = ".compress_index.sqlite"
+    
+    def __init__(self, output_folder):
+        self.path = os.path.join(output_folder, self.FILENAME)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS probes (
+                    fingerprint TEXT PRIMARY KEY,
+                    probe_json TEXT NOT NULL
+                )""")
+            # Identical inputs under different names share a fingerprint, so the
+            # output path is part of the key and each output keeps its own row
+            columns = self.conn.execute("PRAGMA table_info(encodes)").fetchall()
+            if columns and "output_path" not in [column[1] for column in columns if column[5]]:
+                self.conn.execute("ALTER TABLE encodes RENAME TO encodes_old")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS encodes (
+                    fingerprint TEXT NOT NULL,
+                    settings_key TEXT NOT NULL,
+                    input_path TEXT NOT NULL,
+                    output_path TEXT NOT NULL,
+                    output_size INTEGER,
+                    encode_seconds REAL,
+                    success INTEGER NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (fingerprint, settings_key, output_path)
+                )""")
+            if columns and self.conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'encodes_old'").fetchone():
+                self.conn.execute("INSERT OR REPLACE INTO encodes SELECT fingerprint, settings_key, input_path, "
+                                  "output_path, output_size, encode_seconds, success, updated_at FROM encodes_old")
+                self.conn.execute("DROP TABLE encodes_old")
+            # Encodes that were running when the process last stopped; a clean
+            # finish deletes the row, so anything left here crashed or was killed
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS in_flight (
+                    output_path TEXT PRIMARY KEY,
+                    partial_path TEXT NOT NULL,
+                    input_path TEXT NOT NULL,
+                    started_at REAL NOT NULL
+                )""")
+    
+    @staticmethod
+    def make_settings_key(settings):
+        return json.dumps(settings, sort_keys=True)
+    
+    def get_probe(self, fingerprint):
+        with self.lock:
+            row = self.conn.execute("SELECT probe_json FROM probes WHERE fingerprint = ?",
+                                    (fingerprint,)).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def save_probe(self, fingerprint, info):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO probes (fingerprint, probe_json) VALUES (?, ?)",
+                              (fingerprint, json.dumps(info)))
+    
+    def get_encodes(self, fingerprint, settings_key, output_path=None):
+        # Newest first; limited to one output when output_path is given
+        query = ("SELECT output_path, output_size, encode_seconds, success, input_path FROM encodes "
+                 "WHERE fingerprint = ? AND settings_key = ?")
+        params = [fingerprint, settings_key]
+        if output_path is not None:
+            query += " AND output_path = ?"
+            params.append(os.path.abspath(output_path))
+        with self.lock:
+            rows = self.conn.execute(query + " ORDER BY updated_at DESC", params).fetchall()
+        return [{"output_path": row[0], "output_size": row[1], "encode_seconds": row[2], "success": bool(row[3]),
+                 "input_path": row[4]} for row in rows]
+    
+    def get_encode(self, fingerprint, settings_key, output_path):
+        records = self.get_encodes(fingerprint, settings_key, output_path)
+        return records[0] if records else None
+    
+    def save_encode(self, fingerprint, settings_key, input_path, output_path, output_size, encode_seconds, success):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO encodes (fingerprint, settings_key, input_path, output_path, "
+                "output_size, encode_seconds, success, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (fingerprint, settings_key, os.path.abspath(input_path), os.path.abspath(output_path),
+                 output_size, encode_seconds, int(success), time.time()))
+    
+    def get_finished(self, fingerprint, settings_key, output_path=None):
+        # The newest successful encode for this input and settings whose output
+        # is still intact, optionally for one particular output
+        for record in self.get_encodes(fingerprint, settings_key, output_path):
+            if not record["success"]:
+                continue
+            try:
+                if os.path.getsize(record["output_path"]) == record["output_size"]:
+                    return record
+            except OSError:
+                continue
+        return None
+    
+    def is_finished(self, fingerprint, settings_key, output_path):
+        return self.get_finished(fingerprint, settings_key, output_path) is not None
+    
+    def begin_job(self, input_path, output_path, partial_path):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO in_flight (output_path, partial_path, input_path, started_at) "
+                "VALUES (?, ?, ?, ?)",
+                (output_path, partial_path, input_path, time.time()))
+    
+    def end_job(self, output_path):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM in_flight WHERE output_path = ?", (output_path,))
+    
+    def take_in_flight(self):
+        # Returns and clears the jobs a previous run never finished
+        with self.lock, self.conn:
+            rows = self.conn.execute("SELECT output_path, partial_path, input_path FROM in_flight").fetchall()
+            self.conn.execute("DELETE FROM in_flight")
+        return [{"output_path": row[0], "partial_path": row[1], "input_path": row[2]} for row in rows]
+    
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+VIDEO_EXTENSIONS = {".mp4", ".avi", ".mov", ".mkv", ".wmv", ".flv", ".webm", ".m4v"}
+
+VideoCandidate = namedtuple("VideoCandidate", "path rel_path size mtime")
+
+
+def scan_videos(root, skip_dirs=()):
+    # Depth-first os.scandir walk; DirEntry.stat() is free on Windows and one
+    # call elsewhere, so callers get size/mtime without touching the file again
+    skip = {os.path.normcase(os.path.realpath(path)) for path in skip_dirs if path}
+    pending = [root]
+    
+    while pending:
+        folder = pending.pop()
+        try:
+            with os.scandir(folder) as it:
+                entries = sorted(it, key=lambda entry: entry.name.lower())
+        except OSError:
+            continue
+        
+        subfolders = []
+        for entry in entries:
+            # Our own temp folders and index files all start with a dot
+            if entry.name.startswith("."):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if os.path.normcase(os.path.realpath(entry.path)) not in skip:
+                        subfolders.append(entry.path)
+                elif os.path.splitext(entry.name)[1].lower() in VIDEO_EXTENSIONS:
+                    stat = entry.stat()
+                    yield VideoCandidate(entry.path, os.path.relpath(entry.path, root), stat.st_size, stat.st_mtime)
+            except OSError:
+                continue
+        
+        # Reversed so the stack pops subfolders in name order
+        pending.extend(reversed(subfolders))
+
+
+class ProgressEvent(namedtuple("ProgressEvent", "frame fps out_time_us total_size bitrate speed done")):
+    __slots__ = ()
+    
+    @property
+    def out_time(self):
+        return self.out_time_us / 1000000
+
+
+def parse_progress_value(value, cast=float):
+    # ffmpeg reports "N/A" until the first packet has been muxed
+    try:
+        return cast(value.rstrip("x").replace("kbits/s", ""))
+    except ValueError:
+        return None
+
+
+def read_progress(stream):
+    # ffmpeg -progress writes key=value lines and closes each block with progress=continue/end
+    block = {}
+    last_out_time_us = 0
+    for line in stream:
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            continue
+        if key != "progress":
+            block[key] = value
+            continue
+        
+        out_time_us = parse_progress_value(block.get("out_time_us", "N/A"), int)
+        if out_time_us is None:
+            # Older builds only have out_time_ms, which is in microseconds as well
+            out_time_us = parse_progress_value(block.get("out_time_ms", "N/A"), int)
+        if out_time_us is not None and out_time_us >= 0:
+            last_out_time_us = out_time_us
+        
+        yield ProgressEvent(
+            frame=parse_progress_value(block.get("frame", "N/A"), int),
+            fps=parse_progress_value(block.get("fps", "N/A")),
+            out_time_us=last_out_time_us,
+            total_size=parse_progress_value(block.get("total_size", "N/A"), int),
+            bitrate=parse_progress_value(block.get("bitrate", "N/A")),
+            speed=parse_progress_value(block.get("speed", "N/A")),
+            done=value == "end"
+        )
+        block = {}
+
+
+def with_progress_pipe(cmd):
+    return [cmd[0], "-progress", "pipe:1", "-nostats"] + cmd[1:]
+
+
+def drain_stderr(process, tail):
+    for line in process.stderr:
+        tail.append(line.rstrip())
+
+
+class EncoderBackend:
+    name = ""
+    label = ""
+    # Codec name as ffprobe reports it, for container compatibility checks
+    codec = ""
+    # The app's presets are x264 speed names; each backend maps them to its own scale
+    speed_map = {}
+    supports_two_pass = True
+    
+    def map_crf(self, crf):
+        return crf
+    
+    def video_args(self, settings, threads=None, bitrate_kbps=None, pass_number=None, passlog=None):
+        raise NotImplementedError
+    
+    def container_args(self, container):
+        # Output options that depend on the container being written
+        return []
+    
+    def passlog_files(self, passlog):
+        return [f"{passlog}-0.log"]
+
+
+class X264Backend(EncoderBackend):
+    name = "libx264"
+    codec = "h264"
+    label = "H.264 (libx264)"
+    speed_map = {"faster": "faster", "fast": "fast", "medium": "medium", "slow": "slow"}
+    
+    def video_args(self, settings, threads=None, bitrate_kbps=None, pass_number=None, passlog=None):
+        args = ["-c:v", "libx264", "-preset", self.speed_map[settings["preset"]]]
+        if bitrate_kbps:
+            args += ["-b:v", f"{bitrate_kbps}k"]
+        else:
+            args += ["-crf", str(self.map_crf(settings["crf"]))]
+        if pass_number:
+            # x264 already drops the expensive analysis in pass 1 unless --slow-firstpass is set
+            args += ["-pass", str(pass_number), "-passlogfile", passlog]
+        if threads:
+            args += ["-threads", str(threads)]
+        return args
+    
+    def passlog_files(self, passlog):
+        return [f"{passlog}-0.log", f"{passlog}-0.log.mbtree"]
+
+
+class X265Backend(EncoderBackend):
+    name = "libx265"
+    codec = "hevc"
+    label = "H.265 (libx265)"
+    speed_map = {"faster": "faster", "fast": "fast", "medium": "medium", "slow": "slow"}
+    
+    def map_crf(self, crf):
+        # x265 CRF 28 looks roughly like x264 CRF 23
+        return min(crf + 5, 51)
+    
+    def video_args(self, settings, threads=None, bitrate_kbps=None, pass_number=None, passlog=None):
+        args = ["-c:v", "libx265", "-preset", self.speed_map[settings["preset"]]]
+        if bitrate_kbps:
+            args += ["-b:v", f"{bitrate_kbps}k"]
+        else:
+            args += ["-crf", str(self.map_crf(settings["crf"]))]
+        
+        params = ["log-level=error"]
+        if threads:
+            params.append(f"pools={threads}")
+        if pass_number:
+            # Unlike x264, x265 runs a full-cost first pass unless told otherwise
+            params += [f"pass={pass_number}", f"stats={passlog}.log", "slow-firstpass=0"]
+        return args + ["-x265-params", ":".join(params)]
+    
+    def passlog_files(self, passlog):
+        return [f"{passlog}.log", f"{passlog}.log.cutree"]
+    
+    def container_args(self, container):
+        # Apple players only recognise HEVC in MP4/MOV under the hvc1 tag,
+        # and the Matroska muxer refuses that tag outright
+        if container in ("mp4", "m4v", "mov"):
+            return ["-tag:v", "hvc1"]
+        return []
+
+
+class SvtAv1Backend(EncoderBackend):
+    name = "libsvtav1"
+    codec = "av1"
+    label = "AV1 (SVT-AV1)"
+    speed_map = {"faster": "10", "fast": "8", "medium": "6", "slow": "4"}
+    # FFmpeg's SVT-AV1 wrapper has no -pass support; target sizes use one-pass VBR
+    supports_two_pass = False
+    
+    def map_crf(self, crf):
+        return min(round(crf * 1.5), 63)
+    
+    def video_args(self, settings, threads=None, bitrate_kbps=None, pass_number=None, passlog=None):
+        args = ["-c:v", "libsvtav1", "-preset", self.speed_map[settings["preset"]]]
+        if bitrate_kbps:
+            args += ["-b:v", f"{bitrate_kbps}k"]
+        else:
+            args += ["-crf", str(self.map_crf(settings["crf"]))]
+        if threads:
+            args += ["-svtav1-params", f"lp={threads}"]
+        return args
+
+
+class Vp9Backend(EncoderBackend):
+    name = "libvpx-vp9"
+    codec = "vp9"
+    label = "VP9 (libvpx)"
+    speed_map = {"faster": "4", "fast": "3", "medium": "2", "slow": "1"}
+    
+    def map_crf(self, crf):
+        return min(crf + 10, 63)
+    
+    def video_args(self, settings, threads=None, bitrate_kbps=None, pass_number=None, passlog=None):
+        speed = self.speed_map[settings["preset"]]
+        if pass_number == 1:
+            # Pass 1 only gathers statistics, so use the fastest analysis speed
+            speed = "4"
+        
+        args = ["-c:v", "libvpx-vp9"]
+        if bitrate_kbps:
+            args += ["-b:v", f"{bitrate_kbps}k"]
+        else:
+            # -b:v 0 switches libvpx into constant-quality mode
+            args += ["-crf", str(self.map_crf(settings["crf"])), "-b:v", "0"]
+        args += ["-deadline", "good", "-cpu-used", speed, "-row-mt", "1"]
+        if pass_number:
+            args += ["-pass", str(pass_number), "-passlogfile", passlog]
+        if threads:
+            args += ["-threads", str(threads)]
+        return args
+
+
+ENCODER_BACKENDS = {backend.name: backend for backend in
+                    (X264Backend(), X265Backend(), SvtAv1Backend(), Vp9Backend())}
+DEFAULT_CODEC = "libx264"
+# Settings may name this instead of a backend; each file then gets the fastest
+# measured backend that fits, see CompressionEngine.resolve_codec
+AUTO_CODEC = "auto"
+AUTO_CODEC_LABEL = "Auto (fastest that fits)"
+
+AUDIO_BITRATE_KBPS = 128
+# Smart audio aims for this per channel, so stereo keeps the old 128k and 5.1
+# gets room to breathe without going past AUDIO_MAX_KBPS
+AUDIO_KBPS_PER_CHANNEL = 64
+AUDIO_MAX_KBPS = 320
+AUDIO_MIN_KBPS = 32
+# Sources within this much of the target are copied rather than re-encoded
+AUDIO_COPY_SLACK = 1.1
+# Lossy codecs whose streams often carry no bit_rate tag (MKV) but are never
+# big enough to be worth a generation loss
+AUDIO_SMALL_CODECS = {"aac", "mp3", "opus", "vorbis"}
+LOSSLESS_AUDIO_CODECS = {"flac", "alac", "truehd", "mlp"}
+AUDIO_MODES = {"auto": "Smart (copy if possible)", "aac": "Always AAC 128k", "none": "Remove audio"}
+# Room for container overhead so the muxed file still lands under the target
+CONTAINER_OVERHEAD = 0.02
+MIN_VIDEO_BITRATE_KBPS = 50
+
+
+def compute_video_bitrate(target_mb, duration, audio_kbps=AUDIO_BITRATE_KBPS):
+    total_kbps = target_mb * 1024 * 1024 * 8 / 1000 / duration
+    video_kbps = int(total_kbps * (1 - CONTAINER_OVERHEAD) - audio_kbps)
+    if video_kbps < MIN_VIDEO_BITRATE_KBPS:
+        raise ValueError(f"Target size of {target_mb:g} MB is too small for a {duration:.0f} s video")
+    return video_kbps
+
+
+# Optional downscale/decimate stage. Bicubic keeps the scaler well ahead of the
+# encoder even from 4K, where the default high-quality scalers can fall behind
+SCALE_FLAGS = "bicubic"
+MAX_HEIGHT_CHOICES = (2160, 1440, 1080, 720, 480)
+MAX_FPS_CHOICES = (60, 30, 24)
+
+
+def build_video_filters(settings, info=None):
+    # Returns (filters, extra output args); probe info lets no-op filters be skipped
+    video = info["video"] if info else None
+    filters = []
+    extra_args = []
+    
+    # Without a probed rate, fps= could just as well duplicate frames up to the cap
+    max_fps = settings.get("max_fps")
+    if max_fps and video and video["fps"] and video["fps"] > max_fps + 0.01:
+        filters.append(f"fps={max_fps}")
+    
+    max_height = settings.get("max_height")
+    if max_height:
+        if not video or not video["height"]:
+            filters.append(f"scale=-2:'min(ih,{max_height})':flags={SCALE_FLAGS}")
+        elif video["height"] > max_height:
+            filters.append(f"scale=-2:{max_height}:flags={SCALE_FLAGS}")
+    
+    # Static screen captures repeat frames for seconds at a time; dropping them
+    # needs variable frame rate output or the muxer pads them straight back in
+    if settings.get("drop_duplicates"):
+        filters.append("mpdecimate")
+        extra_args += ["-fps_mode", "vfr"]
+    
+    return filters, extra_args
+
+
+def build_encode_command(ffmpeg_path, input_file, output_file, settings, threads=None, audio=True, faststart=True,
+                         bitrate_kbps=None, pass_number=None, passlog=None, info=None):
+    backend = ENCODER_BACKENDS[settings["codec"]]
+    cmd = [ffmpeg_path, "-i", input_file] + backend.video_args(settings, threads, bitrate_kbps, pass_number, passlog)
+    filters, extra_args = build_video_filters(settings, info)
+    if filters:
+        cmd += ["-vf", ",".join(filters)] + extra_args
+    if pass_number == 1:
+        # Pass 1 output is thrown away; only the stats file matters
+        return cmd + ["-an", "-f", "null", "-y", os.devnull]
+    if audio:
+        audio_args, _ = plan_audio(settings, info, output_file)
+        if "-map" in audio_args:
+            # Explicit audio maps switch off ffmpeg's default stream picks,
+            # so subtitles have to be mapped by hand too
+            cmd += ["-map", f"0:{info['video']['index']}" if info["video"] else "0:v:0"]
+            cmd += audio_args + plan_subtitles(info, get_container(output_file))[0]
+        else:
+            cmd += audio_args
+    else:
+        cmd += ["-an"]
+    cmd += backend.container_args(get_container(output_file))
+    if faststart:
+        cmd += ["-movflags", "+faststart"]
+    cmd += ["-y", output_file]
+    return cmd
+
+
+# CRF prediction encodes a few short samples instead of the whole file
+PREDICT_SAMPLES = 5
+PREDICT_SAMPLE_SECONDS = 4
+PREDICT_MIN_SAMPLE_SECONDS = 2
+PREDICT_SAMPLE_FRACTION = 0.02
+PREDICT_SECONDS_PER_SAMPLE = 60
+PREDICT_CRF_VALUES = (18, 20, 23, 26, 28, 30)
+TARGET_VMAF = 93.0
+TARGET_SSIM = 0.985
+
+
+def parse_metric_score(output):
+    vmaf_match = re.search(r'VMAF score[:=]\s*([\d.]+)', output)
+    if vmaf_match:
+        return float(vmaf_match.group(1))
+    ssim_match = re.search(r'SSIM .*All:([\d.]+)', output)
+    if ssim_match:
+        return float(ssim_match.group(1))
+    return None
+
+
+def get_sample_starts(duration, samples=PREDICT_SAMPLES, sample_seconds=PREDICT_SAMPLE_SECONDS):
+    if duration <= samples * sample_seconds:
+        return [0.0]
+    # Centre each sample in an equal slice so intros and credits don't dominate
+    return [duration * (i + 0.5) / samples - sample_seconds / 2 for i in range(samples)]
+
+
+def get_sample_plan(duration):
+    # Returns (starts, sample_seconds); one sample per minute of source, and samples
+    # shrink with the duration, so a short clip costs a fraction of a full encode
+    samples = max(1, min(PREDICT_SAMPLES, int(duration // PREDICT_SECONDS_PER_SAMPLE)))
+    sample_seconds = min(PREDICT_SAMPLE_SECONDS, max(PREDICT_MIN_SAMPLE_SECONDS, duration * PREDICT_SAMPLE_FRACTION))
+    if duration <= sample_seconds:
+        return [0.0], duration
+    if samples == 1:
+        return [(duration - sample_seconds) / 2], sample_seconds
+    return get_sample_starts(duration, samples, sample_seconds), sample_seconds
+
+
+def summarize_predictions(results, duration, audio_kbps):
+    # results are (crf, sample_bytes, sample_seconds, score) rows; scales each CRF up to the whole file
+    predictions = []
+    for crf in sorted({row[0] for row in results}):
+        rows = [row for row in results if row[0] == crf]
+        video_bytes_per_second = sum(row[1] for row in rows) / sum(row[2] for row in rows)
+        audio_bytes = audio_kbps * 1000 / 8 * duration
+        size_mb = (video_bytes_per_second * duration + audio_bytes) / (1024 * 1024)
+        scores = [row[3] for row in rows if row[3] is not None]
+        predictions.append((crf, size_mb, sum(scores) / len(scores) if scores else None))
+    return predictions
+
+
+def choose_prediction(predictions, target_mb=None, threshold=None):
+    # Returns (choice, met)
+    if target_mb:
+        # Best quality that still fits, otherwise the smallest we tried
+        fitting = [row for row in predictions if row[1] <= target_mb]
+        return (min(fitting) if fitting else max(predictions)), bool(fitting)
+    # Cheapest CRF whose samples still reach the quality target
+    passing = [row for row in predictions if row[2] is not None and row[2] >= threshold]
+    return (max(passing) if passing else min(predictions)), bool(passing)
+
+
+# Codecs each target container can hold as-is; None means anything goes
+CONTAINER_CODECS = {
+    "mp4": {"video": {"h264", "hevc", "mpeg4", "av1", "vp9", "mpeg2video", "mjpeg"},
+            "audio": {"aac", "mp3", "ac3", "eac3", "opus", "flac", "alac"},
+            "subtitle": {"mov_text"}},
+    "m4v": {"video": {"h264", "hevc", "mpeg4"},
+            "audio": {"aac", "ac3", "alac"},
+            "subtitle": {"mov_text"}},
+    "mov": {"video": {"h264", "hevc", "mpeg4", "prores", "mjpeg", "mpeg2video"},
+            "audio": {"aac", "mp3", "ac3", "alac", "pcm_s16le", "pcm_s24le"},
+            "subtitle": {"mov_text"}},
+    "mkv": {"video": None, "audio": None,
+            "subtitle": {"subrip", "ass", "ssa", "webvtt", "hdmv_pgs_subtitle", "dvd_subtitle", "dvb_subtitle"}},
+    "webm": {"video": {"vp8", "vp9", "av1"},
+             "audio": {"opus", "vorbis"},
+             "subtitle": {"webvtt"}},
+    "avi": {"video": {"h264", "mpeg4", "mjpeg", "msmpeg4v3", "mpeg2video"},
+            "audio": {"mp3", "ac3", "pcm_s16le"},
+            "subtitle": set()},
+    "flv": {"video": {"h264", "flv1"},
+            "audio": {"aac", "mp3"},
+            "subtitle": set()},
+    "wmv": {"video": {"wmv1", "wmv2", "wmv3", "vc1"},
+            "audio": {"wmav1", "wmav2"},
+            "subtitle": set()}
+}
+
+# Text subtitles can be converted to whatever text format the container takes;
+# bitmap ones (PGS, DVD) can only be copied
+TEXT_SUBTITLE_CODECS = {"subrip", "ass", "ssa", "webvtt", "mov_text", "text"}
+SUBTITLE_ENCODERS = {"mp4": "mov_text", "m4v": "mov_text", "mov": "mov_text", "mkv": "srt", "webm": "webvtt"}
+
+# Encoders used when a stream has to be re-encoded for the target container
+CONTAINER_ENCODERS = {
+    "mp4": (["-c:v", "libx264"], ["-c:a", "aac"]),
+    "m4v": (["-c:v", "libx264"], ["-c:a", "aac"]),
+    "mov": (["-c:v", "libx264"], ["-c:a", "aac"]),
+    "mkv": (["-c:v", "libx264"], ["-c:a", "aac"]),
+    "webm": (["-c:v", "libvpx-vp9", "-b:v", "0", "-crf", "33", "-row-mt", "1"], ["-c:a", "libopus"]),
+    "avi": (["-c:v", "libx264"], ["-c:a", "libmp3lame"]),
+    "flv": (["-c:v", "libx264"], ["-c:a", "aac"]),
+    "wmv": (["-c:v", "wmv2", "-q:v", "3"], ["-c:a", "wmav2"])
+}
+
+
+def container_accepts(to_fmt, kind, codec):
+    allowed = CONTAINER_CODECS.get(to_fmt, {}).get(kind, set())
+    return allowed is None or codec in allowed
+
+
+def plan_subtitles(info, container, input_index=0):
+    # Returns (ffmpeg args, dropped codecs) for carrying every subtitle track into container
+    args = []
+    dropped = []
+    out_index = 0
+    for track in info["subtitles"] if info else []:
+        if container_accepts(container, "subtitle", track["codec"]):
+            codec = "copy"
+        elif track["codec"] in TEXT_SUBTITLE_CODECS and container in SUBTITLE_ENCODERS:
+            codec = SUBTITLE_ENCODERS[container]
+        else:
+            dropped.append(track["codec"] or "unknown")
+            continue
+        args += ["-map", f"{input_index}:{track['index']}", f"-c:s:{out_index}", codec]
+        out_index += 1
+    return args, dropped
+
+
+def describe_dropped_subtitles(dropped, container):
+    if not dropped:
+        return None
+    tracks = "subtitle track" if len(dropped) == 1 else f"{len(dropped)} subtitle tracks"
+    return f"{tracks} dropped ({', '.join(sorted(set(dropped)))} can't go in .{container})"
+
+
+def plan_conversion(info, to_fmt):
+    # Returns ffmpeg stream arguments plus a summary of what happens to each stream
+    video_encoder, audio_encoder = CONTAINER_ENCODERS[to_fmt]
+    args = []
+    actions = []
+    
+    if not info["video"] and not info["audio"]:
+        # Without stream details (no ffprobe) the only safe choice is a full re-encode
+        return video_encoder + audio_encoder, "streams re-encoded"
+    
+    video = info["video"]
+    if video:
+        args += ["-map", f"0:{video['index']}"]
+        if container_accepts(to_fmt, "video", video["codec"]):
+            args += ["-c:v", "copy"]
+            if video["codec"] == "hevc" and to_fmt in ("mp4", "m4v", "mov"):
+                # Apple players only recognise HEVC in MP4/MOV under the hvc1 tag
+                args += ["-tag:v", "hvc1"]
+            actions.append(f"video copied ({video['codec']})")
+        else:
+            args += video_encoder
+            actions.append(f"video re-encoded ({video['codec']} → {video_encoder[1]})")
+    
+    for out_index, audio in enumerate(info["audio"]):
+        # Every track is kept; numbering them only matters once there's more than one
+        name = f"audio {out_index + 1}" if len(info["audio"]) > 1 else "audio"
+        args += ["-map", f"0:{audio['index']}"]
+        if container_accepts(to_fmt, "audio", audio["codec"]):
+            args += [f"-c:a:{out_index}", "copy"]
+            actions.append(f"{name} copied ({audio['codec']})")
+        else:
+            args += [f"-c:a:{out_index}"] + audio_encoder[1:]
+            actions.append(f"{name} re-encoded ({audio['codec']} → {audio_encoder[1]})")
+    
+    subtitle_args, dropped = plan_subtitles(info, to_fmt)
+    args += subtitle_args
+    if subtitle_args:
+        actions.append("subtitles kept")
+    if dropped:
+        actions.append(describe_dropped_subtitles(dropped, to_fmt))
+    
+    if to_fmt in ("mp4", "m4v", "mov"):
+        args += ["-movflags", "+faststart"]
+    
+    return args, ", ".join(actions)
+
+
+def get_container(path):
+    return os.path.splitext(path)[1].lstrip(".").lower()
+
+
+def check_output_container(settings, output_file):
+    # Returns an error message when the output container can't hold the chosen
+    # codec; containers the table doesn't know are left for ffmpeg to judge
+    container = get_container(output_file)
+    backend = ENCODER_BACKENDS[settings["codec"]]
+    if container not in CONTAINER_CODECS or container_accepts(container, "video", backend.codec):
+        return None
+    choices = [f".{name}" for name in CONTAINER_CODECS if container_accepts(name, "video", backend.codec)]
+    return f"{backend.label} video can't be stored in .{container}; save as {', '.join(choices)} instead"
+
+
+def batch_output_extension(settings, input_file):
+    # Batch outputs keep the source's container unless it can't hold the chosen
+    # codec, in which case they become MKV, which holds anything
+    return ".mkv" if check_output_container(settings, input_file) else None
+
+
+def plan_audio(settings, info, output_file):
+    # Returns (ffmpeg audio args, expected audio kbps). Compatible streams at or
+    # under the target are copied; everything else is encoded at a bitrate that
+    # never exceeds what the source had to begin with
+    mode = settings.get("audio_mode", "auto")
+    if mode == "none":
+        return ["-an"], 0
+    if not info or (not info["video"] and not info["audio"]) or mode == "aac":
+        # Without stream details (no ffprobe) keep the old fixed re-encode
+        return ["-c:a", "aac", "-b:a", f"{AUDIO_BITRATE_KBPS}k"], AUDIO_BITRATE_KBPS
+    if not info["audio"]:
+        return ["-an"], 0
+    
+    container = get_container(output_file)
+    audio_encoder = CONTAINER_ENCODERS.get(container, (None, ["-c:a", "aac"]))[1][1]
+    tracks = info["audio"] if settings.get("all_audio_tracks") else info["audio"][:1]
+    args = []
+    total_kbps = 0
+    for out_index, track in enumerate(tracks):
+        args += ["-map", f"0:{track['index']}"]
+        channels = track["channels"] or 2
+        downmix = settings.get("downmix") and channels > 2
+        target_kbps = min(AUDIO_KBPS_PER_CHANNEL * (2 if downmix else channels), AUDIO_MAX_KBPS)
+        source_kbps = track["bit_rate"] / 1000 if track["bit_rate"] else None
+        
+        if not downmix and container_accepts(container, "audio", track["codec"]):
+            if source_kbps and track["codec"] not in LOSSLESS_AUDIO_CODECS:
+                copy = source_kbps <= target_kbps * AUDIO_COPY_SLACK
+            else:
+                copy = source_kbps is None and track["codec"] in AUDIO_SMALL_CODECS
+            if copy:
+                args += [f"-c:a:{out_index}", "copy"]
+                total_kbps += source_kbps or target_kbps
+                continue
+        
+        kbps = target_kbps
+        if source_kbps and track["codec"] not in LOSSLESS_AUDIO_CODECS:
+            # Spending more bits than a lossy source had only re-encodes its artifacts
+            kbps = max(AUDIO_MIN_KBPS, min(kbps, int(source_kbps)))
+        args += [f"-c:a:{out_index}", audio_encoder, f"-b:a:{out_index}", f"{kbps}k"]
+        if downmix:
+            args += [f"-ac:a:{out_index}", "2"]
+        total_kbps += kbps
+    return args, total_kbps
+
+
+# x264 .mbtree files for long 1080p sources run to hundreds of MB, so the
+# pass-1 cache is pruned by source, by age and then least recently used
+PASSLOG_CACHE_MAX_BYTES = 4 * 1024 * 1024 * 1024
+PASSLOG_CACHE_MAX_AGE = 30 * 24 * 3600
+PASSLOG_ENTRY_RE = re.compile(r"(.+?)(?:\.partial)?(?:-0\.log|\.log|\.source)")
+
+
+class PassLogCache:
+    def __init__(self, folder=None, max_bytes=PASSLOG_CACHE_MAX_BYTES, max_age=PASSLOG_CACHE_MAX_AGE):
+        self.folder = folder or os.path.join(os.path.expanduser("~"), ".video_compressor", "passlogs")
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.lock = threading.Lock()
+    
+    def get_prefix(self, fingerprint, settings):
+        # Pass 1 stats don't depend on the bitrate, so any target size can reuse them,
+        # but they do depend on which frames and what resolution reach the encoder
+        name = f"{fingerprint}_{settings['codec']}_{settings['preset']}"
+        if settings.get("max_height"):
+            name += f"_h{settings['max_height']}"
+        if settings.get("max_fps"):
+            name += f"_f{settings['max_fps']}"
+        if settings.get("drop_duplicates"):
+            name += "_dd"
+        return os.path.join(self.folder, name)
+    
+    def has_stats(self, backend, prefix):
+        if not all(os.path.exists(path) for path in backend.passlog_files(prefix)):
+            return False
+        # A hit counts as a use, so pruning evicts the stats nobody re-targets
+        for path in backend.passlog_files(prefix):
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        return True
+    
+    def commit(self, backend, partial_prefix, prefix, source_path):
+        for partial, final in zip(backend.passlog_files(partial_prefix), backend.passlog_files(prefix)):
+            if os.path.exists(partial):
+                os.replace(partial, final)
+        # Entries are named by fingerprint, so the source path is kept beside them for pruning
+        with open(f"{prefix}.source", "w", encoding="utf-8") as f:
+            f.write(os.path.abspath(source_path))
+        self.prune(keep=prefix)
+    
+    def prune(self, keep=None):
+        # Drops entries whose source is gone or that went unused for max_age, then
+        # the least recently used until the folder fits max_bytes. Entries with a
+        # pass 1 still running are left alone unless they are stale
+        with self.lock:
+            try:
+                names = os.listdir(self.folder)
+            except OSError:
+                return
+            
+            entries = {}
+            for name in names:
+                match = PASSLOG_ENTRY_RE.match(name)
+                path = os.path.join(self.folder, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entry = entries.setdefault(os.path.join(self.folder, match.group(1) if match else name),
+                                           {"files": [], "bytes": 0, "used": 0, "running": False})
+                entry["files"].append(path)
+                entry["bytes"] += stat.st_size
+                entry["used"] = max(entry["used"], stat.st_mtime)
+                entry["running"] = entry["running"] or ".partial" in name
+            
+            now = time.time()
+            kept = []
+            for prefix, entry in entries.items():
+                stale = now - entry["used"] > self.max_age
+                if prefix != keep and (stale or (not entry["running"] and not self.source_exists(prefix))):
+                    self.remove_files(entry["files"])
+                else:
+                    kept.append((entry["used"], prefix, entry))
+            
+            total = sum(entry["bytes"] for _, _, entry in kept)
+            for _, prefix, entry in sorted(kept):
+                if total <= self.max_bytes:
+                    break
+                if prefix == keep or entry["running"]:
+                    continue
+                self.remove_files(entry["files"])
+                total -= entry["bytes"]
+    
+    @staticmethod
+    def source_exists(prefix):
+        # Entries from before sources were recorded are left to the age and size limits
+        try:
+            with open(f"{prefix}.source", encoding="utf-8") as f:
+                return os.path.exists(f.read().strip())
+        except OSError:
+            return True
+    
+    @staticmethod
+    def remove_files(paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    
+    def discard(self, backend, prefix):
+        for path in backend.passlog_files(prefix):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class EncoderStats:
+    def __init__(self, path=None):
+        self.path = path or os.path.join(os.path.expanduser("~"), ".video_compressor", "encoder_stats.json")
+        self.lock = threading.Lock()
+        self.stats = {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.stats = json.load(f)
+        except (OSError, ValueError):
+            pass
+    
+    def record(self, backend_name, fps, input_bytes, output_bytes):
+        if not fps or not input_bytes or not output_bytes:
+            return
+        
+        with self.lock:
+            entry = self.stats.setdefault(backend_name, {"fps": 0.0, "ratio": 0.0, "samples": 0})
+            samples = entry["samples"]
+            entry["fps"] = (entry["fps"] * samples + fps) / (samples + 1)
+            entry["ratio"] = (entry["ratio"] * samples + output_bytes / input_bytes) / (samples + 1)
+            entry["samples"] = samples + 1
+            self.save()
+    
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(self.stats, f, indent=2)
+        except OSError:
+            pass
+    
+    def get(self, backend_name):
+        with self.lock:
+            entry = self.stats.get(backend_name)
+            return dict(entry) if entry else None
+    
+    def pick_fastest(self, max_ratio):
+        # Fastest measured backend whose output lands at or under max_ratio of the source
+        with self.lock:
+            candidates = [(entry["fps"], name) for name, entry in self.stats.items()
+                          if name in ENCODER_BACKENDS and entry["samples"] and entry["ratio"] <= max_ratio]
+        if not candidates:
+            return None
+        return max(candidates)[1]
+    
+    def pick_smallest(self):
+        # Measured backend with the smallest output, for targets nothing meets
+        with self.lock:
+            candidates = [(entry["ratio"], name) for name, entry in self.stats.items()
+                          if name in ENCODER_BACKENDS and entry["samples"]]
+        if not candidates:
+            return None
+        return min(candidates)[1]
+
+# Encode speed depends mostly on frame size, so batch ETAs are kept per class
+RESOLUTION_CLASSES = ((2160, "2160p"), (1440, "1440p"), (1080, "1080p"), (720, "720p"), (0, "SD"))
+# The live batch summary walks the queue, so it is rebuilt at most this often
+SUMMARY_INTERVAL = 1.0
+
+
+def resolution_class(info):
+    height = info["video"]["height"] if info and info["video"] else None
+    if not height:
+        return None
+    # Cropped sources (1920x1036 and friends) still belong to their nominal class
+    return next(name for min_height, name in RESOLUTION_CLASSES if height >= min_height * 0.9)
+
+
+class BatchStats:
+    # Result records for one batch or watch run, plus the live aggregate built
+    # from them: size ratio, throughput and an ETA for what is still queued
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.records = []
+        # resolution class -> [source seconds, encode seconds] of finished encodes
+        self.speeds = {}
+        # rel_path -> (resolution class, duration) for jobs that are encoding now
+        self.running = {}
+    
+    def start_job(self, name, info):
+        with self.lock:
+            self.running[name] = (resolution_class(info), info["duration"] if info else None)
+    
+    def add(self, name, record):
+        with self.lock:
+            self.running.pop(name, None)
+            self.records.append(record)
+            if record["status"] == "success" and record["duration"] and record["encode_seconds"]:
+                totals = self.speeds.setdefault(record["resolution"], [0.0, 0.0])
+                totals[0] += record["duration"]
+                totals[1] += record["encode_seconds"]
+    
+    def speed_for(self, resolution):
+        # Source seconds per encode second; classes not seen yet use every class pooled
+        totals = self.speeds.get(resolution)
+        if not totals:
+            totals = [sum(entry[0] for entry in self.speeds.values()), sum(entry[1] for entry in self.speeds.values())]
+        return totals[0] / totals[1] if totals[1] > 0 else None
+    
+    def estimate_remaining(self, active, queued_sizes, workers):
+        # Queued files aren't probed yet, so their durations come from the
+        # bytes-per-second of the encodes seen so far
+        encoded = [record for record in self.records if record["status"] == "success" and record["duration"]]
+        encoded_bytes = sum(record["input_bytes"] for record in encoded)
+        seconds_per_byte = sum(record["duration"] for record in encoded) / encoded_bytes if encoded_bytes else None
+        
+        estimates = []
+        for name, percent in active.items():
+            resolution, duration = self.running.get(name, (None, None))
+            speed = self.speed_for(resolution)
+            if not duration or not speed:
+                return None
+            estimates.append(duration * (1 - percent / 100) / speed)
+        if queued_sizes:
+            speed = self.speed_for(None)
+            if not seconds_per_byte or not speed:
+                return None
+            estimates += [size * seconds_per_byte / speed for size in queued_sizes]
+        if not estimates:
+            return 0.0
+        # Jobs run side by side, but the batch can't finish before its longest job
+        return max(sum(estimates) / max(workers, 1), max(estimates))
+    
+    def summary(self, active=None, queued_sizes=(), workers=1):
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            sized = [record for record in self.records if record["input_bytes"] and record["output_bytes"]]
+            input_bytes = sum(record["input_bytes"] for record in sized)
+            output_bytes = sum(record["output_bytes"] for record in sized)
+            encoded = [record for record in self.records if record["status"] == "success"]
+            ratio = output_bytes / input_bytes if input_bytes else None
+            pending_bytes = sum(queued_sizes)
+            return {
+                "files": len(self.records),
+                "input_bytes": input_bytes,
+                "output_bytes": output_bytes,
+                "ratio": ratio,
+                # Whatever is still to come, shrunk by the ratio seen so far
+                "predicted_output_bytes": output_bytes + pending_bytes * ratio if ratio else None,
+                "mb_per_second": sum(record["input_bytes"] or 0 for record in encoded) / (1024 * 1024) / elapsed
+                if elapsed > 0 else None,
+                "source_seconds_per_second": sum(record["duration"] or 0 for record in encoded) / elapsed
+                if elapsed > 0 else None,
+                "eta": self.estimate_remaining(active or {}, queued_sizes, workers)
+            }
+
+
+class Tracer:
+    # Per-stage spans for one run, written as Chrome trace JSON (chrome://tracing
+    # or ui.perfetto.dev) with a plain-text summary next to it. Timestamps use
+    # perf_counter, so callers can record spans that started before they knew
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.spans = []
+        self.threads = {}
+        self.async_ids = count(1)
+    
+    def now(self):
+        return time.perf_counter()
+    
+    def add_span(self, name, start, end, category="pipeline", overlapping=False, **args):
+        # Overlapping spans (queue waits that began while this thread was still
+        # busy) go out as async events, since per-thread spans must nest
+        thread = threading.current_thread()
+        with self.lock:
+            self.threads[thread.ident] = thread.name
+            self.spans.append((name, category, start, end, thread.ident,
+                               next(self.async_ids) if overlapping else None, args))
+    
+    @contextmanager
+    def span(self, name, category="pipeline", **args):
+        start = self.now()
+        try:
+            yield
+        finally:
+            self.add_span(name, start, self.now(), category, **args)
+    
+    def trace_events(self):
+        pid = os.getpid()
+        with self.lock:
+            events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                      for tid, name in self.threads.items()]
+            for name, category, start, end, tid, async_id, args in self.spans:
+                ts = round((start - self.started) * 1e6)
+                dur = round((end - start) * 1e6)
+                if async_id is None:
+                    events.append({"name": name, "cat": category, "ph": "X", "pid": pid, "tid": tid,
+                                   "ts": ts, "dur": dur, "args": args})
+                else:
+                    events.append({"name": name, "cat": category, "ph": "b", "id": async_id, "pid": pid, "tid": tid,
+                                   "ts": ts, "args": args})
+                    events.append({"name": name, "cat": category, "ph": "e", "id": async_id, "pid": pid, "tid": tid,
+                                   "ts": ts + dur})
+        return events
+    
+    def summary(self):
+        # [(stage, count, total seconds, mean ms, max ms)], biggest total first
+        stages = {}
+        with self.lock:
+            for name, category, start, end, _, _, _ in self.spans:
+                stage = stages.setdefault(f"{category}/{name}", [0, 0.0, 0.0])
+                stage[0] += 1
+                stage[1] += end - start
+                stage[2] = max(stage[2], end - start)
+        rows = [(stage, calls, total, total / calls * 1000, longest * 1000)
+                for stage, (calls, total, longest) in stages.items()]
+        return sorted(rows, key=lambda row: -row[2])
+    
+    def format_summary(self):
+        wall = self.now() - self.started
+        lines = [f"{'stage':<28} {'count':>6} {'total s':>9} {'mean ms':>9} {'max ms':>9} {'% wall':>7}"]
+        for stage, calls, total, mean, longest in self.summary():
+            # Spans overlap across threads, so the share of wall time can pass 100%
+            lines.append(f"{stage:<28} {calls:>6} {total:>9.2f} {mean:>9.1f} {longest:>9.1f} "
+                         f"{total / wall * 100 if wall else 0:>6.0f}%")
+        return "\n".join(lines)
+    
+    def write(self, path):
+        # Writes PATH and a .txt summary beside it; returns the summary path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": self.trace_events(), "displayTimeUnit": "ms"}, f)
+        summary_path = f"{os.path.splitext(path)[0]}.txt"
+        with open(summary_path, "w", encoding="utf-8") as f:
+            f.write(self.format_summary() + "\n")
+        return summary_path
+
+
+# Watch mode compresses a file once its size and mtime have held still this long
+WATCH_SETTLE_SECONDS = 3
+WATCH_POLL_INTERVAL = 2
+
+
+class InotifyWatcher:
+    # Linux only; the constructor raises OSError/AttributeError elsewhere so
+    # callers can fall back to PollingWatcher
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_CLOEXEC = 0o2000000
+    EVENT_HEADER = struct.Struct("iIII")
+    
+    def __init__(self, root, skip_dirs=()):
+        self.root = root
+        self.skip = {os.path.normcase(os.path.realpath(path)) for path in skip_dirs if path}
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}
+        self.add_tree(root)
+    
+    def is_skipped(self, path):
+        return os.path.basename(path).startswith(".") or \
+            os.path.normcase(os.path.realpath(path)) in self.skip
+    
+    def add_tree(self, folder):
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        for dirpath, dirnames, _ in os.walk(folder):
+            dirnames[:] = [name for name in dirnames if not self.is_skipped(os.path.join(dirpath, name))]
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dirpath), mask)
+            if wd >= 0:
+                self.watches[wd] = dirpath
+    
+    def read(self):
+        # Returns paths that were created, written or moved in since the last call
+        ready, _, _ = select.select([self.fd], [], [], 1)
+        if not ready:
+            return []
+        data = os.read(self.fd, 64 * 1024)
+        paths = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            
+            if mask & self.IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            folder = self.watches.get(wd)
+            if folder is None or not name:
+                continue
+            path = os.path.join(folder, name)
+            if not mask & self.IN_ISDIR:
+                paths.append(path)
+            elif mask & (self.IN_CREATE | self.IN_MOVED_TO) and not self.is_skipped(path):
+                # A folder moved in arrives with its files already inside
+                self.add_tree(path)
+                paths.extend(candidate.path for candidate in scan_videos(path))
+        return paths
+    
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    # Fallback for network shares and platforms without inotify
+    def __init__(self, root, skip_dirs=()):
+        self.root = root
+        self.skip_dirs = skip_dirs
+        self.seen = {}
+    
+    def read(self):
+        time.sleep(WATCH_POLL_INTERVAL)
+        changed = []
+        current = {}
+        for candidate in scan_videos(self.root, self.skip_dirs):
+            current[candidate.path] = (candidate.size, candidate.mtime)
+            if self.seen.get(candidate.path) != current[candidate.path]:
+                changed.append(candidate.path)
+        self.seen = current
+        return changed
+    
+    def close(self):
+        pass
+
+
+class WatchJournal:
+    # Append-only JSON lines in the output folder, replayed on start so a
+    # restart neither repeats finished files nor forgets queued ones
+    FILENAME = ".watch_journal.jsonl"
+    
+    def __init__(self, output_folder):
+        self.path = os.path.join(output_folder, self.FILENAME)
+        self.lock = threading.Lock()
+        self.queued = {}
+        self.done = {}
+        
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Torn last line from a crash
+                    signature = (record["size"], record["mtime"])
+                    if record["event"] == "queued":
+                        self.queued[record["path"]] = signature
+                    else:
+                        self.done[record["path"]] = signature
+                        self.queued.pop(record["path"], None)
+        
+        self.file = open(self.path, "a", encoding="utf-8")
+    
+    def is_done(self, path, size, mtime):
+        with self.lock:
+            return self.done.get(path) == (size, mtime)
+    
+    def pending(self):
+        with self.lock:
+            return list(self.queued)
+    
+    def record(self, event, path, size, mtime, status=None):
+        with self.lock:
+            if event == "queued":
+                self.queued[path] = (size, mtime)
+            else:
+                self.done[path] = (size, mtime)
+                self.queued.pop(path, None)
+            self.file.write(json.dumps({"event": event, "path": path, "size": size, "mtime": mtime,
+                                        "status": status, "time": time.time()}) + "\n")
+            self.file.flush()
+    
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+# Lower numbers run first; jobs with equal priority run in the order they were queued
+PRIORITY_URGENT = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+# Running encodes can only be frozen in place where the OS has SIGSTOP
+CAN_SUSPEND = hasattr(signal, "SIGSTOP")
+# How often idle queue workers recheck deferred jobs whose event was set elsewhere
+JOB_DEFER_POLL_INTERVAL = 1
+
+
+class JobDeferred(Exception):
+    # Raised by a job's run to go back in the queue until `event` is set,
+    # so the wait doesn't hold one of the queue's workers
+    def __init__(self, event):
+        super().__init__("Deferred")
+        self.event = event
+
+
+class Job:
+    def __init__(self, job_id, candidate, run, priority):
+        self.id = job_id
+        self.candidate = candidate
+        self.run = run
+        self.priority = priority
+        self.status = "queued"
+        self.paused = False
+        self.cancelled = False
+        self.processes = set()
+        # Worker address while the encode runs on a remote node, which can't be paused
+        self.remote = None
+        # Event a deferred job waits on before it is runnable again
+        self.blocked_on = None
+        self.result = None
+        self.done = threading.Event()
+        self.submitted = time.perf_counter()
+
+
+class JobQueue:
+    # Priority queue drained by a fixed pool of worker threads. runner(job)
+    # does the work and returns the result dict; everything else here is
+    # bookkeeping and signalling the job's ffmpeg processes
+    def __init__(self, workers, runner, on_dropped=None):
+        self.runner = runner
+        self.on_dropped = on_dropped
+        self.condition = threading.Condition()
+        self.jobs = {}
+        self.waiting = []
+        self.running = set()
+        self.limit = workers
+        self.ids = count(1)
+        self.closed = False
+        self.threads = [threading.Thread(target=self.work, daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+    
+    def submit(self, candidate, run, priority=PRIORITY_NORMAL):
+        with self.condition:
+            job = Job(next(self.ids), candidate, run, priority)
+            self.jobs[job.id] = job
+            self.waiting.append(job)
+            self.condition.notify()
+        return job
+    
+    def next_job(self):
+        if len(self.running) >= self.limit:
+            return None
+        runnable = [job for job in self.waiting
+                    if not job.paused and (job.blocked_on is None or job.blocked_on.is_set())]
+        return min(runnable, key=lambda job: (job.priority, job.id)) if runnable else None
+    
+    def work(self):
+        while True:
+            with self.condition:
+                job = self.next_job()
+                while job is None:
+                    if self.closed and not self.waiting:
+                        return
+                    blocked = any(job.blocked_on is not None for job in self.waiting)
+                    self.condition.wait(JOB_DEFER_POLL_INTERVAL if blocked else None)
+                    job = self.next_job()
+                self.waiting.remove(job)
+                self.running.add(job)
+                job.status = "running"
+                job.blocked_on = None
+            
+            try:
+                result = self.runner(job)
+            except JobDeferred as e:
+                self.defer(job, e.event)
+                continue
+            except Exception as e:
+                result = {"status": "failed", "input": job.candidate.path, "output": None, "error": str(e)}
+            self.finish(job, result)
+    
+    def finish(self, job, result):
+        with self.condition:
+            self.running.discard(job)
+            self.condition.notify_all()
+            job.result = result
+            job.status = result["status"]
+            job.processes.clear()
+            job.done.set()
+    
+    def defer(self, job, event):
+        # Keeps its id, so it runs ahead of later submissions once the event is set
+        with self.condition:
+            self.running.discard(job)
+            job.status = "queued"
+            job.blocked_on = event
+            job.processes.clear()
+            self.waiting.append(job)
+            self.condition.notify_all()
+    
+    def wait(self, job):
+        job.done.wait()
+        return job.result
+    
+    def set_limit(self, limit):
+        # Lowering the limit never stops running jobs; it only holds back new ones
+        with self.condition:
+            self.limit = max(1, min(limit, len(self.threads)))
+            self.condition.notify_all()
+    
+    def close(self):
+        # Workers exit once nothing is left waiting
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+    
+    def add_process(self, job, process):
+        with self.condition:
+            job.processes.add(process)
+            paused = job.paused
+        # A job paused between passes starts its next process frozen too
+        if paused and CAN_SUSPEND:
+            signal_processes([process], signal.SIGSTOP)
+    
+    def remove_process(self, job, process):
+        with self.condition:
+            job.processes.discard(process)
+    
+    def set_priority(self, job_id, priority):
+        with self.condition:
+            job = self.jobs.get(job_id)
+            if job is None or job.status != "queued":
+                return False
+            job.priority = priority
+            return True
+    
+    def set_remote(self, job, address):
+        # Refuses to hand a paused job to a remote worker, since it couldn't be held there
+        with self.condition:
+            if address and job.paused:
+                return False
+            job.remote = address
+            return True
+    
+    def pause(self, job_id):
+        # Queued jobs are held back; running ones are frozen with SIGSTOP
+        with self.condition:
+            job = self.jobs.get(job_id)
+            if job is None or job.paused or job.status not in ("queued", "running"):
+                return False
+            if job.status == "running" and (not CAN_SUSPEND or job.remote):
+                return False
+            job.paused = True
+            processes = list(job.processes)
+        if processes:
+            signal_processes(processes, signal.SIGSTOP)
+        return True
+    
+    def resume(self, job_id):
+        with self.condition:
+            job = self.jobs.get(job_id)
+            if job is None or not job.paused:
+                return False
+            job.paused = False
+            processes = list(job.processes)
+            self.condition.notify_all()
+        if processes and CAN_SUSPEND:
+            signal_processes(processes, signal.SIGCONT)
+        return True
+    
+    def cancel(self, job_id):
+        with self.condition:
+            job = self.jobs.get(job_id)
+            if job is None or job.status not in ("queued", "running"):
+                return False
+            job.cancelled = True
+            if job.status == "queued":
+                self.waiting.remove(job)
+                processes = []
+            else:
+                processes = list(job.processes)
+        
+        if job.status == "queued":
+            self.finish(job, {"status": "cancelled", "input": job.candidate.path, "output": None,
+                              "error": "Cancelled"})
+            if self.on_dropped:
+                self.on_dropped(job)
+        terminate_processes(processes, job.paused)
+        return True
+    
+    def cancel_all(self):
+        with self.condition:
+            job_ids = [job.id for job in self.jobs.values() if job.status in ("queued", "running")]
+        for job_id in job_ids:
+            self.cancel(job_id)
+    
+    def snapshot(self):
+        with self.condition:
+            return [{"id": job.id, "name": job.candidate.rel_path, "size": job.candidate.size, "priority": job.priority,
+                     "status": "paused" if job.paused and job.status in ("queued", "running") else job.status,
+                     "remote": job.remote}
+                    for job in self.jobs.values()]
+
+
+def signal_processes(processes, signum):
+    for process in processes:
+        try:
+            process.send_signal(signum)
+        except OSError:
+            pass
+
+
+def terminate_processes(processes, resume=False):
+    for process in processes:
+        try:
+            process.terminate()
+        except OSError:
+            pass
+    # A stopped process doesn't act on SIGTERM until it is continued
+    if resume and CAN_SUSPEND:
+        signal_processes(processes, signal.SIGCONT)
+
+
+# The governor steps the number of running jobs down when the 1-minute load
+# average per CPU or free memory says the host is struggling, and back up
+# once there is headroom; load-based steps wait for the average to catch up
+GOVERNOR_INTERVAL = 5
+GOVERNOR_COOLDOWN = 30
+LOAD_HIGH = 1.25
+LOAD_LOW = 0.75
+MIN_FREE_MEMORY_MB = 1024
+LOW_PRIORITY_NICE = 10
+
+
+def read_load_per_cpu():
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (OSError, AttributeError):
+        return None
+
+
+def read_available_memory_mb():
+    # Linux only; None elsewhere
+    try:
+        with open("/proc/meminfo", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def low_priority_launch():
+    # Returns (command prefix, Popen kwargs) that put an encoder behind interactive work
+    if os.name == "nt":
+        return [], {"creationflags": subprocess.BELOW_NORMAL_PRIORITY_CLASS}
+    prefix = []
+    if shutil.which("ionice"):
+        prefix += ["ionice", "-c", "2", "-n", "7"]
+    if shutil.which("nice"):
+        prefix += ["nice", "-n", str(LOW_PRIORITY_NICE)]
+    return prefix, {}
+
+
+class ResourceGovernor:
+    def __init__(self, job_queue, on_change=None):
+        self.job_queue = job_queue
+        self.max_jobs = job_queue.limit
+        self.on_change = on_change
+        self.last_change = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+    
+    def start(self):
+        self.thread.start()
+    
+    def stop(self):
+        self.stop_event.set()
+    
+    def next_limit(self, limit, load, free_mb, now):
+        # Memory pressure acts at once; swapping hurts far more than idle cores
+        if free_mb is not None and free_mb < MIN_FREE_MEMORY_MB:
+            return max(1, limit - 1)
+        if load is None or now - self.last_change < GOVERNOR_COOLDOWN:
+            return limit
+        if load > LOAD_HIGH:
+            return max(1, limit - 1)
+        if load < LOAD_LOW and (free_mb is None or free_mb >= 2 * MIN_FREE_MEMORY_MB):
+            return min(self.max_jobs, limit + 1)
+        return limit
+    
+    def run(self):
+        while not self.stop_event.wait(GOVERNOR_INTERVAL):
+            load = read_load_per_cpu()
+            free_mb = read_available_memory_mb()
+            limit = self.job_queue.limit
+            new_limit = self.next_limit(limit, load, free_mb, time.monotonic())
+            if new_limit != limit:
+                self.last_change = time.monotonic()
+                self.job_queue.set_limit(new_limit)
+                if self.on_change:
+                    self.on_change(new_limit, load, free_mb)
+
+
+# Remote encode workers (compressor_worker.py) speak a small HTTP protocol:
+# GET /health, POST /jobs to reserve a slot (503 when all are busy), PUT
+# /jobs/<id>/input with the input as the body, GET /jobs/<id> to poll,
+# GET /jobs/<id>/output to fetch the result and DELETE /jobs/<id> to clean up
+WORKER_PROTOCOL = 2
+WORKER_HEALTH_INTERVAL = 10
+WORKER_POLL_INTERVAL = 1
+WORKER_TIMEOUT = 30
+# Transport failures move a job to another slot this many times before it fails
+WORKER_MAX_ATTEMPTS = 3
+# A worker that answers "all slots busy" (another coordinator got there first)
+# is passed over for this long instead of being marked down
+WORKER_BUSY_BACKOFF = 5
+WORKER_CHUNK_SIZE = 1024 * 1024
+
+
+class WorkerError(Exception):
+    # The worker could not be reached or broke the protocol; the encode itself
+    # never ran to an answer, so the job is safe to retry elsewhere
+    pass
+
+
+class WorkerBusy(WorkerError):
+    # The worker is up but has no free slot; nothing was uploaded
+    pass
+
+
+class WorkerCancelled(Exception):
+    # The batch was cancelled or the pool stopped while a job waited for a slot
+    pass
+
+
+class RemoteWorker:
+    def __init__(self, address, token=None):
+        host, _, port = address.rpartition(":")
+        if not host or not port.isdigit():
+            raise ValueError(f"Worker address must be host:port, not {address}")
+        self.address = address
+        self.host = host
+        self.port = int(port)
+        self.token = token
+        self.healthy = False
+        self.slots = 0
+        self.busy_until = 0
+    
+    def request(self, method, path, body=None, headers=None):
+        # Returns (status, parsed JSON) for every call except the output download
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=WORKER_TIMEOUT)
+        try:
+            connection.request(method, path, body=body, headers=self.headers(headers))
+            response = connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            raise WorkerError(f"{self.address}: {e}")
+        finally:
+            connection.close()
+        try:
+            return response.status, json.loads(data) if data else {}
+        except ValueError:
+            raise WorkerError(f"{self.address}: unreadable reply to {method} {path}")
+    
+    def headers(self, extra=None):
+        headers = dict(extra or {})
+        if self.token:
+            headers["X-Worker-Token"] = self.token
+        return headers
+    
+    def check(self):
+        try:
+            status, reply = self.request("GET", "/health")
+            self.healthy = status == 200 and reply.get("protocol") == WORKER_PROTOCOL
+            self.slots = reply.get("slots", 0) if self.healthy else 0
+        except WorkerError:
+            self.healthy = False
+        return self.healthy
+    
+    def encode(self, input_file, output_file, settings, on_progress=None, is_cancelled=None):
+        # Same (returncode, error_output, frames) shape as a local encode. A slot
+        # is reserved before anything is sent, so a full worker costs no upload
+        headers = {"X-Settings": json.dumps(settings), "X-Extension": os.path.splitext(output_file)[1]}
+        status, reply = self.request("POST", "/jobs", None, headers)
+        if status == 503:
+            raise WorkerBusy(f"{self.address} has no free slot")
+        if status != 201:
+            raise WorkerError(f"{self.address} refused the job: {reply.get('error', status)}")
+        job_id = reply["id"]
+        
+        try:
+            # The upload streams straight from disk, so big inputs never sit in memory
+            with open(input_file, "rb") as f:
+                status, reply = self.request("PUT", f"/jobs/{job_id}/input", f,
+                                             {"Content-Length": str(os.fstat(f.fileno()).st_size)})
+            if status != 200:
+                raise WorkerError(f"{self.address} refused the upload: {reply.get('error', status)}")
+            
+            while True:
+                if is_cancelled and is_cancelled():
+                    return 255, "Cancelled", None
+                status, reply = self.request("GET", f"/jobs/{job_id}")
+                if status != 200:
+                    raise WorkerError(f"{self.address} lost job {job_id}")
+                if reply["status"] != "running":
+                    break
+                if on_progress:
+                    on_progress(reply["fraction"], ProgressEvent(None, reply["fps"], None, None, None,
+                                                                 reply["speed"], False))
+                time.sleep(WORKER_POLL_INTERVAL)
+            
+            if reply["status"] != "success":
+                return 1, reply.get("error") or "Remote encode failed", None
+            self.download(job_id, output_file)
+            return 0, "", None
+        finally:
+            try:
+                self.request("DELETE", f"/jobs/{job_id}")
+            except WorkerError:
+                pass
+    
+    def download(self, job_id, output_file):
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=WORKER_TIMEOUT)
+        try:
+            connection.request("GET", f"/jobs/{job_id}/output", headers=self.headers())
+            response = connection.getresponse()
+            if response.status != 200:
+                raise WorkerError(f"{self.address} has no output for job {job_id}")
+            expected = int(response.getheader("Content-Length", -1))
+            with open(output_file, "wb") as f:
+                shutil.copyfileobj(response, f, WORKER_CHUNK_SIZE)
+                written = f.tell()
+        except (OSError, http.client.HTTPException) as e:
+            raise WorkerError(f"{self.address}: {e}")
+        finally:
+            connection.close()
+        if expected >= 0 and written != expected:
+            raise WorkerError(f"{self.address}: output cut short ({written} of {expected} bytes)")
+
+
+class WorkerPool:
+    # Encode slots for a batch: `limit` local ones plus whatever each healthy
+    # remote worker offers. Every job takes the first slot to come free, so a
+    # fast node pulls more of the queue than a slow one and a node that drops
+    # out just stops taking work; there is no per-node backlog to rebalance
+    def __init__(self, addresses, token=None):
+        self.workers = [RemoteWorker(address, token) for address in addresses]
+        self.condition = threading.Condition()
+        self.limit = 1
+        self.in_use = {None: 0}
+        self.in_use.update((worker, 0) for worker in self.workers)
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+    
+    def start(self):
+        # The first round of health checks runs inline so the batch can size its queue
+        self.check_all()
+        self.thread.start()
+    
+    def stop(self):
+        self.stop_event.set()
+        with self.condition:
+            self.condition.notify_all()
+    
+    def run(self):
+        while not self.stop_event.wait(WORKER_HEALTH_INTERVAL):
+            self.check_all()
+    
+    def check_all(self):
+        with ThreadPoolExecutor(max_workers=len(self.workers) or 1) as executor:
+            list(executor.map(RemoteWorker.check, self.workers))
+        with self.condition:
+            self.condition.notify_all()
+    
+    def remote_slots(self):
+        return sum(worker.slots for worker in self.workers if worker.healthy)
+    
+    def set_limit(self, limit):
+        # The governor throttles local encodes only; remote nodes manage their own load
+        with self.condition:
+            self.limit = limit
+            self.condition.notify_all()
+    
+    def free_slot(self):
+        if self.in_use[None] < self.limit:
+            return None, True
+        now = time.monotonic()
+        for worker in self.workers:
+            if worker.healthy and worker.busy_until <= now and self.in_use[worker] < worker.slots:
+                return worker, True
+        return None, False
+    
+    def acquire(self, is_cancelled):
+        # Returns a RemoteWorker, or None for a local slot
+        with self.condition:
+            while True:
+                if is_cancelled() or self.stop_event.is_set():
+                    raise WorkerCancelled()
+                worker, found = self.free_slot()
+                if found:
+                    self.in_use[worker] += 1
+                    return worker
+                self.condition.wait(WORKER_POLL_INTERVAL)
+    
+    def release(self, worker):
+        with self.condition:
+            self.in_use[worker] -= 1
+            self.condition.notify()
+    
+    def mark_down(self, worker):
+        # Health checks bring it back once it answers again
+        with self.condition:
+            worker.healthy = False
+            self.condition.notify_all()
+    
+    def mark_busy(self, worker):
+        with self.condition:
+            worker.busy_until = time.monotonic() + WORKER_BUSY_BACKOFF
+
+
+PRESET_SETTINGS = {
+    "ultra": {"crf": 28, "preset": "faster"},
+    "high": {"crf": 25, "preset": "fast"},
+    "balanced": {"crf": 23, "preset": "medium"},
+    "quality": {"crf": 20, "preset": "slow"}
+}
+
+
+def make_settings(preset="balanced", crf=None, codec=DEFAULT_CODEC, target_mb=None, max_height=None, max_fps=None,
+                  drop_duplicates=False, audio_mode="auto", all_audio_tracks=False, downmix=False):
+    settings = dict(PRESET_SETTINGS[preset], codec=codec, target_mb=target_mb, max_height=max_height,
+                    max_fps=max_fps, drop_duplicates=drop_duplicates, audio_mode=audio_mode,
+                    all_audio_tracks=all_audio_tracks, downmix=downmix)
+    # Only Balanced follows a custom CRF, the same as the GUI slider
+    if preset == "balanced" and crf is not None:
+        settings["crf"] = crf
+    return settings
+
+
+def remove_partial_output(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def partial_output_path(path):
+    # ffmpeg writes here and the result is renamed into place once complete, so
+    # a crash never leaves a truncated file under the real name. The dot keeps
+    # scans and watchers away; the extension still picks the muxer
+    folder, name = os.path.split(path)
+    stem, ext = os.path.splitext(name)
+    return os.path.join(folder, f".{stem}.partial{ext}")
+
+
+def get_batch_output(candidate, output_folder, suffix="_compressed", extension=None):
+    # Mirror the source tree so same-named files in different folders don't collide
+    rel_dir, name = os.path.split(candidate.rel_path)
+    stem, ext = os.path.splitext(name)
+    folder = os.path.join(output_folder, rel_dir)
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"{stem}{suffix}{extension or ext}")
+
+
+class CompressionEngine:
+    # Runs compress, convert and predict jobs without any UI. Progress goes to
+    # an on_event callback as plain dicts, so Tk, the CLI or a script can use it
+    def __init__(self, ffmpeg_path, parallel_jobs="Auto"):
+        self.ffmpeg_path = ffmpeg_path
+        self.parallel_jobs = parallel_jobs
+        self.cancelled = False
+        
+        # Resource limits for shared hosts: a cap on encoder threads across all
+        # jobs, nice/ionice for spawned encoders, and load-adaptive job counts
+        self.max_threads = None
+        self.low_priority = False
+        self.adaptive = False
+        self.lock = threading.Lock()
+        self.running_processes = set()
+        self.job_progress = {}
+        self.finished_jobs = 0
+        self.batch_total = 0
+        self.scan_done = False
+        self.batch_index = None
+        self.batch_stats = BatchStats()
+        self.last_summary = (0, None)
+        self.quality_metric = None
+        self.prober = MediaProber()
+        self.encoder_stats = EncoderStats()
+        self.passlog_cache = PassLogCache()
+        
+        # Batch and watch runs go through a JobQueue; worker threads record
+        # their current Job here so run_ffmpeg can attach processes to it
+        self.job_queue = None
+        self.local = threading.local()
+        
+        # Optional remote encode workers for batch mode, as host:port strings
+        self.worker_addresses = []
+        self.worker_token = None
+        self.worker_pool = None
+        
+        # Batch and watch runs encode each distinct recording once
+        self.dedupe = True
+        self.duplicates = None
+        
+        # Set to a Tracer to record per-stage spans for the next run
+        self.tracer = None
+    
+    def emit(self, on_event, event_type, **fields):
+        if on_event:
+            on_event(dict(fields, type=event_type))
+    
+    def span(self, name, **args):
+        return self.tracer.span(name, **args) if self.tracer else nullcontext()
+    
+    def start(self):
+        self.cancelled = False
+        self.job_queue = None
+    
+    def cancel(self):
+        self.cancelled = True
+        if self.job_queue:
+            self.job_queue.cancel_all()
+        
+        # Don't wait for the next progress block; stop every encoder right away
+        with self.lock:
+            processes = list(self.running_processes)
+        terminate_processes(processes, resume=True)
+    
+    def is_cancelled(self):
+        job = getattr(self.local, "job", None)
+        return self.cancelled or (job is not None and job.cancelled)
+    
+    def job_dropped(self, job):
+        # A job cancelled before it started still counts as finished for progress
+        with self.lock:
+            self.finished_jobs += 1
+    
+    def run_job(self, job):
+        self.local.job = job
+        if self.tracer:
+            self.tracer.add_span("queued", job.submitted, self.tracer.now(), "queue", True, file=job.candidate.rel_path)
+        try:
+            with self.span("job", file=job.candidate.rel_path):
+                return job.run(job.candidate)
+        finally:
+            self.local.job = None
+    
+    def queue_snapshot(self):
+        # Job list for a queue view, with live progress for running jobs
+        if not self.job_queue:
+            return []
+        jobs = self.job_queue.snapshot()
+        with self.lock:
+            for job in jobs:
+                job["progress"] = self.job_progress.get(job["name"])
+        return jobs
+    
+    def pause_job(self, job_id):
+        # False when the job can't be paused: finished, already paused, or encoding remotely
+        return bool(self.job_queue) and self.job_queue.pause(job_id)
+    
+    def set_job_remote(self, address):
+        job = getattr(self.local, "job", None)
+        if job is None or self.job_queue is None:
+            return True
+        return self.job_queue.set_remote(job, address)
+    
+    def resume_job(self, job_id):
+        return bool(self.job_queue) and self.job_queue.resume(job_id)
+    
+    def cancel_job(self, job_id):
+        return bool(self.job_queue) and self.job_queue.cancel(job_id)
+    
+    def set_job_priority(self, job_id, priority):
+        return bool(self.job_queue) and self.job_queue.set_priority(job_id, priority)
+    
+    def probe_video(self, filepath):
+        return self.prober.probe(self.ffmpeg_path, filepath)
+    
+    def get_parallel_plan(self, file_count=None):
+        # Returns (jobs, threads per job); file_count=None plans without a file limit
+        cpu_count = os.cpu_count() or 1
+        thread_budget = min(cpu_count, self.max_threads or cpu_count)
+        
+        if str(self.parallel_jobs).lower() == "auto":
+            jobs = min(thread_budget // X264_THREADS_PER_JOB, thread_budget)
+        else:
+            # An explicit count is honoured even past the thread budget; each job
+            # then just gets a single encoder thread
+            jobs = int(self.parallel_jobs)
+        
+        if file_count is not None:
+            jobs = min(jobs, file_count)
+        jobs = max(1, jobs)
+        threads_per_job = max(1, thread_budget // jobs)
+        return jobs, threads_per_job
+    
+    def start_governor(self, on_event=None, verb="Compressing"):
+        if not self.adaptive:
+            return None
+        
+        def on_change(limit, load, free_mb):
+            details = []
+            if load is not None:
+                details.append(f"load {load:.2f}/CPU")
+            if free_mb is not None:
+                details.append(f"{free_mb:.0f} MB free")
+            self.report_batch_progress(on_event, f"Running up to {limit} jobs ({', '.join(details)})", verb)
+        
+        governor = ResourceGovernor(self.worker_pool or self.job_queue, on_change)
+        governor.start()
+        return governor
+    
+    def run_ffmpeg(self, cmd, on_progress=None):
+        started = time.perf_counter()
+        prefix, popen_args = low_priority_launch() if self.low_priority else ([], {})
+        process = subprocess.Popen(prefix + with_progress_pipe(cmd), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   text=True, **popen_args)
+        job = getattr(self.local, "job", None)
+        with self.lock:
+            self.running_processes.add(process)
+        if job is not None:
+            self.job_queue.add_process(job, process)
+        
+        # Only the end of the log matters for error reports
+        stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+        stderr_thread = threading.Thread(target=drain_stderr, args=(process, stderr_tail), daemon=True)
+        stderr_thread.start()
+        
+        try:
+            last_report = 0
+            # Also catches a cancel that landed before the process was registered
+            if self.is_cancelled():
+                process.terminate()
+            for event in read_progress(process.stdout):
+                if self.is_cancelled():
+                    process.terminate()
+                    break
+                
+                now = time.monotonic()
+                if on_progress and (event.done or now - last_report >= PROGRESS_INTERVAL):
+                    last_report = now
+                    with self.span("progress callback"):
+                        on_progress(event)
+            
+            process.wait()
+            stderr_thread.join()
+        finally:
+            with self.lock:
+                self.running_processes.discard(process)
+            if job is not None:
+                self.job_queue.remove_process(job, process)
+            if self.tracer:
+                self.tracer.add_span("ffmpeg", started, self.tracer.now(), output=os.path.basename(cmd[-1]))
+        
+        return process.returncode, "\n".join(stderr_tail)
+    
+    def run_encode(self, input_file, output_file, settings, info, threads=None, on_progress=None):
+        # Returns (returncode, error_output, frames); on_progress gets (fraction, event)
+        ffmpeg = self.ffmpeg_path
+        duration = info["duration"] if info else None
+        last_frame = [0]
+        
+        def progress_handler(offset, weight):
+            def handler(event):
+                last_frame[0] = event.frame or last_frame[0]
+                if on_progress and duration:
+                    on_progress(offset + weight * min(event.out_time / duration, 1), event)
+            return handler
+        
+        if not settings.get("target_mb"):
+            cmd = build_encode_command(ffmpeg, input_file, output_file, settings, threads=threads, info=info)
+            returncode, error_output = self.run_ffmpeg(cmd, progress_handler(0, 1))
+            return returncode, error_output, last_frame[0]
+        
+        if not duration:
+            raise Exception(f"Cannot fit {os.path.basename(input_file)} to a target size without its duration")
+        
+        bitrate_kbps = compute_video_bitrate(settings["target_mb"], duration,
+                                             plan_audio(settings, info, output_file)[1])
+        backend = ENCODER_BACKENDS[settings["codec"]]
+        
+        if not backend.supports_two_pass:
+            cmd = build_encode_command(ffmpeg, input_file, output_file, settings, threads=threads,
+                                       bitrate_kbps=bitrate_kbps, info=info)
+            returncode, error_output = self.run_ffmpeg(cmd, progress_handler(0, 1))
+            return returncode, error_output, last_frame[0]
+        
+        os.makedirs(self.passlog_cache.folder, exist_ok=True)
+        prefix = self.passlog_cache.get_prefix(fingerprint_file(input_file), settings)
+        pass2_offset = 0
+        
+        # Re-targeting the same input skips straight to pass 2
+        if not self.passlog_cache.has_stats(backend, prefix):
+            partial_prefix = f"{prefix}.partial"
+            cmd = build_encode_command(ffmpeg, input_file, output_file, settings, threads=threads,
+                                       bitrate_kbps=bitrate_kbps, pass_number=1, passlog=partial_prefix,
+                                       info=info)
+            returncode, error_output = self.run_ffmpeg(cmd, progress_handler(0, 0.3))
+            if returncode != 0:
+                self.passlog_cache.discard(backend, partial_prefix)
+                return returncode, error_output, last_frame[0]
+            self.passlog_cache.commit(backend, partial_prefix, prefix, input_file)
+            pass2_offset = 0.3
+        
+        cmd = build_encode_command(ffmpeg, input_file, output_file, settings, threads=threads,
+                                   bitrate_kbps=bitrate_kbps, pass_number=2, passlog=prefix, info=info)
+        returncode, error_output = self.run_ffmpeg(cmd, progress_handler(pass2_offset, 1 - pass2_offset))
+        return returncode, error_output, last_frame[0]
+    
+    def resolve_codec(self, settings, input_file):
+        # Auto picks the fastest backend whose measured output/source ratio fits
+        # the target size, or that shrinks the file at all when there is none
+        if settings["codec"] != AUTO_CODEC:
+            return settings
+        max_ratio = 1.0
+        if settings["target_mb"]:
+            try:
+                max_ratio = settings["target_mb"] * 1024 * 1024 / os.path.getsize(input_file)
+            except (OSError, ZeroDivisionError):
+                pass
+        codec = self.encoder_stats.pick_fastest(max_ratio) or self.encoder_stats.pick_smallest() or DEFAULT_CODEC
+        return dict(settings, codec=codec)
+    
+    def record_encoder_stats(self, settings, input_file, output_file, frames, encode_seconds, on_event=None):
+        # Size ratios are only meaningful for quality-based encodes
+        if settings["target_mb"]:
+            return
+        try:
+            input_size = os.path.getsize(input_file)
+            output_size = os.path.getsize(output_file)
+        except OSError:
+            return
+        fps = frames / encode_seconds if frames and encode_seconds > 0 else None
+        self.encoder_stats.record(settings["codec"], fps, input_size, output_size)
+        self.emit(on_event, "stats", codec=settings["codec"])
+    
+    def compress_file(self, input_file, output_file, settings, segment_parallel=False, on_event=None):
+        # Returns {status, input, output, error}
+        if settings["codec"] == AUTO_CODEC:
+            settings = self.resolve_codec(settings, input_file)
+            self.emit(on_event, "status", fraction=0,
+                      message=f"Auto codec: {ENCODER_BACKENDS[settings['codec']].label}")
+        container_error = check_output_container(settings, output_file)
+        if container_error:
+            return {"status": "failed", "input": input_file, "output": output_file, "error": container_error}
+        
+        with self.span("probe"):
+            info = self.probe_video(input_file)
+        duration = info["duration"] if info else None
+        dropped = describe_dropped_subtitles(plan_subtitles(info, get_container(output_file))[1],
+                                             get_container(output_file))
+        if dropped:
+            self.emit(on_event, "status", fraction=0, message=dropped[0].upper() + dropped[1:])
+        
+        # Segment mode only applies to CRF encodes; a size target needs whole-file rate control
+        if segment_parallel and not settings["target_mb"] and duration and duration >= SEGMENT_MIN_DURATION:
+            return self.run_segmented_compression(input_file, output_file, info, settings, on_event)
+        
+        def on_progress(fraction, event):
+            self.emit(on_event, "progress", fraction=fraction, fps=event.fps, speed=event.speed, detail=None)
+        
+        start_time = time.time()
+        partial_file = partial_output_path(output_file)
+        with self.span("encode", file=os.path.basename(input_file)):
+            returncode, error_output, frames = self.run_encode(input_file, partial_file, settings, info,
+                                                               on_progress=on_progress)
+        
+        if returncode == 0:
+            with self.span("publish"):
+                os.replace(partial_file, output_file)
+            self.record_encoder_stats(settings, input_file, output_file, frames, time.time() - start_time, on_event)
+            return {"status": "success", "input": input_file, "output": output_file, "error": None}
+        remove_partial_output(partial_file)
+        if self.is_cancelled():
+            return {"status": "cancelled", "input": input_file, "output": output_file, "error": None}
+        return {"status": "failed", "input": input_file, "output": output_file,
+                "error": f"Compression failed\n{error_output}".strip()}
+    
+    def run_segmented_compression(self, input_file, output_file, info, settings, on_event=None):
+        duration = info["duration"]
+        ffmpeg = self.ffmpeg_path
+        start_time = time.time()
+        cancelled = {"status": "cancelled", "input": input_file, "output": output_file, "error": None}
+        
+        # Enough segments to keep every worker busy, but not so short that
+        # each segment's first IDR frame starts to cost real bitrate
+        wanted_jobs, _ = self.get_parallel_plan()
+        segment_length = max(SEGMENT_MIN_LENGTH, duration / (wanted_jobs * SEGMENTS_PER_JOB))
+        
+        work_dir = tempfile.mkdtemp(prefix=".segments_", dir=os.path.dirname(os.path.abspath(output_file)))
+        try:
+            self.emit(on_event, "status", fraction=0, message="Splitting video at keyframes...")
+            
+            # Stream copy cuts only on keyframes, so every chunk is a whole number of GOPs
+            split_cmd = [
+                ffmpeg,
+                "-i", input_file,
+                "-map", "0:v:0",
+                "-c", "copy",
+                "-f", "segment",
+                "-segment_time", f"{segment_length:.3f}",
+                "-reset_timestamps", "1",
+                "-y",
+                os.path.join(work_dir, "source_%05d.mkv")
+            ]
+            if self.run_ffmpeg(split_cmd)[0] != 0:
+                if self.is_cancelled():
+                    return cancelled
+                raise Exception("Failed to split video into segments")
+            
+            segments = sorted(name for name in os.listdir(work_dir) if name.startswith("source_"))
+            if not segments:
+                raise Exception("Failed to split video into segments")
+            
+            jobs, threads_per_job = self.get_parallel_plan(len(segments))
+            segment_times = {}
+            progress_lock = threading.Lock()
+            
+            def on_segment_progress(segment, event):
+                with progress_lock:
+                    segment_times[segment] = event.out_time
+                    fraction = min(sum(segment_times.values()) / duration, 1)
+                self.emit(on_event, "progress", fraction=fraction, fps=None, speed=None,
+                          detail=f"{len(segments)} segments, {jobs} parallel jobs")
+            
+            def encode_segment(segment):
+                cmd = build_encode_command(
+                    ffmpeg, os.path.join(work_dir, segment),
+                    os.path.join(work_dir, segment.replace("source_", "encoded_").replace(".mkv", ".mp4")),
+                    settings, threads=threads_per_job, audio=False, faststart=False, info=info)
+                return self.run_ffmpeg(cmd, lambda event: on_segment_progress(segment, event))[0]
+            
+            # Audio is planned against the final container but parked in MKV,
+            # which holds whatever gets copied until the segments are joined
+            audio_args = plan_audio(settings, info, output_file)[0]
+            has_audio = audio_args != ["-an"]
+            
+            def encode_audio():
+                cmd = [ffmpeg, "-i", input_file, "-vn"] + audio_args + ["-y", os.path.join(work_dir, "audio.mka")]
+                return self.run_ffmpeg(cmd)[0]
+            
+            with ThreadPoolExecutor(max_workers=jobs + 1) as executor:
+                audio_future = executor.submit(encode_audio) if has_audio else None
+                segment_results = list(executor.map(encode_segment, segments))
+                audio_result = audio_future.result() if audio_future else 0
+            
+            # The per-job flag too, so cancelling one queued job stops its segments
+            if self.is_cancelled():
+                return cancelled
+            if any(result != 0 for result in segment_results) or audio_result != 0:
+                raise Exception("Failed to encode one or more segments")
+            
+            self.emit(on_event, "status", fraction=1, message="Joining segments...")
+            
+            list_file = os.path.join(work_dir, "segments.txt")
+            with open(list_file, "w", encoding="utf-8") as f:
+                for segment in segments:
+                    encoded = segment.replace("source_", "encoded_").replace(".mkv", ".mp4")
+                    f.write(f"file '{encoded}'\n")
+            
+            concat_cmd = [ffmpeg, "-f", "concat", "-safe", "0", "-i", list_file]
+            if has_audio:
+                concat_cmd += ["-i", os.path.join(work_dir, "audio.mka"), "-map", "0:v:0", "-map", "1:a"]
+            # Subtitles come straight from the source, which the segments line up with from zero
+            subtitle_args = plan_subtitles(info, get_container(output_file), 2 if has_audio else 1)[0]
+            if subtitle_args:
+                concat_cmd += ["-i", input_file] + ([] if has_audio else ["-map", "0:v:0"])
+            partial_file = os.path.join(work_dir, f"joined{os.path.splitext(output_file)[1]}")
+            concat_cmd += ["-c", "copy"] + subtitle_args
+            concat_cmd += ENCODER_BACKENDS[settings["codec"]].container_args(get_container(output_file))
+            concat_cmd += ["-movflags", "+faststart", "-y", partial_file]
+            
+            if self.run_ffmpeg(concat_cmd)[0] != 0:
+                if self.is_cancelled():
+                    return cancelled
+                raise Exception("Failed to join encoded segments")
+            # The work dir sits next to the output, so this is a same-filesystem rename
+            os.replace(partial_file, output_file)
+            
+            # Segments report progress per chunk, so the frame count comes from the probe
+            frames = info["video"]["frame_count"] if info["video"] else None
+            self.record_encoder_stats(settings, input_file, output_file, frames, time.time() - start_time, on_event)
+            return {"status": "success", "input": input_file, "output": output_file, "error": None}
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    
+    def reset_batch(self, total=0, scan_done=False):
+        with self.lock:
+            self.job_progress = {}
+            self.finished_jobs = 0
+            self.batch_total = total
+            self.scan_done = scan_done
+            self.batch_stats = BatchStats()
+            self.last_summary = (0, None)
+    
+    def sweep_interrupted(self):
+        # Deletes the partial outputs of jobs a crashed or killed run left in
+        # flight and returns their inputs so they can go to the front of the queue
+        interrupted = self.batch_index.take_in_flight()
+        for job in interrupted:
+            remove_partial_output(job["partial_path"])
+        return {job["input_path"] for job in interrupted}
+    
+    def run_scanned_jobs(self, input_folder, output_folder, job, on_event=None, verb="Compressing", resume_paths=()):
+        # Starts encoding the first files while the rest of the tree is still
+        # being scanned; returns job results in discovery order
+        scanner = scan_videos(input_folder, skip_dirs=[output_folder])
+        max_jobs, _ = self.get_parallel_plan()
+        # Remote slots run on other machines, so they add to the local plan
+        remote_slots = self.worker_pool.remote_slots() if self.worker_pool else 0
+        first = list(islice(scanner, max_jobs + remote_slots))
+        if not first:
+            return []
+        
+        # A short first batch means the scan is already over; size threads for it
+        scan_finished = len(first) < max_jobs + remote_slots
+        jobs, threads_per_job = self.get_parallel_plan(len(first))
+        self.reset_batch(len(first), scan_finished)
+        if self.worker_pool:
+            self.worker_pool.set_limit(jobs)
+        
+        run = lambda candidate: job(candidate, threads_per_job)
+        priority = lambda candidate: PRIORITY_URGENT if candidate.path in resume_paths else PRIORITY_NORMAL
+        self.job_queue = JobQueue(min(jobs + remote_slots, len(first)), self.run_job, self.job_dropped)
+        governor = self.start_governor(on_event, verb)
+        if resume_paths:
+            self.report_batch_progress(on_event, f"Resuming {len(resume_paths)} interrupted job(s) first", verb)
+        try:
+            queued = [self.job_queue.submit(candidate, run, priority(candidate)) for candidate in first]
+            
+            if not scan_finished:
+                for candidate in scanner:
+                    if self.cancelled:
+                        break
+                    with self.lock:
+                        self.batch_total += 1
+                    queued.append(self.job_queue.submit(candidate, run, priority(candidate)))
+                
+                with self.lock:
+                    self.scan_done = True
+                self.report_batch_progress(on_event, verb=verb)
+            
+            return [self.job_queue.wait(entry) for entry in queued]
+        finally:
+            if governor:
+                governor.stop()
+            self.job_queue.close()
+    
+    def compress_batch(self, input_folder, output_folder, settings, on_event=None):
+        # Returns one {status, input, output, error} per video found, in discovery order
+        os.makedirs(output_folder, exist_ok=True)
+        self.batch_index = BatchIndex(output_folder)
+        self.duplicates = DuplicateTracker() if self.dedupe else None
+        if self.worker_addresses:
+            self.worker_pool = WorkerPool(self.worker_addresses, self.worker_token)
+            self.worker_pool.start()
+            healthy = [worker.address for worker in self.worker_pool.workers if worker.healthy]
+            self.emit(on_event, "status", fraction=0,
+                      message=f"Remote workers: {', '.join(healthy) or 'none reachable'} "
+                              f"({self.worker_pool.remote_slots()} slots)")
+        try:
+            resume_paths = self.sweep_interrupted()
+            return self.run_scanned_jobs(
+                input_folder, output_folder,
+                lambda candidate, threads: self.compress_batch_file(candidate, output_folder, settings, threads,
+                                                                    on_event),
+                on_event, resume_paths=resume_paths)
+        finally:
+            if self.worker_pool:
+                self.worker_pool.stop()
+                self.worker_pool = None
+            self.batch_index.close()
+    
+    def compress_batch_file(self, candidate, output_folder, settings, threads_per_job, on_event=None):
+        input_file = candidate.path
+        filename = candidate.rel_path
+        # Keyed on the requested settings, so an auto pick that changes as
+        # measurements come in doesn't make finished outputs look stale
+        settings_key = BatchIndex.make_settings_key(settings)
+        settings = self.resolve_codec(settings, input_file)
+        output_file = get_batch_output(candidate, output_folder, extension=batch_output_extension(settings, input_file))
+        info = None
+        group = None
+        
+        def finish(status, message, error=None, output_bytes=None, encode_seconds=None, frames=None):
+            # The result doubles as the job's stats record, so the summary never
+            # has to stat the batch again
+            duration = info["duration"] if info else None
+            result = {
+                "status": status, "input": input_file, "output": output_file, "error": error,
+                "input_bytes": candidate.size, "output_bytes": output_bytes, "duration": duration,
+                "resolution": resolution_class(info), "encode_seconds": encode_seconds,
+                "fps": frames / encode_seconds if frames and encode_seconds else None,
+                "speed": duration / encode_seconds if duration and encode_seconds else None
+            }
+            self.batch_stats.add(filename, result)
+            if group is not None:
+                # Copies waiting on this file link to its output, or encode themselves if it failed
+                self.duplicates.resolve(group, output_file if status in ("success", "skipped", "duplicate") else None)
+            self.finish_batch_job(filename, message, on_event)
+            return result
+        
+        def link_from(source):
+            try:
+                with self.span("link"):
+                    link_or_copy(source, output_file)
+            except OSError as e:
+                return finish("failed", f"Error: {filename} - {str(e)}", str(e))
+            output_size = os.path.getsize(output_file)
+            # Recorded like an encode, so the next run skips this copy instead of linking it again
+            self.batch_index.save_encode(fingerprint, settings_key, input_file, output_file,
+                                         output_size, None, True)
+            return finish("duplicate", f"Linked duplicate: {filename} (same as {os.path.basename(source)})",
+                          output_bytes=output_size)
+        
+        if self.is_cancelled():
+            return finish("cancelled", f"Cancelled: {filename}")
+        
+        try:
+            with self.span("fingerprint"):
+                fingerprint = fingerprint_file(input_file)
+        except OSError as e:
+            return finish("failed", f"Error: {filename} - {str(e)}", str(e))
+        
+        with self.span("probe"):
+            info = self.batch_index.get_probe(fingerprint)
+            if info is None:
+                info = self.probe_video(input_file)
+                if info is not None:
+                    self.batch_index.save_probe(fingerprint, info)
+        duration = info["duration"] if info else None
+        
+        # Skip only outputs the index knows were finished with these settings
+        if self.batch_index.is_finished(fingerprint, settings_key, output_file):
+            return finish("skipped", f"Skipped (already compressed): {filename}",
+                          output_bytes=os.path.getsize(output_file))
+        
+        # Copies of one recording are encoded once. The first to get here
+        # represents the group; the others go back in the queue until it
+        # finishes, then link to its output
+        if self.duplicates is not None:
+            while True:
+                claimed, representative = self.duplicates.claim(fingerprint, input_file)
+                if representative:
+                    group = claimed
+                    break
+                if not claimed.done.is_set():
+                    raise JobDeferred(claimed.done)
+                if claimed.output:
+                    return link_from(claimed.output)
+        
+        # A copy under another name may have been encoded on an earlier run
+        if self.duplicates is not None:
+            earlier = self.batch_index.get_finished(fingerprint, settings_key)
+            if earlier and os.path.abspath(earlier["input_path"]) != os.path.abspath(input_file) and \
+                    self.duplicates.same_content(earlier["input_path"], input_file, fingerprint):
+                return link_from(earlier["output_path"])
+        
+        # Outputs from before the index existed count as done only when complete
+        with self.span("output check"):
+            looks_complete = self.batch_index.get_encode(fingerprint, settings_key, output_file) is None and \
+                self.output_looks_complete(output_file, duration)
+        if looks_complete:
+            output_size = os.path.getsize(output_file)
+            self.batch_index.save_encode(fingerprint, settings_key, input_file, output_file,
+                                         output_size, None, True)
+            return finish("skipped", f"Skipped (already exists): {filename}", output_bytes=output_size)
+        
+        with self.lock:
+            self.job_progress[filename] = 0
+        self.batch_stats.start_job(filename, info)
+        self.report_batch_progress(on_event)
+        
+        def on_progress(fraction, event):
+            with self.lock:
+                self.job_progress[filename] = fraction * 100
+            self.report_batch_progress(on_event)
+        
+        start_time = time.time()
+        partial_file = partial_output_path(output_file)
+        self.batch_index.begin_job(input_file, output_file, partial_file)
+        try:
+            with self.span("encode", file=filename):
+                returncode, error_output, frames = self.run_batch_encode(input_file, partial_file, settings, info,
+                                                                         threads_per_job, on_progress)
+            
+            if self.is_cancelled():
+                remove_partial_output(partial_file)
+                return finish("cancelled", f"Cancelled: {filename}")
+            
+            success = returncode == 0
+            encode_seconds = time.time() - start_time
+            with self.span("publish"):
+                if success:
+                    os.replace(partial_file, output_file)
+                else:
+                    remove_partial_output(partial_file)
+                output_size = os.path.getsize(output_file) if success else None
+                self.batch_index.save_encode(fingerprint, settings_key, input_file, output_file,
+                                             output_size, encode_seconds, success)
+            if success:
+                self.record_encoder_stats(settings, input_file, output_file, frames, encode_seconds, on_event)
+                container = get_container(output_file)
+                dropped = describe_dropped_subtitles(plan_subtitles(info, container)[1], container)
+                message = f"Completed: {filename}" + (f" • {dropped}" if dropped else "")
+                return finish("success", message, output_bytes=output_size,
+                              encode_seconds=encode_seconds, frames=frames)
+            
+            last_error = error_output.splitlines()[-1] if error_output else ""
+            return finish("failed", f"Failed: {filename} {last_error}".strip(), error_output or "Compression failed")
+        
+        except WorkerCancelled:
+            remove_partial_output(partial_file)
+            return finish("cancelled", f"Cancelled: {filename}")
+        except Exception as e:
+            remove_partial_output(partial_file)
+            if self.is_cancelled():
+                return finish("cancelled", f"Cancelled: {filename}")
+            return finish("failed", f"Error: {filename} - {str(e)}", str(e))
+        finally:
+            self.batch_index.end_job(output_file)
+    
+    def run_batch_encode(self, input_file, output_file, settings, info, threads, on_progress):
+        if not self.worker_pool:
+            return self.run_encode(input_file, output_file, settings, info, threads=threads, on_progress=on_progress)
+        
+        error = None
+        attempts = 0
+        while attempts < WORKER_MAX_ATTEMPTS:
+            worker = self.worker_pool.acquire(self.is_cancelled)
+            try:
+                # A job paused before its encode started stays local, where it can start frozen
+                if worker is None or not self.set_job_remote(worker.address):
+                    return self.run_encode(input_file, output_file, settings, info, threads=threads,
+                                           on_progress=on_progress)
+                try:
+                    with self.span("remote encode", worker=worker.address):
+                        return worker.encode(input_file, output_file, settings, on_progress, self.is_cancelled)
+                finally:
+                    self.set_job_remote(None)
+            except WorkerBusy:
+                # A full worker is healthy, so this costs neither its health nor an attempt;
+                # the next acquire takes another slot while this one backs off
+                self.worker_pool.mark_busy(worker)
+            except WorkerError as e:
+                # The slot goes back below, but a down worker offers none until it recovers
+                self.worker_pool.mark_down(worker)
+                error = str(e)
+                attempts += 1
+            finally:
+                self.worker_pool.release(worker)
+        raise Exception(f"Remote encode failed {WORKER_MAX_ATTEMPTS} times, last on {error}")
+    
+    def output_looks_complete(self, output_file, duration):
+        if not os.path.exists(output_file) or not duration:
+            return False
+        output_info = self.probe_video(output_file)
+        if not output_info or not output_info["duration"]:
+            return False
+        # A truncated encode stops well short of the source duration
+        return abs(output_info["duration"] - duration) <= 1.0
+    
+    def finish_batch_job(self, filename, message, on_event=None, verb="Compressing"):
+        with self.lock:
+            self.job_progress.pop(filename, None)
+            self.finished_jobs += 1
+        self.report_batch_progress(on_event, message, verb)
+    
+    def report_batch_progress(self, on_event=None, message=None, verb="Compressing"):
+        with self.lock:
+            fields = {
+                "finished": self.finished_jobs,
+                "total": self.batch_total,
+                "scan_done": self.scan_done,
+                "active": dict(self.job_progress)
+            }
+        self.emit(on_event, "batch", message=message, verb=verb, summary=self.batch_summary(message is not None),
+                  **fields)
+    
+    def batch_summary(self, fresh=False):
+        # Live aggregate for the current run; progress ticks reuse the last one
+        # for up to SUMMARY_INTERVAL, job finishes always rebuild it
+        now = time.monotonic()
+        built, summary = self.last_summary
+        if summary is not None and not fresh and now - built < SUMMARY_INTERVAL:
+            return summary
+        with self.lock:
+            active = dict(self.job_progress)
+        queued_sizes = []
+        workers = 1
+        if self.job_queue:
+            workers = self.job_queue.limit
+            queued_sizes = [job["size"] for job in self.job_queue.snapshot()
+                            if job["status"] in ("queued", "paused") and job["name"] not in active]
+        summary = self.batch_stats.summary(active, queued_sizes, workers)
+        self.last_summary = (now, summary)
+        return summary
+    
+    def watch_folder(self, input_folder, output_folder, settings, on_event=None):
+        # Runs until cancel(), compressing each new video once it stops growing
+        os.makedirs(output_folder, exist_ok=True)
+        self.batch_index = BatchIndex(output_folder)
+        self.duplicates = DuplicateTracker() if self.dedupe else None
+        journal = WatchJournal(output_folder)
+        try:
+            watcher = InotifyWatcher(input_folder, [output_folder])
+        except (OSError, AttributeError):
+            watcher = PollingWatcher(input_folder, [output_folder])
+        
+        jobs, threads_per_job = self.get_parallel_plan()
+        self.reset_batch(0, True)
+        
+        def run(candidate):
+            result = self.compress_batch_file(candidate, output_folder, settings, threads_per_job, on_event)
+            # Cancelled files stay queued in the journal and are picked up again on restart
+            if result["status"] != "cancelled":
+                journal.record("done", candidate.path, candidate.size, candidate.mtime, result["status"])
+            self.emit(on_event, "job_done", result=result)
+            return result
+        
+        self.job_queue = JobQueue(jobs, self.run_job, self.job_dropped)
+        governor = self.start_governor(on_event)
+        
+        # The journal still lists interrupted files as queued; they just jump the line
+        resume_paths = self.sweep_interrupted()
+        
+        # path -> ((size, mtime), when that signature was first seen)
+        pending = dict.fromkeys(journal.pending())
+        pending.update(dict.fromkeys(candidate.path for candidate in scan_videos(input_folder, [output_folder])))
+        mode = "inotify" if isinstance(watcher, InotifyWatcher) else "polling"
+        self.report_batch_progress(on_event, f"Watching {input_folder} ({mode})")
+        
+        try:
+            while not self.cancelled:
+                for path in watcher.read():
+                    name = os.path.basename(path)
+                    if not name.startswith(".") and os.path.splitext(name)[1].lower() in VIDEO_EXTENSIONS:
+                        pending.setdefault(path, None)
+                
+                now = time.monotonic()
+                for path in list(pending):
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        del pending[path]
+                        continue
+                    signature = (stat.st_size, stat.st_mtime)
+                    if pending[path] is None or pending[path][0] != signature:
+                        pending[path] = (signature, now)
+                        continue
+                    # Empty files are usually a copy that hasn't started writing yet. Files
+                    # untouched for a while (e.g. found on startup) need no further wait
+                    settled = now - pending[path][1] >= WATCH_SETTLE_SECONDS or \
+                        time.time() - stat.st_mtime >= WATCH_SETTLE_SECONDS
+                    if not stat.st_size or not settled:
+                        continue
+                    
+                    del pending[path]
+                    if journal.is_done(path, *signature):
+                        continue
+                    journal.record("queued", path, *signature)
+                    candidate = VideoCandidate(path, os.path.relpath(path, input_folder), *signature)
+                    with self.lock:
+                        self.batch_total += 1
+                    self.job_queue.submit(candidate, run, PRIORITY_URGENT if path in resume_paths else PRIORITY_NORMAL)
+                    self.report_batch_progress(on_event, f"Queued: {candidate.rel_path}")
+        finally:
+            if governor:
+                governor.stop()
+            self.job_queue.close()
+            for thread in self.job_queue.threads:
+                thread.join()
+            watcher.close()
+            journal.close()
+            self.batch_index.close()
+    
+    def convert_single(self, input_file, to_fmt, on_event=None):
+        candidate = VideoCandidate(input_file, os.path.basename(input_file), 0, 0)
+        self.reset_batch(1, True)
+        return self.convert_file(candidate, to_fmt, None, on_event)
+    
+    def convert_batch(self, input_folder, output_folder, to_fmt, on_event=None):
+        os.makedirs(output_folder, exist_ok=True)
+        return self.run_scanned_jobs(
+            input_folder, output_folder,
+            lambda candidate, threads: self.convert_file(candidate, to_fmt, output_folder, on_event),
+            on_event, "Converting")
+    
+    def convert_file(self, candidate, to_fmt, output_dir, on_event=None):
+        # Returns {status, input, output, actions, error}
+        input_file = candidate.path
+        filename = candidate.rel_path
+        if output_dir:
+            output_file = get_batch_output(candidate, output_dir, "_converted", f".{to_fmt}")
+        else:
+            stem, _ = os.path.splitext(input_file)
+            output_file = f"{stem}_converted.{to_fmt}"
+        
+        def result(status, actions="", error=None):
+            return {"status": status, "input": input_file, "output": output_file, "actions": actions,
+                    "error": error}
+        
+        if self.is_cancelled():
+            self.finish_batch_job(filename, f"Cancelled: {filename}", on_event, "Converting")
+            return result("cancelled", error="Cancelled")
+        
+        info = self.probe_video(input_file)
+        if info is None:
+            self.finish_batch_job(filename, f"Failed: {filename}", on_event, "Converting")
+            return result("failed", error=f"Could not read video information from {input_file}")
+        
+        stream_args, actions = plan_conversion(info, to_fmt)
+        partial_file = partial_output_path(output_file)
+        cmd = [self.ffmpeg_path, "-i", input_file] + stream_args + ["-y", partial_file]
+        duration = info["duration"]
+        
+        with self.lock:
+            self.job_progress[filename] = 0
+        self.report_batch_progress(on_event, f"Converting: {filename} ({actions})", "Converting")
+        
+        def on_progress(event):
+            if duration:
+                with self.lock:
+                    self.job_progress[filename] = min(event.out_time / duration * 100, 100)
+                self.report_batch_progress(on_event, verb="Converting")
+        
+        returncode, error_output = self.run_ffmpeg(cmd, on_progress)
+        
+        if returncode == 0:
+            os.replace(partial_file, output_file)
+            self.finish_batch_job(filename, f"Converted: {filename}", on_event, "Converting")
+            return result("success", actions)
+        
+        remove_partial_output(partial_file)
+        if self.is_cancelled():
+            self.finish_batch_job(filename, f"Cancelled: {filename}", on_event, "Converting")
+            return result("cancelled", actions, "Cancelled")
+        self.finish_batch_job(filename, f"Failed: {filename}", on_event, "Converting")
+        # The tail of the ffmpeg log is where the actual error is
+        return result("failed", actions, "\n".join(error_output.splitlines()[-10:]) or "Conversion failed")
+    
+    def get_quality_metric(self):
+        # VMAF if the build has it, SSIM otherwise (every build has SSIM)
+        if self.quality_metric is None:
+            try:
+                result = subprocess.run([self.ffmpeg_path, "-hide_banner", "-filters"],
+                                        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=30)
+                filters = result.stdout
+            except (OSError, subprocess.SubprocessError):
+                filters = ""
+            if re.search(r'\blibvmaf\b', filters):
+                self.quality_metric = "libvmaf"
+            elif re.search(r'\bssim\b', filters):
+                self.quality_metric = "ssim"
+            else:
+                self.quality_metric = ""
+        return self.quality_metric
+    
+    def predict_crf(self, input_file, settings, on_event=None):
+        # Returns {predictions: [(crf, size_mb, score)], choice, met, metric}, or None if cancelled
+        ffmpeg = self.ffmpeg_path
+        target_mb = settings["target_mb"]
+        settings = self.resolve_codec(settings, input_file)
+        backend = ENCODER_BACKENDS[settings["codec"]]
+        
+        info = self.probe_video(input_file)
+        if not info or not info["duration"]:
+            raise Exception("Could not read the video duration")
+        duration = info["duration"]
+        audio_kbps = plan_audio(settings, info, input_file)[1]
+        
+        metric = self.get_quality_metric()
+        if not target_mb and not metric:
+            raise Exception("This FFmpeg build has neither libvmaf nor ssim; set a target size instead")
+        
+        work_dir = tempfile.mkdtemp(prefix="crf_predict_")
+        try:
+            starts, sample_length = get_sample_plan(duration)
+            tasks = [(crf, i, start) for crf in PREDICT_CRF_VALUES for i, start in enumerate(starts)]
+            jobs, threads_per_job = self.get_parallel_plan(len(tasks))
+            done = [0]
+            done_lock = threading.Lock()
+            
+            # Samples get the same downscale but keep every frame, so they still line
+            # up frame for frame with the reference; the metric scales them back up
+            sample_filters, _ = build_video_filters(dict(settings, max_fps=None, drop_duplicates=False), info)
+            metric_graph = f"[0:v][1:v]{metric}"
+            if sample_filters:
+                metric_graph = f"[0:v][1:v]scale2ref=flags={SCALE_FLAGS}[dist][ref];[dist][ref]{metric}"
+            
+            def encode_sample(task):
+                # None once cancelled, so a killed encode isn't reported as a failure
+                crf, i, start = task
+                if self.is_cancelled():
+                    return None
+                sample_seconds = min(sample_length, duration - start)
+                sample_file = os.path.join(work_dir, f"crf{crf}_{i}.mkv")
+                cmd = [ffmpeg, "-ss", f"{start:.3f}", "-t", f"{sample_seconds:.3f}", "-i", input_file]
+                cmd += backend.video_args(dict(settings, crf=crf), threads_per_job)
+                if sample_filters:
+                    cmd += ["-vf", ",".join(sample_filters)]
+                cmd += ["-an", "-y", sample_file]
+                if self.run_ffmpeg(cmd)[0] != 0:
+                    if self.is_cancelled():
+                        return None
+                    raise Exception(f"Failed to encode sample at CRF {crf}")
+                
+                score = None
+                if metric:
+                    # Same accurate seek on the reference keeps the frames aligned
+                    metric_cmd = [ffmpeg, "-i", sample_file,
+                                  "-ss", f"{start:.3f}", "-t", f"{sample_seconds:.3f}", "-i", input_file,
+                                  "-lavfi", metric_graph, "-f", "null", "-"]
+                    returncode, output = self.run_ffmpeg(metric_cmd)
+                    if returncode == 0:
+                        score = parse_metric_score(output)
+                
+                with done_lock:
+                    done[0] += 1
+                    count = done[0]
+                self.emit(on_event, "progress", fraction=count / len(tasks), fps=None, speed=None,
+                          detail=f"Encoded {count}/{len(tasks)} samples")
+                return crf, os.path.getsize(sample_file), sample_seconds, score
+            
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                results = list(executor.map(encode_sample, tasks))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        
+        if self.is_cancelled() or None in results:
+            return None
+        
+        predictions = summarize_predictions(results, duration, audio_kbps)
+        threshold = TARGET_VMAF if metric == "libvmaf" else TARGET_SSIM
+        choice, met = choose_prediction(predictions, target_mb, threshold)
+        return {"predictions": predictions, "choice": choice, "met": met, "metric": metric}
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds + 0.5), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+def describe_summary(summary):
+    parts = []
+    if summary["ratio"] is not None:
+        parts.append(f"{summary['ratio'] * 100:.0f}% of source")
+    if summary["source_seconds_per_second"]:
+        parts.append(f"{summary['mb_per_second']:.1f} MB/s, {summary['source_seconds_per_second']:.1f}x realtime")
+    if summary["eta"]:
+        parts.append(f"ETA {format_duration(summary['eta'])}")
+    return " • ".join(parts)
+
+
+def describe_event(event):
+    # One line of text per event for the CLI; None for events not worth printing
+    if event["type"] == "progress":
+        text = f"{event['fraction'] * 100:5.1f}%"
+        if event["speed"]:
+            text += f" • {event['speed']:.2f}x"
+        if event["fps"]:
+            text += f" • {event['fps']:.0f} fps"
+        if event["detail"]:
+            text += f" • {event['detail']}"
+        return text
+    if event["type"] == "status":
+        return event["message"]
+    if event["type"] == "batch":
+        text = f"[{event['finished']}/{event['total']}{'' if event['scan_done'] else '+'}]"
+        if event["message"]:
+            return f"{text} {event['message']}"
+        text = f"{text} {event['verb']}: " + ", ".join(
+            f"{name} ({value:.1f}%)" for name, value in sorted(event["active"].items()))
+        summary = describe_summary(event["summary"])
+        return f"{text} • {summary}" if summary else text
+    return None
+
+
+def run_interruptible(engine, target):
+    # Runs target on a worker so Ctrl+C in the main thread can cancel the engine cleanly
+    outcome = {}
+    
+    def worker():
+        try:
+            outcome["result"] = target()
+        except Exception as e:
+            outcome["error"] = str(e)
+    
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+    try:
+        while thread.is_alive():
+            thread.join(0.5)
+    except KeyboardInterrupt:
+        engine.cancel()
+        thread.join()
+    return outcome
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="compressor_engine",
+                                     description="Compress, convert or analyse videos without the GUI.")
+    parser.add_argument("--ffmpeg", default=shutil.which("ffmpeg"), help="path to ffmpeg (default: from PATH)")
+    parser.add_argument("--jobs", default="Auto", help="parallel encodes, or Auto (default)")
+    parser.add_argument("--json", action="store_true", help="print progress and results as JSON lines")
+    parser.add_argument("--max-threads", type=int, help="cap on encoder threads across all parallel jobs")
+    parser.add_argument("--low-priority", action="store_true", help="run encoders under nice/ionice")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="run fewer jobs while system load is high or memory is short")
+    parser.add_argument("--trace", metavar="PATH",
+                        help="write a Chrome/Perfetto trace of every pipeline stage to PATH, plus a summary table")
+    parser.add_argument("--no-dedupe", action="store_true",
+                        help="encode every copy of a duplicated input instead of linking to one encode")
+    parser.add_argument("--worker", action="append", default=[], metavar="HOST:PORT",
+                        help="also send batch encodes to a compressor_worker.py node (repeatable)")
+    parser.add_argument("--worker-token", help="shared secret the workers were started with")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    def add_encode_options(command):
+        command.add_argument("--preset", choices=list(PRESET_SETTINGS), default="balanced")
+        command.add_argument("--crf", type=int, help="CRF for the balanced preset (default 23)")
+        command.add_argument("--codec", choices=list(ENCODER_BACKENDS) + [AUTO_CODEC], default=DEFAULT_CODEC,
+                             help="encoder backend; auto picks the fastest measured one that fits --target-mb")
+        command.add_argument("--target-mb", type=float, help="fit each output to this size instead of a CRF")
+        command.add_argument("--max-height", type=int, help="downscale taller videos to this height")
+        command.add_argument("--max-fps", type=float, help="drop frames from videos above this frame rate")
+        command.add_argument("--drop-duplicates", action="store_true",
+                             help="drop repeated frames (static screen recordings); output is variable frame rate")
+        command.add_argument("--audio", choices=list(AUDIO_MODES), default="auto",
+                             help="auto copies compatible audio and sizes the rest from the source (default); "
+                                  "aac always re-encodes at 128k; none drops audio")
+        command.add_argument("--all-audio-tracks", action="store_true", help="keep every audio track, not just the first")
+        command.add_argument("--downmix", action="store_true", help="downmix surround audio to stereo")
+    
+    compress = commands.add_parser("compress", help="compress a video file or every video under a folder")
+    compress.add_argument("input")
+    compress.add_argument("-o", "--output", help="output file, or output folder for a folder input")
+    compress.add_argument("--segments", action="store_true", help="encode long single files in parallel segments")
+    add_encode_options(compress)
+    
+    convert = commands.add_parser("convert", help="change container, copying streams where possible")
+    convert.add_argument("input")
+    convert.add_argument("--to", required=True, choices=list(CONTAINER_CODECS))
+    convert.add_argument("-o", "--output", help="output folder for a folder input")
+    
+    watch = commands.add_parser("watch", help="keep compressing new videos that land in a folder until Ctrl+C")
+    watch.add_argument("input")
+    watch.add_argument("-o", "--output", help="output folder (default: INPUT/compressed)")
+    add_encode_options(watch)
+    
+    predict = commands.add_parser("predict", help="predict the CRF for a file from sample encodes")
+    predict.add_argument("input")
+    add_encode_options(predict)
+    return parser
+
+
+def settings_from_args(args):
+    return make_settings(args.preset, args.crf, args.codec, args.target_mb, args.max_height, args.max_fps,
+                         args.drop_duplicates, args.audio, args.all_audio_tracks, args.downmix)
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not args.ffmpeg or not os.path.exists(args.ffmpeg):
+        parser.error("FFmpeg not found; pass --ffmpeg")
+    if args.command != "convert" and args.target_mb is not None and args.target_mb <= 0:
+        parser.error("--target-mb must be positive")
+    if not os.path.exists(args.input):
+        parser.error(f"{args.input} does not exist")
+    if args.max_threads is not None and args.max_threads < 1:
+        parser.error("--max-threads must be at least 1")
+    for address in args.worker:
+        host, _, port = address.rpartition(":")
+        if not host or not port.isdigit():
+            parser.error(f"--worker needs HOST:PORT, not {address}")
+    
+    engine = CompressionEngine(args.ffmpeg, args.jobs)
+    engine.max_threads = args.max_threads
+    engine.low_priority = args.low_priority
+    engine.adaptive = args.adaptive
+    engine.dedupe = not args.no_dedupe
+    if args.trace:
+        engine.tracer = Tracer()
+    engine.worker_addresses = args.worker
+    engine.worker_token = args.worker_token
+    is_folder = os.path.isdir(args.input)
+    last_printed = [0]
+    
+    def on_event(event):
+        if args.json:
+            print(json.dumps(event), flush=True)
+            return
+        # Plain progress is throttled harder than the engine's rate; messages always print
+        now = time.monotonic()
+        if event.get("message") is None and now - last_printed[0] < 1:
+            return
+        last_printed[0] = now
+        text = describe_event(event)
+        if text:
+            print(text, file=sys.stderr, flush=True)
+    
+    if args.command == "compress":
+        settings = settings_from_args(args)
+        if is_folder:
+            output = args.output or os.path.join(args.input, "compressed")
+            target = lambda: engine.compress_batch(args.input, output, settings, on_event)
+        else:
+            stem, ext = os.path.splitext(args.input)
+            output = args.output or f"{stem}_compressed{ext}"
+            target = lambda: [engine.compress_file(args.input, output, settings, args.segments, on_event)]
+    elif args.command == "watch":
+        if not is_folder:
+            parser.error("watch needs a folder")
+        settings = settings_from_args(args)
+        output = args.output or os.path.join(args.input, "compressed")
+        target = lambda: engine.watch_folder(args.input, output, settings, on_event)
+    elif args.command == "convert":
+        if is_folder:
+            output = args.output or os.path.join(args.input, "converted")
+            target = lambda: engine.convert_batch(args.input, output, args.to, on_event)
+        else:
+            target = lambda: [engine.convert_single(args.input, args.to, on_event)]
+    else:
+        if is_folder:
+            parser.error("predict needs a single video file")
+        settings = settings_from_args(args)
+        target = lambda: engine.predict_crf(args.input, settings, on_event)
+    
+    outcome = run_interruptible(engine, target)
+    if engine.tracer:
+        summary_path = engine.tracer.write(args.trace)
+        print(engine.tracer.format_summary(), file=sys.stderr)
+        print(f"Trace written to {args.trace} (summary in {summary_path})", file=sys.stderr)
+    if args.command == "watch" and "error" not in outcome:
+        return 0  # Ctrl+C is the normal way to stop watching
+    if engine.cancelled:
+        print("Cancelled", file=sys.stderr)
+        return 130
+    if "error" in outcome:
+        print(f"Error: {outcome['error']}", file=sys.stderr)
+        return 1
+    
+    result = outcome["result"]
+    if args.command == "predict":
+        if args.json:
+            print(json.dumps(dict(result, type="result")), flush=True)
+        else:
+            for crf, size_mb, score in result["predictions"]:
+                print(f"CRF {crf}: ~{size_mb:.1f} MB" + ("" if score is None else f", score {score:.3f}"))
+            print(f"Selected: CRF {result['choice'][0]}" + ("" if result["met"] else " (target not reached)"))
+        return 0
+    
+    if not result:
+        print("No video files found", file=sys.stderr)
+        return 1
+    for item in result:
+        if args.json:
+            print(json.dumps(dict(item, type="result")), flush=True)
+        else:
+            print(f"{item['status']}: {item['input']} -> {item['output']}")
+            if item["status"] == "failed" and item["error"]:
+                print(f"  {item['error'].splitlines()[-1]}", file=sys.stderr)
+    if args.command == "compress" and is_folder:
+        summary = engine.batch_stats.summary()
+        if args.json:
+            print(json.dumps(dict(summary, type="summary")), flush=True)
+        elif summary["ratio"] is not None:
+            print(f"Total: {summary['input_bytes'] / (1024 * 1024):.1f} MB -> "
+                  f"{summary['output_bytes'] / (1024 * 1024):.1f} MB • {describe_summary(summary)}")
+    return 1 if any(item["status"] == "failed" for item in result) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,303 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+
+from compressor_engine import ENCODER_BACKENDS, WORKER_CHUNK_SIZE, WORKER_PROTOCOL, CompressionEngine
+
+# Finished jobs whose coordinator never came back for the output are dropped after this
+JOB_RETENTION_SECONDS = 3600
+# Reserved slots whose upload never started are freed after this
+RESERVATION_SECONDS = 60
+
+
+class WorkerJob:
+    def __init__(self, job_id, work_dir, extension, settings):
+        self.id = job_id
+        self.work_dir = work_dir
+        self.input_file = os.path.join(work_dir, f"input{extension}")
+        self.output_file = os.path.join(work_dir, f"output{extension}")
+        self.settings = settings
+        self.engine = None
+        self.status = "reserved"
+        self.reserved_at = time.monotonic()
+        self.fraction = 0.0
+        self.fps = None
+        self.speed = None
+        self.error = None
+        self.finished_at = None
+    
+    def describe(self):
+        return {"id": self.id, "status": self.status, "fraction": self.fraction, "fps": self.fps,
+                "speed": self.speed, "error": self.error}
+
+
+class EncodeWorker:
+    # Runs encodes for a remote coordinator, `slots` at a time, each in its own
+    # scratch folder. Settings arrive exactly as make_settings built them on the
+    # coordinator, so presets behave the same on every node
+    def __init__(self, ffmpeg_path, slots=1, work_dir=None, max_threads=None, low_priority=False):
+        self.ffmpeg_path = ffmpeg_path
+        self.slots = slots
+        self.work_dir = work_dir or tempfile.gettempdir()
+        self.max_threads = max_threads
+        self.low_priority = low_priority
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.ids = count(1)
+    
+    def busy(self):
+        return sum(1 for job in self.jobs.values() if job.status in ("reserved", "uploading", "running"))
+    
+    def health(self):
+        with self.lock:
+            return {"protocol": WORKER_PROTOCOL, "slots": self.slots, "busy": self.busy()}
+    
+    def create(self, extension, settings):
+        # Reserves a slot, or returns None when every slot is taken; the
+        # coordinator then backs off from this worker and tries another slot
+        with self.lock:
+            self.expire()
+            if self.busy() >= self.slots:
+                return None
+            job_id = f"{os.getpid()}-{next(self.ids)}"
+            job = WorkerJob(job_id, tempfile.mkdtemp(prefix=".worker_job_", dir=self.work_dir), extension, settings)
+            self.jobs[job_id] = job
+            return job
+    
+    def start(self, job):
+        # Returns False when the job was deleted while its input was uploading
+        engine = CompressionEngine(self.ffmpeg_path, 1)
+        engine.max_threads = self.max_threads
+        engine.low_priority = self.low_priority
+        with self.lock:
+            if self.jobs.get(job.id) is not job:
+                return False
+            job.engine = engine
+            job.status = "running"
+        threading.Thread(target=self.run, args=(job,), daemon=True).start()
+        return True
+    
+    def run(self, job):
+        def on_event(event):
+            if event["type"] == "progress":
+                job.fraction = event["fraction"]
+                job.fps = event["fps"]
+                job.speed = event["speed"]
+        
+        try:
+            result = job.engine.compress_file(job.input_file, job.output_file, job.settings, on_event=on_event)
+            status, error = result["status"], result["error"]
+        except Exception as e:
+            status, error = "failed", str(e)
+        # The upload isn't needed any more; only the output waits for collection
+        try:
+            os.remove(job.input_file)
+        except OSError:
+            pass
+        # busy(), expire() and remove() read these under the lock, so they change together
+        with self.lock:
+            job.status = status
+            job.error = error
+            if status == "success":
+                job.fraction = 1.0
+            job.finished_at = time.monotonic()
+    
+    def begin_upload(self, job):
+        # Only a reservation can take an upload, and only once
+        with self.lock:
+            if job.status != "reserved":
+                return False
+            job.status = "uploading"
+            return True
+    
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+    
+    def remove(self, job_id):
+        with self.lock:
+            job = self.jobs.pop(job_id, None)
+            running = job is not None and job.engine is not None and job.status == "running"
+        if job is None:
+            return False
+        if running:
+            job.engine.cancel()
+        shutil.rmtree(job.work_dir, ignore_errors=True)
+        return True
+    
+    def expire(self):
+        now = time.monotonic()
+        for job_id, job in list(self.jobs.items()):
+            finished = job.finished_at is not None and now - job.finished_at > JOB_RETENTION_SECONDS
+            abandoned = job.status == "reserved" and now - job.reserved_at > RESERVATION_SECONDS
+            if finished or abandoned:
+                del self.jobs[job_id]
+                shutil.rmtree(job.work_dir, ignore_errors=True)
+
+
+class WorkerHandler(BaseHTTPRequestHandler):
+    worker = None
+    token = None
+    verbose = False
+    
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+    
+    def reply(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def authorized(self):
+        if self.token and self.headers.get("X-Worker-Token") != self.token:
+            self.reply(403, {"error": "bad or missing worker token"})
+            return False
+        return True
+    
+    def route(self):
+        # Returns (job, tail) for /jobs/<id>[/tail] paths
+        parts = self.path.strip("/").split("/")
+        if len(parts) < 2 or parts[0] != "jobs":
+            return None, None
+        return self.worker.get(parts[1]), "/".join(parts[2:])
+    
+    def do_GET(self):
+        if not self.authorized():
+            return
+        if self.path == "/health":
+            self.reply(200, self.worker.health())
+            return
+        job, tail = self.route()
+        if job is None:
+            self.reply(404, {"error": "no such job"})
+        elif tail == "":
+            self.reply(200, job.describe())
+        elif tail == "output" and job.status == "success":
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(os.path.getsize(job.output_file)))
+            self.end_headers()
+            with open(job.output_file, "rb") as f:
+                shutil.copyfileobj(f, self.wfile, WORKER_CHUNK_SIZE)
+        else:
+            self.reply(404, {"error": "no output for this job"})
+    
+    def do_POST(self):
+        # Reserves a slot; the input follows as PUT /jobs/<id>/input
+        if not self.authorized():
+            return
+        if self.path != "/jobs":
+            self.reply(404, {"error": "unknown path"})
+            return
+        try:
+            settings = json.loads(self.headers["X-Settings"])
+            extension = self.headers.get("X-Extension", ".mp4")
+        except (TypeError, ValueError):
+            self.reply(400, {"error": "needs X-Settings and X-Extension headers"})
+            return
+        # The extension ends up in a file name and the codec picks an encoder backend
+        if settings.get("codec") not in ENCODER_BACKENDS or not extension.startswith(".") or \
+                os.path.basename(extension) != extension:
+            self.reply(400, {"error": "unsupported codec or extension"})
+            return
+        
+        job = self.worker.create(extension, settings)
+        if job is None:
+            self.reply(503, {"error": "all slots busy"})
+            return
+        self.reply(201, job.describe())
+    
+    def do_PUT(self):
+        if not self.authorized():
+            return
+        job, tail = self.route()
+        if job is None or tail != "input":
+            self.close_connection = True
+            self.reply(404, {"error": "no such job"})
+            return
+        try:
+            length = int(self.headers["Content-Length"])
+        except (TypeError, ValueError):
+            self.reply(400, {"error": "needs a Content-Length header"})
+            return
+        if not self.worker.begin_upload(job):
+            # The body is left unread, so drop the connection rather than reuse it
+            self.close_connection = True
+            self.reply(409, {"error": "job is not waiting for its input"})
+            return
+        try:
+            with open(job.input_file, "wb") as f:
+                remaining = length
+                while remaining:
+                    chunk = self.rfile.read(min(remaining, WORKER_CHUNK_SIZE))
+                    if not chunk:
+                        raise OSError("upload ended early")
+                    f.write(chunk)
+                    remaining -= len(chunk)
+        except OSError as e:
+            self.worker.remove(job.id)
+            self.reply(400, {"error": str(e)})
+            return
+        if not self.worker.start(job):
+            self.reply(404, {"error": "job was deleted during the upload"})
+            return
+        self.reply(200, job.describe())
+    
+    def do_DELETE(self):
+        if not self.authorized():
+            return
+        job, _ = self.route()
+        if job is None or not self.worker.remove(job.id):
+            self.reply(404, {"error": "no such job"})
+            return
+        self.reply(200, {"id": job.id, "status": "removed"})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="compressor_worker",
+                                     description="Serve batch encodes for a coordinator started with --worker.")
+    parser.add_argument("--ffmpeg", default=shutil.which("ffmpeg"), help="path to ffmpeg (default: from PATH)")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: localhost only)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--slots", type=int, default=1, help="encodes to run at once (default 1)")
+    parser.add_argument("--work-dir", help="scratch folder for uploads and outputs (default: system temp)")
+    parser.add_argument("--token", help="shared secret coordinators must send")
+    parser.add_argument("--max-threads", type=int, help="cap on encoder threads per encode")
+    parser.add_argument("--low-priority", action="store_true", help="run encoders under nice/ionice")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+    
+    if not args.ffmpeg or not os.path.exists(args.ffmpeg):
+        parser.error("FFmpeg not found; pass --ffmpeg")
+    if args.slots < 1:
+        parser.error("--slots must be at least 1")
+    if args.work_dir:
+        os.makedirs(args.work_dir, exist_ok=True)
+    
+    WorkerHandler.worker = EncodeWorker(args.ffmpeg, args.slots, args.work_dir, args.max_threads, args.low_priority)
+    WorkerHandler.token = args.token
+    WorkerHandler.verbose = args.verbose
+    server = ThreadingHTTPServer((args.host, args.port), WorkerHandler)
+    print(f"Worker listening on {args.host}:{args.port} with {args.slots} slot(s)", file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,321 @@
+import os
+import threading
+import time
+
+import pytest
+
+import compressor_engine
+from compressor_benchmark import compare_to_baseline
+from compressor_engine import (PRIORITY_LOW, PRIORITY_URGENT, BatchStats, DuplicateTracker, JobDeferred, JobQueue,
+                               PassLogCache, ProgressEvent, VideoCandidate, choose_prediction, container_accepts,
+                               fingerprint_file, get_sample_plan, make_settings, plan_audio, plan_conversion,
+                               read_progress, summarize_predictions)
+
+
+def test_sample_plan_scales_with_duration():
+    # A clip shorter than one sample is encoded whole
+    assert get_sample_plan(1.5) == ([0.0], 1.5)
+    # Short clips get a single short sample from the middle
+    assert get_sample_plan(10) == ([4.0], 2)
+    starts, seconds = get_sample_plan(120)
+    assert len(starts) == 2 and seconds == pytest.approx(2.4)
+    # Long sources cap out at five 4 second samples spread across the file
+    starts, seconds = get_sample_plan(3600)
+    assert len(starts) == 5 and seconds == 4
+    assert starts[0] > 0 and starts[-1] + seconds < 3600
+
+
+def test_summarize_predictions_scales_samples_to_whole_file():
+    mb = 1024 * 1024
+    results = [(23, 2 * mb, 4, 94.0), (23, 4 * mb, 4, 92.0),
+               (18, 6 * mb, 4, 97.0), (18, 6 * mb, 4, None)]
+    predictions = summarize_predictions(results, 100, 0)
+    # 6 MB over 8 seconds of samples is 0.75 MB/s, so 75 MB for 100 seconds
+    assert predictions == [(18, pytest.approx(150.0), 97.0), (23, pytest.approx(75.0), 93.0)]
+
+
+def test_summarize_predictions_adds_audio():
+    predictions = summarize_predictions([(20, 0, 1, None)], 8 * 1024 * 1024 / 128000, 128)
+    assert predictions == [(20, pytest.approx(1.0), None)]
+
+
+def test_choose_prediction_for_target_size():
+    predictions = [(18, 120.0, None), (23, 60.0, None), (28, 30.0, None)]
+    assert choose_prediction(predictions, target_mb=70) == ((23, 60.0, None), True)
+    # Nothing fits, so take the smallest file
+    assert choose_prediction(predictions, target_mb=10) == ((28, 30.0, None), False)
+
+
+def test_choose_prediction_for_quality():
+    predictions = [(18, 120.0, 97.0), (23, 60.0, 94.0), (28, 30.0, 88.0)]
+    assert choose_prediction(predictions, threshold=93.0) == ((23, 60.0, 94.0), True)
+    # Nothing passes, so take the best quality we tried
+    assert choose_prediction(predictions, threshold=99.0) == ((18, 120.0, 97.0), False)
+    # Missing scores never count as passing
+    assert choose_prediction([(18, 120.0, None)], threshold=0.9) == ((18, 120.0, None), False)
+
+
+def probe(audio=(), subtitles=(), video_codec="h264"):
+    # Probe info shaped like parse_ffprobe's, with streams numbered after the video
+    tracks = [{"index": i + 1, "codec": codec, "channels": channels, "bit_rate": bit_rate, "sample_rate": 48000}
+              for i, (codec, channels, bit_rate) in enumerate(audio)]
+    subs = [{"index": len(tracks) + i + 1, "codec": codec} for i, codec in enumerate(subtitles)]
+    return {"duration": 60.0, "video": {"index": 0, "codec": video_codec, "height": 1080}, "audio": tracks,
+            "subtitles": subs}
+
+
+def test_container_accepts():
+    assert container_accepts("mp4", "video", "hevc")
+    assert not container_accepts("webm", "video", "h264")
+    assert container_accepts("mkv", "audio", "dts")
+    assert not container_accepts("avi", "subtitle", "subrip")
+    # Unknown containers accept nothing, so everything gets re-encoded
+    assert not container_accepts("xyz", "video", "h264")
+
+
+def test_plan_audio_copies_small_compatible_tracks():
+    args, kbps = plan_audio(make_settings(), probe([("aac", 2, 128000)]), "out.mp4")
+    assert args == ["-map", "0:1", "-c:a:0", "copy"]
+    assert kbps == 128
+
+
+def test_plan_audio_never_raises_the_source_bitrate():
+    args, kbps = plan_audio(make_settings(all_audio_tracks=True), probe([("aac", 2, 96000), ("mp3", 2, 64000)]),
+                            "out.webm")
+    assert args == ["-map", "0:1", "-c:a:0", "libopus", "-b:a:0", "96k",
+                    "-map", "0:2", "-c:a:1", "libopus", "-b:a:1", "64k"]
+    assert kbps == 160
+
+
+def test_plan_audio_modes():
+    info = probe([("ac3", 6, 448000)])
+    assert plan_audio(make_settings(audio_mode="none"), info, "out.mp4") == (["-an"], 0)
+    assert plan_audio(make_settings(downmix=True), info, "out.mkv") == (
+        ["-map", "0:1", "-c:a:0", "aac", "-b:a:0", "128k", "-ac:a:0", "2"], 128)
+    # Without stream details the fixed AAC re-encode is the only safe choice
+    assert plan_audio(make_settings(), None, "out.mp4") == (["-c:a", "aac", "-b:a", "128k"], 128)
+
+
+def test_plan_conversion_copies_what_fits_and_keeps_every_track():
+    info = probe([("aac", 2, 128000), ("dts", 6, 1500000)], ["subrip", "hdmv_pgs_subtitle"], "hevc")
+    args, actions = plan_conversion(info, "mp4")
+    assert args == ["-map", "0:0", "-c:v", "copy", "-tag:v", "hvc1",
+                    "-map", "0:1", "-c:a:0", "copy", "-map", "0:2", "-c:a:1", "aac",
+                    "-map", "0:3", "-c:s:0", "mov_text", "-movflags", "+faststart"]
+    assert "audio 2 re-encoded (dts → aac)" in actions
+    assert "hdmv_pgs_subtitle can't go in .mp4" in actions
+
+
+def test_plan_conversion_without_probe_reencodes():
+    args, actions = plan_conversion({"video": None, "audio": [], "subtitles": []}, "webm")
+    assert args[:2] == ["-c:v", "libvpx-vp9"] and args[-2:] == ["-c:a", "libopus"]
+    assert actions == "streams re-encoded"
+
+
+def test_read_progress_blocks():
+    lines = ["frame=10\n", "fps=N/A\n", "out_time_us=N/A\n", "speed=N/A\n", "progress=continue\n",
+             "frame=250\n", "fps=49.5\n", "out_time_ms=10000000\n", "total_size=1024\n", "bitrate=812.3kbits/s\n",
+             "speed=1.98x\n", "progress=end\n"]
+    first, last = read_progress(iter(lines))
+    assert first == ProgressEvent(10, None, 0, None, None, None, False)
+    assert last == ProgressEvent(250, 49.5, 10000000, 1024, 812.3, 1.98, True)
+    assert last.out_time == 10
+
+
+def test_read_progress_keeps_last_out_time():
+    # out_time_us goes negative or N/A around seeks; the last good value stands
+    events = list(read_progress(iter(["out_time_us=5000000", "progress=continue",
+                                      "out_time_us=-1", "progress=continue"])))
+    assert [event.out_time for event in events] == [5, 5]
+
+
+def record(status="success", input_bytes=100, output_bytes=25, duration=60.0, encode_seconds=30.0,
+           resolution="1080p"):
+    return {"status": status, "input_bytes": input_bytes, "output_bytes": output_bytes, "duration": duration,
+            "encode_seconds": encode_seconds, "resolution": resolution}
+
+
+def test_batch_stats_summary_and_eta():
+    stats = BatchStats()
+    stats.add("a.mp4", record())
+    stats.add("b.mp4", record(status="failed", output_bytes=None, encode_seconds=None))
+    stats.start_job("c.mp4", probe())
+    summary = stats.summary(active={"c.mp4": 50.0}, queued_sizes=[200], workers=2)
+    assert summary["files"] == 2
+    assert summary["ratio"] == 0.25
+    assert summary["predicted_output_bytes"] == 75
+    # c has 30 s of 1080p left at 2x, the queued file looks like 120 s at 2x
+    assert summary["eta"] == pytest.approx(60)
+
+
+def test_batch_stats_eta_unknown_without_speeds():
+    stats = BatchStats()
+    assert stats.summary(queued_sizes=[100])["eta"] is None
+    assert stats.summary()["eta"] == 0.0
+
+
+def make_queue(workers=1):
+    return JobQueue(workers, lambda job: job.run(job.candidate))
+
+
+def candidate(name):
+    return VideoCandidate(name, name, 1, 0)
+
+
+def run_in_order(order, started, gate):
+    # The first job holds the only worker until the gate opens, so the rest queue up
+    def run(item):
+        if item.path == "first":
+            started.set()
+            gate.wait(5)
+        order.append(item.path)
+        return {"status": "success", "input": item.path, "output": None, "error": None}
+    return run
+
+
+def test_job_queue_runs_by_priority_then_submission():
+    order = []
+    started, gate = threading.Event(), threading.Event()
+    queue = make_queue()
+    run = run_in_order(order, started, gate)
+    jobs = [queue.submit(candidate("first"), run)]
+    started.wait(5)
+    jobs.append(queue.submit(candidate("low"), run, PRIORITY_LOW))
+    jobs.append(queue.submit(candidate("normal"), run))
+    jobs.append(queue.submit(candidate("urgent"), run, PRIORITY_URGENT))
+    jobs.append(queue.submit(candidate("normal later"), run))
+    gate.set()
+    assert [queue.wait(job)["status"] for job in jobs] == ["success"] * 5
+    queue.close()
+    assert order == ["first", "urgent", "normal", "normal later", "low"]
+
+
+def test_job_queue_pause_and_cancel():
+    order = []
+    started, gate = threading.Event(), threading.Event()
+    queue = make_queue()
+    run = run_in_order(order, started, gate)
+    first = queue.submit(candidate("first"), run)
+    started.wait(5)
+    held = queue.submit(candidate("held"), run)
+    dropped = queue.submit(candidate("dropped"), run)
+    last = queue.submit(candidate("last"), run)
+    assert queue.pause(held.id)
+    assert queue.cancel(dropped.id)
+    assert queue.wait(dropped)["status"] == "cancelled"
+    gate.set()
+    queue.wait(first)
+    queue.wait(last)
+    assert order == ["first", "last"]
+    assert not held.done.is_set()
+    assert queue.resume(held.id)
+    assert queue.wait(held)["status"] == "success"
+    queue.close()
+    assert order == ["first", "last", "held"]
+
+
+def test_job_queue_deferred_job_frees_its_worker():
+    order = []
+    event = threading.Event()
+    queue = make_queue()
+    
+    def run(item):
+        if item.path == "waiter" and not event.is_set():
+            raise JobDeferred(event)
+        order.append(item.path)
+        if item.path == "other":
+            event.set()
+        return {"status": "success", "input": item.path, "output": None, "error": None}
+    
+    waiter = queue.submit(candidate("waiter"), run)
+    other = queue.submit(candidate("other"), run)
+    assert queue.wait(waiter)["status"] == "success"
+    assert queue.wait(other)["status"] == "success"
+    queue.close()
+    assert order == ["other", "waiter"]
+
+
+def touch(path, size=10, age=0, content=None):
+    path.write_bytes(content if content is not None else b"x" * size)
+    when = time.time() - age
+    os.utime(path, (when, when))
+    return path
+
+
+def test_passlog_prune(tmp_path):
+    source = touch(tmp_path / "source.mp4")
+    cache_dir = tmp_path / "passlogs"
+    cache_dir.mkdir()
+    
+    def entry(name, size, age, source_path=source):
+        touch(cache_dir / f"{name}-0.log", size, age)
+        (cache_dir / f"{name}.source").write_text(str(source_path))
+        os.utime(cache_dir / f"{name}.source", (time.time() - age, time.time() - age))
+    
+    entry("gone", 10, 0, tmp_path / "deleted.mp4")
+    entry("stale", 10, 40 * 24 * 3600)
+    entry("old", 60, 300)
+    entry("new", 60, 100)
+    entry("keep", 60, 500)
+    touch(cache_dir / "running.partial-0.log", 60, 1000)
+    
+    # Fits keep, new and the running pass 1, but not old as well
+    cache = PassLogCache(str(cache_dir), max_bytes=240 + 2 * len(str(source)))
+    cache.prune(keep=str(cache_dir / "keep"))
+    left = sorted(os.listdir(cache_dir))
+    # Missing sources and stale entries go first, then the least recently used
+    # until it fits; the kept entry and a running pass 1 are never evicted
+    assert left == ["keep-0.log", "keep.source", "new-0.log", "new.source", "running.partial-0.log"]
+
+
+def test_fingerprint_tracks_content_not_name(tmp_path):
+    a = touch(tmp_path / "a.mp4", content=b"same bytes")
+    b = touch(tmp_path / "b.mkv", content=b"same bytes")
+    c = touch(tmp_path / "c.mp4", content=b"other byte")
+    assert fingerprint_file(str(a)) == fingerprint_file(str(b))
+    assert fingerprint_file(str(a)) != fingerprint_file(str(c))
+    assert fingerprint_file(str(a)).startswith("10-")
+
+
+def test_duplicate_tracker_groups_copies(tmp_path):
+    a = str(touch(tmp_path / "a.mp4", content=b"same bytes"))
+    b = str(touch(tmp_path / "b.mp4", content=b"same bytes"))
+    tracker = DuplicateTracker()
+    fingerprint = fingerprint_file(a)
+    group, representative = tracker.claim(fingerprint, a)
+    assert representative
+    assert tracker.claim(fingerprint, b) == (group, False)
+    # A failed representative takes no new members, so the copy encodes itself
+    tracker.resolve(group, None)
+    other, representative = tracker.claim(fingerprint, b)
+    assert representative and other is not group
+
+
+def test_duplicate_tracker_hashes_sampled_fingerprints(tmp_path, monkeypatch):
+    # Sampled fingerprints can't see an edit between samples; the full hash can
+    monkeypatch.setattr(compressor_engine, "FINGERPRINT_SAMPLE_SIZE", 4)
+    a = str(touch(tmp_path / "a.mp4", content=b"a" * 100))
+    b = str(touch(tmp_path / "b.mp4", content=b"a" * 20 + b"b" + b"a" * 79))
+    fingerprint = fingerprint_file(a, sample_size=4)
+    assert fingerprint == fingerprint_file(b, sample_size=4)
+    tracker = DuplicateTracker()
+    first, _ = tracker.claim(fingerprint, a)
+    second, representative = tracker.claim(fingerprint, b)
+    assert representative and second is not first
+
+
+def benchmark_result(returncode=0, fps=100.0, output_bytes=1000, clip="clip", codec="libx264"):
+    return {"clip": clip, "preset": "balanced", "codec": codec, "returncode": returncode, "fps": fps,
+            "output_bytes": output_bytes}
+
+
+def test_compare_to_baseline():
+    baseline = [benchmark_result(), benchmark_result(codec="libx265"), benchmark_result(clip="dropped")]
+    # Within tolerance, plus a combination the baseline doesn't have yet
+    assert compare_to_baseline([benchmark_result(fps=95.0, output_bytes=1040),
+                                benchmark_result(clip="new", fps=1.0)], baseline) == []
+    regressions = compare_to_baseline([benchmark_result(fps=80.0, output_bytes=1100),
+                                       benchmark_result(codec="libx265", returncode=1)], baseline)
+    assert regressions == ["clip/balanced/libx264: 80.0 fps vs 100.0 baseline",
+                           "clip/balanced/libx264: 1100 bytes vs 1000 baseline",
+                           "clip/balanced/libx265: encode now fails (exit 1)"]
@@ -1,11 +1,14 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import subprocess
 import threading
 import os
-import re
+import time
 from pathlib import Path
-import glob
+
+from compressor_engine import (CompressionEngine, ENCODER_BACKENDS, PRIORITY_URGENT, CAN_SUSPEND, MAX_HEIGHT_CHOICES,
+                               MAX_FPS_CHOICES, AUDIO_MODES, AUTO_CODEC, AUTO_CODEC_LABEL, DEFAULT_CODEC, Tracer,
+                               describe_summary, make_settings, scan_videos)
+
 
 class VideoCompressor:
     def __init__(self, root):
@@ -43,8 +46,27 @@ class VideoCompressor:
         
         # Batch processing
         self.current_file_progress = tk.DoubleVar()
-        self.batch_files = []
-        self.current_batch_index = 0
+        self.batch_results = []
+        self.files_count_token = 0
+        self.parallel_jobs = tk.StringVar(value="Auto")
+        self.segment_parallel = tk.BooleanVar(value=False)
+        self.watch_folder = tk.BooleanVar(value=False)
+        self.share_machine = tk.BooleanVar(value=False)
+        self.dedupe_inputs = tk.BooleanVar(value=True)
+        self.record_trace = tk.BooleanVar(value=False)
+        self.video_codec = tk.StringVar(value=ENCODER_BACKENDS[DEFAULT_CODEC].label)
+        self.target_size_enabled = tk.BooleanVar(value=False)
+        self.target_size_mb = tk.StringVar(value="25")
+        self.max_height = tk.StringVar(value="Original")
+        self.max_fps = tk.StringVar(value="Original")
+        self.drop_duplicates = tk.BooleanVar(value=False)
+        self.audio_mode = tk.StringVar(value=AUDIO_MODES["auto"])
+        self.all_audio_tracks = tk.BooleanVar(value=False)
+        self.downmix = tk.BooleanVar(value=False)
+        
+        # All encoding runs in the engine; it keeps probe results, encoder
+        # stats and the quality metric between jobs
+        self.engine = CompressionEngine(self.ffmpeg_path.get())
         
         self.setup_styles()
         self.create_widgets()
@@ -102,6 +124,22 @@ class VideoCompressor:
         style.map("Custom.Vertical.TScrollbar",
                   background=[('active', self.accent), ('pressed', self.accent_hover)])
         
+        # Job queue view
+        style.configure("Dark.Treeview",
+                       background=self.bg_tertiary,
+                       fieldbackground=self.bg_tertiary,
+                       foreground=self.text_primary,
+                       borderwidth=0,
+                       font=("Segoe UI", 9))
+        style.configure("Dark.Treeview.Heading",
+                       background=self.bg_secondary,
+                       foreground=self.text_secondary,
+                       relief="flat",
+                       font=("Segoe UI", 9, "bold"))
+        style.map("Dark.Treeview",
+                  background=[('selected', self.accent_hover)],
+                  foreground=[('selected', self.bg_primary)])
+        
     def create_widgets(self):
         # Create main canvas and scrollbar
         self.canvas = tk.Canvas(self.root, bg=self.bg_primary, highlightthickness=0)
@@ -171,6 +209,25 @@ class VideoCompressor:
         ffmpeg_btn.bind("<Enter>", lambda e: ffmpeg_btn.config(bg=self.accent_hover))
         ffmpeg_btn.bind("<Leave>", lambda e: ffmpeg_btn.config(bg=self.accent))
         
+        trace_frame = tk.Frame(ffmpeg_inner, bg=self.bg_secondary)
+        trace_frame.pack(fill="x", pady=(10, 0))
+        
+        trace_check = tk.Checkbutton(trace_frame,
+                                     text="Record a performance trace (for bug reports)",
+                                     variable=self.record_trace,
+                                     bg=self.bg_secondary,
+                                     fg=self.text_primary,
+                                     selectcolor=self.bg_tertiary,
+                                     activebackground=self.bg_secondary,
+                                     activeforeground=self.text_primary,
+                                     font=("Segoe UI", 9),
+                                     relief="flat",
+                                     cursor="hand2")
+        trace_check.pack(side="left")
+        
+        self.trace_label = ttk.Label(trace_frame, text="", style="Small.TLabel")
+        self.trace_label.pack(side="left", padx=(10, 0))
+        
         # Mode Selection Card
         mode_card = ttk.Frame(self.main_frame, style="Card.TFrame")
         mode_card.pack(fill="x", pady=(0, 15))
@@ -268,6 +325,67 @@ class VideoCompressor:
         for i in range(4):
             presets_frame.grid_columnconfigure(i, weight=1)
         
+        codec_frame = tk.Frame(preset_inner, bg=self.bg_secondary)
+        codec_frame.pack(fill="x", pady=(15, 0))
+        
+        ttk.Label(codec_frame, text="Video codec:", style="Dark.TLabel").pack(side="left")
+        
+        self.codec_combo = ttk.Combobox(codec_frame,
+                                        values=[backend.label for backend in ENCODER_BACKENDS.values()] +
+                                               [AUTO_CODEC_LABEL],
+                                        textvariable=self.video_codec, state="readonly", width=18)
+        self.codec_combo.pack(side="left", padx=(10, 0))
+        self.codec_combo.bind("<<ComboboxSelected>>", lambda e: self.update_codec_stats_label())
+        
+        self.codec_stats_label = ttk.Label(codec_frame, text="", style="Small.TLabel")
+        self.codec_stats_label.pack(side="left", padx=(10, 0))
+        self.update_codec_stats_label()
+        
+        scale_frame = tk.Frame(preset_inner, bg=self.bg_secondary)
+        scale_frame.pack(fill="x", pady=(10, 0))
+        
+        ttk.Label(scale_frame, text="Max resolution:", style="Dark.TLabel").pack(side="left")
+        ttk.Combobox(scale_frame, values=["Original"] + [f"{height}p" for height in MAX_HEIGHT_CHOICES],
+                     textvariable=self.max_height, state="readonly", width=9).pack(side="left", padx=(10, 0))
+        
+        ttk.Label(scale_frame, text="Max fps:", style="Dark.TLabel").pack(side="left", padx=(15, 0))
+        ttk.Combobox(scale_frame, values=["Original"] + [str(fps) for fps in MAX_FPS_CHOICES],
+                     textvariable=self.max_fps, state="readonly", width=9).pack(side="left", padx=(10, 0))
+        
+        dedupe_check = tk.Checkbutton(scale_frame,
+                                      text="Drop duplicate frames (screen recordings)",
+                                      variable=self.drop_duplicates,
+                                      bg=self.bg_secondary,
+                                      fg=self.text_primary,
+                                      selectcolor=self.bg_tertiary,
+                                      activebackground=self.bg_secondary,
+                                      activeforeground=self.text_primary,
+                                      font=("Segoe UI", 9),
+                                      relief="flat",
+                                      cursor="hand2")
+        dedupe_check.pack(side="left", padx=(15, 0))
+        
+        audio_frame = tk.Frame(preset_inner, bg=self.bg_secondary)
+        audio_frame.pack(fill="x", pady=(10, 0))
+        
+        ttk.Label(audio_frame, text="Audio:", style="Dark.TLabel").pack(side="left")
+        ttk.Combobox(audio_frame, values=list(AUDIO_MODES.values()),
+                     textvariable=self.audio_mode, state="readonly", width=22).pack(side="left", padx=(10, 0))
+        
+        for text, variable in (("Keep all audio tracks", self.all_audio_tracks),
+                               ("Downmix surround to stereo", self.downmix)):
+            tk.Checkbutton(audio_frame,
+                           text=text,
+                           variable=variable,
+                           bg=self.bg_secondary,
+                           fg=self.text_primary,
+                           selectcolor=self.bg_tertiary,
+                           activebackground=self.bg_secondary,
+                           activeforeground=self.text_primary,
+                           font=("Segoe UI", 9),
+                           relief="flat",
+                           cursor="hand2").pack(side="left", padx=(15, 0))
+        
         # Quality Card
         quality_card = ttk.Frame(self.main_frame, style="Card.TFrame")
         quality_card.pack(fill="x", pady=(0, 15))
@@ -301,6 +419,54 @@ class VideoCompressor:
         tk.Label(quality_hints, text="Better Quality", bg=self.bg_secondary, fg=self.text_secondary, font=("Segoe UI", 8)).pack(side="left")
         tk.Label(quality_hints, text="Smaller Size", bg=self.bg_secondary, fg=self.text_secondary, font=("Segoe UI", 8)).pack(side="right")
         
+        target_frame = tk.Frame(quality_inner, bg=self.bg_secondary)
+        target_frame.pack(fill="x", pady=(15, 0))
+        
+        target_check = tk.Checkbutton(target_frame,
+                                      text="Fit to target size (two-pass, ignores CRF):",
+                                      variable=self.target_size_enabled,
+                                      bg=self.bg_secondary,
+                                      fg=self.text_primary,
+                                      selectcolor=self.bg_tertiary,
+                                      activebackground=self.bg_secondary,
+                                      activeforeground=self.text_primary,
+                                      font=("Segoe UI", 9),
+                                      relief="flat",
+                                      cursor="hand2")
+        target_check.pack(side="left")
+        
+        target_entry = tk.Entry(target_frame,
+                                textvariable=self.target_size_mb,
+                                bg=self.bg_tertiary,
+                                fg=self.text_primary,
+                                insertbackground=self.text_primary,
+                                relief="flat",
+                                width=8,
+                                font=("Segoe UI", 10))
+        target_entry.pack(side="left", padx=(10, 5), ipady=4)
+        
+        tk.Label(target_frame, text="MB", bg=self.bg_secondary, fg=self.text_secondary, font=("Segoe UI", 9)).pack(side="left")
+        
+        predict_frame = tk.Frame(quality_inner, bg=self.bg_secondary)
+        predict_frame.pack(fill="x", pady=(15, 0))
+        
+        self.predict_btn = tk.Button(predict_frame,
+                                     text="PREDICT CRF",
+                                     bg=self.accent,
+                                     fg=self.bg_primary,
+                                     relief="flat",
+                                     font=("Segoe UI", 9, "bold"),
+                                     padx=15,
+                                     cursor="hand2",
+                                     command=self.start_crf_prediction)
+        self.predict_btn.pack(side="left")
+        self.predict_btn.bind("<Enter>", lambda e: self.predict_btn.config(bg=self.accent_hover) if not self.is_processing else None)
+        self.predict_btn.bind("<Leave>", lambda e: self.predict_btn.config(bg=self.accent) if not self.is_processing else None)
+        
+        self.predict_label = ttk.Label(predict_frame, text="Encode short samples to pick the cheapest CRF for your target",
+                                       style="Small.TLabel")
+        self.predict_label.pack(side="left", padx=(10, 0))
+        
         # Format Conversion Card
         self.create_convert_section()
         
@@ -331,6 +497,33 @@ class VideoCompressor:
                                                         variable=self.current_file_progress,
                                                         maximum=100)
         
+        # Job queue (for batch mode)
+        self.queue_frame = tk.Frame(progress_inner, bg=self.bg_secondary)
+        
+        self.queue_tree = ttk.Treeview(self.queue_frame, columns=("file", "priority", "status", "progress"),
+                                       show="headings", height=6, style="Dark.Treeview")
+        for column, heading, width in (("file", "File", 320), ("priority", "Priority", 70),
+                                       ("status", "Status", 90), ("progress", "Progress", 80)):
+            self.queue_tree.heading(column, text=heading)
+            self.queue_tree.column(column, width=width, stretch=column == "file")
+        self.queue_tree.pack(fill="x")
+        
+        queue_buttons = tk.Frame(self.queue_frame, bg=self.bg_secondary)
+        queue_buttons.pack(fill="x", pady=(5, 0))
+        
+        pause_text = "Pause" if CAN_SUSPEND else "Hold"
+        for text, command in (("Run Next", self.prioritize_selected_jobs), (pause_text, self.pause_selected_jobs),
+                              ("Resume", self.resume_selected_jobs), ("Cancel Job", self.cancel_selected_jobs)):
+            tk.Button(queue_buttons,
+                      text=text,
+                      bg=self.bg_tertiary,
+                      fg=self.text_primary,
+                      relief="flat",
+                      font=("Segoe UI", 9),
+                      padx=12,
+                      cursor="hand2",
+                      command=command).pack(side="left", padx=(0, 5))
+        
         # Compress Button Container
         button_container = tk.Frame(self.main_frame, bg=self.bg_primary)
         button_container.pack(fill="x", pady=(10, 30))
@@ -446,6 +639,19 @@ class VideoCompressor:
         save_btn.bind("<Enter>", lambda e: save_btn.config(bg=self.accent_hover))
         save_btn.bind("<Leave>", lambda e: save_btn.config(bg=self.accent))
         
+        segment_check = tk.Checkbutton(single_output_inner,
+                                       text="Split long videos into segments and encode them in parallel",
+                                       variable=self.segment_parallel,
+                                       bg=self.bg_secondary,
+                                       fg=self.text_primary,
+                                       selectcolor=self.bg_tertiary,
+                                       activebackground=self.bg_secondary,
+                                       activeforeground=self.text_primary,
+                                       font=("Segoe UI", 9),
+                                       relief="flat",
+                                       cursor="hand2")
+        segment_check.pack(anchor="w", pady=(10, 0))
+        
     def create_batch_mode_widgets(self):
         # Batch Mode Input Folder Card
         self.batch_input_card = ttk.Frame(self.io_container, style="Card.TFrame")
@@ -516,6 +722,59 @@ class VideoCompressor:
         # Files count label
         self.files_count_label = ttk.Label(batch_output_inner, text="", style="Small.TLabel")
         self.files_count_label.pack(anchor="w", pady=(10, 0))
+        
+        # Parallel jobs selector
+        jobs_frame = tk.Frame(batch_output_inner, bg=self.bg_secondary)
+        jobs_frame.pack(fill="x", pady=(10, 0))
+        
+        ttk.Label(jobs_frame, text="Parallel jobs:", style="Dark.TLabel").pack(side="left")
+        
+        cpu_count = os.cpu_count() or 1
+        jobs_values = ["Auto"] + [str(n) for n in range(1, cpu_count + 1)]
+        self.parallel_jobs_combo = ttk.Combobox(jobs_frame, values=jobs_values, textvariable=self.parallel_jobs,
+                                                state="readonly", width=8)
+        self.parallel_jobs_combo.pack(side="left", padx=(10, 0))
+        
+        ttk.Label(jobs_frame, text=f"{cpu_count} CPU threads available", style="Small.TLabel").pack(side="left", padx=(10, 0))
+        
+        watch_check = tk.Checkbutton(batch_output_inner,
+                                     text="Keep watching the input folder and compress new videos as they arrive",
+                                     variable=self.watch_folder,
+                                     bg=self.bg_secondary,
+                                     fg=self.text_primary,
+                                     selectcolor=self.bg_tertiary,
+                                     activebackground=self.bg_secondary,
+                                     activeforeground=self.text_primary,
+                                     font=("Segoe UI", 9),
+                                     relief="flat",
+                                     cursor="hand2")
+        watch_check.pack(anchor="w", pady=(10, 0))
+        
+        share_check = tk.Checkbutton(batch_output_inner,
+                                     text="Share this machine: low-priority encoders, fewer jobs when load or memory is high",
+                                     variable=self.share_machine,
+                                     bg=self.bg_secondary,
+                                     fg=self.text_primary,
+                                     selectcolor=self.bg_tertiary,
+                                     activebackground=self.bg_secondary,
+                                     activeforeground=self.text_primary,
+                                     font=("Segoe UI", 9),
+                                     relief="flat",
+                                     cursor="hand2")
+        share_check.pack(anchor="w", pady=(5, 0))
+        
+        dedupe_check = tk.Checkbutton(batch_output_inner,
+                                      text="Encode duplicate files once and hard-link the copies",
+                                      variable=self.dedupe_inputs,
+                                      bg=self.bg_secondary,
+                                      fg=self.text_primary,
+                                      selectcolor=self.bg_tertiary,
+                                      activebackground=self.bg_secondary,
+                                      activeforeground=self.text_primary,
+                                      font=("Segoe UI", 9),
+                                      relief="flat",
+                                      cursor="hand2")
+        dedupe_check.pack(anchor="w", pady=(5, 0))
     
     def create_convert_section(self):
         convert_frame = ttk.Frame(self.main_frame, style="Card.TFrame")
@@ -531,12 +790,12 @@ class VideoCompressor:
         
         formats = ["MP4", "AVI", "MOV", "MKV", "WMV", "FLV", "WEBM", "M4V"]
         
-        # Create format selectors in a grid
+        # The source container is probed, so "From" only shows what was found
         ttk.Label(formats_frame, text="From:", style="Dark.TLabel").grid(row=0, column=0, padx=(0, 10), pady=5, sticky="w")
         
-        self.from_format_combo = ttk.Combobox(formats_frame, values=formats, state="readonly", width=10)
-        self.from_format_combo.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
-        self.from_format_combo.set("MP4")
+        self.from_format_label = ttk.Label(formats_frame, text="", style="Small.TLabel", width=24)
+        self.from_format_label.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
+        self.input_file.trace_add("write", lambda *args: self.update_from_format())
         
         ttk.Label(formats_frame, text="To:", style="Dark.TLabel").grid(row=0, column=2, padx=(20, 10), pady=5, sticky="w")
         
@@ -548,19 +807,19 @@ class VideoCompressor:
         formats_frame.grid_columnconfigure(3, weight=1)
         
         # Convert button
-        convert_btn = tk.Button(convert_inner,
-                               text="CONVERT FORMAT",
-                               bg=self.accent,
-                               fg=self.bg_primary,
-                               relief="flat",
-                               font=("Segoe UI", 10, "bold"),
-                               padx=20,
-                               pady=8,
-                               cursor="hand2",
-                               command=self.convert_video)
-        convert_btn.pack(fill="x", pady=(15, 0))
-        convert_btn.bind("<Enter>", lambda e: convert_btn.config(bg=self.accent_hover))
-        convert_btn.bind("<Leave>", lambda e: convert_btn.config(bg=self.accent))
+        self.convert_btn = tk.Button(convert_inner,
+                                     text="CONVERT FORMAT",
+                                     bg=self.accent,
+                                     fg=self.bg_primary,
+                                     relief="flat",
+                                     font=("Segoe UI", 10, "bold"),
+                                     padx=20,
+                                     pady=8,
+                                     cursor="hand2",
+                                     command=self.convert_video)
+        self.convert_btn.pack(fill="x", pady=(15, 0))
+        self.convert_btn.bind("<Enter>", lambda e: self.convert_btn.config(bg=self.accent_hover) if not self.is_processing else None)
+        self.convert_btn.bind("<Leave>", lambda e: self.convert_btn.config(bg=self.accent) if not self.is_processing else None)
     
     def toggle_mode(self):
         mode = self.compression_mode.get()
@@ -572,6 +831,7 @@ class VideoCompressor:
         self.batch_output_card.pack_forget()
         self.current_file_label.pack_forget()
         self.current_file_progress_bar.pack_forget()
+        self.queue_frame.pack_forget()
         
         if mode == "single":
             self.single_input_card.pack(fill="x", pady=(0, 15))
@@ -582,12 +842,78 @@ class VideoCompressor:
             self.batch_output_card.pack(fill="x", pady=(0, 15))
             self.current_file_label.pack(anchor="w", pady=(10, 5))
             self.current_file_progress_bar.pack(fill="x", pady=(0, 5))
+            self.queue_frame.pack(fill="x", pady=(10, 0))
             self.compress_btn.config(text="COMPRESS BATCH")
             self.update_files_count()
         
+        self.update_from_format()
+        
         # Update scroll region after mode change
         self.root.after(10, self.update_scroll_region)
     
+    def update_from_format(self):
+        path = self.input_file.get()
+        if self.compression_mode.get() != "single":
+            self.from_format_label.config(text="Detected per file")
+            return
+        if not path or not os.path.isfile(path):
+            self.from_format_label.config(text="—")
+            return
+        
+        self.from_format_label.config(text="Detecting...")
+        
+        def probe():
+            info = self.engine.prober.probe(self.ffmpeg_path.get(), path)
+            codecs = []
+            if info and info["video"]:
+                codecs.append(info["video"]["codec"])
+            if info and info["audio"]:
+                codecs.append(info["audio"][0]["codec"])
+            text = os.path.splitext(path)[1].lstrip(".").upper() or "?"
+            if codecs:
+                text += f" ({' / '.join(codecs)})"
+            self.root.after(0, self.show_from_format, path, text)
+        
+        threading.Thread(target=probe, daemon=True).start()
+    
+    def show_from_format(self, path, text):
+        # Only the latest selection gets to update the label
+        if self.input_file.get() == path:
+            self.from_format_label.config(text=text)
+    
+    def get_backend_name(self):
+        if self.video_codec.get() == AUTO_CODEC_LABEL:
+            return AUTO_CODEC
+        for backend in ENCODER_BACKENDS.values():
+            if backend.label == self.video_codec.get():
+                return backend.name
+        return DEFAULT_CODEC
+    
+    def update_codec_stats_label(self):
+        if self.get_backend_name() == AUTO_CODEC:
+            # Size targets depend on each file, so only the no-target pick can be shown up front
+            codec = self.engine.encoder_stats.pick_fastest(1.0)
+            self.codec_stats_label.config(
+                text=f"Fastest measured: {ENCODER_BACKENDS[codec].label}" if codec
+                else "No measurements yet; uses H.264 until there are")
+            return
+        entry = self.engine.encoder_stats.get(self.get_backend_name())
+        if entry:
+            self.codec_stats_label.config(
+                text=f"Measured: {entry['fps']:.0f} fps • output {entry['ratio'] * 100:.0f}% of source "
+                     f"({entry['samples']} encodes)")
+        else:
+            self.codec_stats_label.config(text="No measurements yet")
+    
+    def get_encode_settings(self):
+        target_mb = float(self.target_size_mb.get()) if self.target_size_enabled.get() else None
+        max_height = None if self.max_height.get() == "Original" else int(self.max_height.get().rstrip("p"))
+        max_fps = None if self.max_fps.get() == "Original" else int(self.max_fps.get())
+        audio_mode = next(mode for mode, label in AUDIO_MODES.items() if label == self.audio_mode.get())
+        return make_settings(self.preset.get(), self.quality.get(), self.get_backend_name(), target_mb,
+                             max_height, max_fps, self.drop_duplicates.get(), audio_mode,
+                             self.all_audio_tracks.get(), self.downmix.get())
+    
     def update_quality_label(self, value):
         self.quality_label.config(text=str(int(float(value))))
         
@@ -637,40 +963,22 @@ class VideoCompressor:
             self.files_count_label.config(text="")
             return
         
-        video_extensions = ['*.mp4', '*.avi', '*.mov', '*.mkv', '*.wmv', '*.flv', '*.webm', '*.m4v']
-        video_files = []
+        # Counting can take a while on network shares, so it runs off the Tk thread
+        self.files_count_token += 1
+        token = self.files_count_token
+        self.files_count_label.config(text="Scanning for video files...")
         
-        for ext in video_extensions:
-            video_files.extend(glob.glob(os.path.join(self.input_folder.get(), ext)))
-            video_files.extend(glob.glob(os.path.join(self.input_folder.get(), ext.upper())))
+        def count_files(input_folder, output_folder):
+            count = sum(1 for _ in scan_videos(input_folder, skip_dirs=[output_folder]))
+            self.root.after(0, self.show_files_count, token, count)
         
-        count = len(video_files)
-        self.files_count_label.config(text=f"Found {count} video files")
-    
-    def get_video_duration(self, filepath):
-        try:
-            cmd = [self.ffmpeg_path.get(), "-i", filepath]
-            result = subprocess.run(cmd, stderr=subprocess.PIPE, text=True, timeout=30)
-            duration_match = re.search(r'Duration: (\d{2}):(\d{2}):(\d{2})', result.stderr)
-            if duration_match:
-                hours, minutes, seconds = map(int, duration_match.groups())
-                return hours * 3600 + minutes * 60 + seconds
-        except:
-            pass
-        return None
+        thread = threading.Thread(target=count_files, args=(self.input_folder.get(), self.output_folder.get()))
+        thread.daemon = True
+        thread.start()
     
-    def get_batch_files(self):
-        if not self.input_folder.get():
-            return []
-        
-        video_extensions = ['*.mp4', '*.avi', '*.mov', '*.mkv', '*.wmv', '*.flv', '*.webm', '*.m4v']
-        video_files = []
-        
-        for ext in video_extensions:
-            video_files.extend(glob.glob(os.path.join(self.input_folder.get(), ext)))
-            video_files.extend(glob.glob(os.path.join(self.input_folder.get(), ext.upper())))
-        
-        return sorted(video_files)
+    def show_files_count(self, token, count):
+        if token == self.files_count_token:
+            self.files_count_label.config(text=f"Found {count} video files (including subfolders)")
     
     def start_compression(self):
         if not os.path.exists(self.ffmpeg_path.get()):
@@ -679,6 +987,15 @@ class VideoCompressor:
         
         mode = self.compression_mode.get()
         
+        if self.target_size_enabled.get():
+            try:
+                target_mb = float(self.target_size_mb.get())
+            except ValueError:
+                target_mb = 0
+            if target_mb <= 0:
+                messagebox.showerror("Error", "Please enter a valid target size in MB")
+                return
+        
         if mode == "single":
             if not self.input_file.get():
                 messagebox.showerror("Error", "Please select an input video file")
@@ -693,27 +1010,25 @@ class VideoCompressor:
             if not self.output_folder.get():
                 messagebox.showerror("Error", "Please specify an output folder")
                 return
-            
-            self.batch_files = self.get_batch_files()
-            if not self.batch_files:
-                messagebox.showerror("Error", "No video files found in the input folder")
+            if not os.path.isdir(self.input_folder.get()):
+                messagebox.showerror("Error", "The input folder does not exist")
                 return
             
             # Create output folder if it doesn't exist
             os.makedirs(self.output_folder.get(), exist_ok=True)
         
-        self.is_processing = True
-        self.compress_btn.config(state="disabled", bg=self.bg_tertiary, 
-                               text="PROCESSING..." if mode == "single" else "PROCESSING BATCH...")
+        self.set_processing_state()
         self.progress.set(0)
         self.current_file_progress.set(0)
         
         if mode == "single":
             self.status_label.config(text="Processing video...")
             thread = threading.Thread(target=self.run_single_compression)
+        elif self.watch_folder.get():
+            self.status_label.config(text="Watching for new videos... press CANCEL to stop")
+            thread = threading.Thread(target=self.run_watch_folder)
         else:
-            self.current_batch_index = 0
-            self.status_label.config(text=f"Processing batch: 0/{len(self.batch_files)} files")
+            self.status_label.config(text="Processing batch: scanning for files...")
             thread = threading.Thread(target=self.run_batch_compression)
         
         thread.daemon = True
@@ -721,143 +1036,105 @@ class VideoCompressor:
     
     def run_single_compression(self):
         try:
-            preset_settings = {
-                "ultra": {"crf": 28, "preset": "faster"},
-                "high": {"crf": 25, "preset": "fast"},
-                "balanced": {"crf": self.quality.get(), "preset": "medium"},
-                "quality": {"crf": 20, "preset": "slow"}
-            }
-            
-            settings = preset_settings[self.preset.get()]
-            
-            cmd = [
-                self.ffmpeg_path.get(),
-                "-i", self.input_file.get(),
-                "-c:v", "libx264",
-                "-crf", str(settings["crf"]),
-                "-preset", settings["preset"],
-                "-c:a", "aac",
-                "-b:a", "128k",
-                "-movflags", "+faststart",
-                "-y",
-                self.output_file.get()
-            ]
-            
-            duration = self.get_video_duration(self.input_file.get())
+            result = self.engine.compress_file(self.input_file.get(), self.output_file.get(),
+                                               self.get_encode_settings(), self.segment_parallel.get(),
+                                               self.on_single_event)
             
-            process = subprocess.Popen(cmd, stderr=subprocess.PIPE, text=True, bufsize=1)
-            
-            for line in process.stderr:
-                time_match = re.search(r'time=(\d{2}):(\d{2}):(\d{2})', line)
-                if time_match and duration:
-                    hours, minutes, seconds = map(int, time_match.groups())
-                    current_time = hours * 3600 + minutes * 60 + seconds
-                    progress = min((current_time / duration) * 100, 100)
-                    
-                    self.root.after(0, self.update_single_progress, progress, f"Processing: {progress:.1f}%")
-            
-            process.wait()
-            
-            if process.returncode == 0:
+            if result["status"] == "success":
                 self.root.after(0, self.single_compression_complete)
+            elif result["status"] == "cancelled" or not self.is_processing:
+                self.root.after(0, self.compression_cancelled)
             else:
-                self.root.after(0, self.compression_failed, "Compression failed")
+                self.root.after(0, self.compression_failed, result["error"])
                 
         except Exception as e:
-            self.root.after(0, self.compression_failed, str(e))
+            if self.is_processing:
+                self.root.after(0, self.compression_failed, str(e))
+            else:
+                self.root.after(0, self.compression_cancelled)
+    
+    def on_single_event(self, event):
+        # Called from engine worker threads; only root.after touches Tk
+        if event["type"] == "stats":
+            self.post(self.update_codec_stats_label)
+        elif event["type"] == "status":
+            self.post(self.update_single_progress, event["fraction"] * 100, event["message"])
+        elif event["type"] == "progress":
+            progress = event["fraction"] * 100
+            if event["detail"] and not event["speed"]:
+                text = f"Processing: {progress:.1f}% ({event['detail']})"
+            else:
+                text = f"Processing: {progress:.1f}%"
+                if event["speed"]:
+                    text += f" • {event['speed']:.2f}x"
+                if event["fps"]:
+                    text += f" • {event['fps']:.0f} fps"
+            self.post(self.update_single_progress, progress, text)
     
     def run_batch_compression(self):
         try:
-            total_files = len(self.batch_files)
-            successful = 0
-            failed = 0
+            results = self.engine.compress_batch(self.input_folder.get(), self.output_folder.get(),
+                                                 self.get_encode_settings(), self.on_batch_event)
             
-            preset_settings = {
-                "ultra": {"crf": 28, "preset": "faster"},
-                "high": {"crf": 25, "preset": "fast"},
-                "balanced": {"crf": self.quality.get(), "preset": "medium"},
-                "quality": {"crf": 20, "preset": "slow"}
-            }
+            if not results:
+                self.root.after(0, self.compression_failed, "No video files found in the input folder")
+                return
             
-            settings = preset_settings[self.preset.get()]
-            
-            for i, input_file in enumerate(self.batch_files):
-                if not self.is_processing:  # Check if cancelled
-                    break
-                
-                self.current_batch_index = i
-                filename = os.path.basename(input_file)
-                
-                # Update UI
-                self.root.after(0, self.update_batch_progress, 
-                               (i / total_files) * 100, 
-                               f"Processing: {i}/{total_files} files completed",
-                               f"Current file: {filename}")
-                
-                # Generate output path
-                input_path = Path(input_file)
-                output_file = os.path.join(self.output_folder.get(), 
-                                         f"{input_path.stem}_compressed{input_path.suffix}")
-                
-                # Skip if output file already exists
-                if os.path.exists(output_file):
-                    self.root.after(0, self.update_current_file_progress, 100, f"Skipped (already exists): {filename}")
-                    continue
-                
-                cmd = [
-                    self.ffmpeg_path.get(),
-                    "-i", input_file,
-                    "-c:v", "libx264",
-                    "-crf", str(settings["crf"]),
-                    "-preset", settings["preset"],
-                    "-c:a", "aac",
-                    "-b:a", "128k",
-                    "-movflags", "+faststart",
-                    "-y",
-                    output_file
-                ]
-                
-                duration = self.get_video_duration(input_file)
-                
-                try:
-                    process = subprocess.Popen(cmd, stderr=subprocess.PIPE, text=True, bufsize=1)
-                    
-                    for line in process.stderr:
-                        if not self.is_processing:  # Check if cancelled
-                            process.terminate()
-                            break
-                            
-                        time_match = re.search(r'time=(\d{2}):(\d{2}):(\d{2})', line)
-                        if time_match and duration:
-                            hours, minutes, seconds = map(int, time_match.groups())
-                            current_time = hours * 3600 + minutes * 60 + seconds
-                            file_progress = min((current_time / duration) * 100, 100)
-                            
-                            self.root.after(0, self.update_current_file_progress, 
-                                           file_progress, f"Compressing: {filename} ({file_progress:.1f}%)")
-                    
-                    process.wait()
-                    
-                    if process.returncode == 0:
-                        successful += 1
-                        self.root.after(0, self.update_current_file_progress, 100, f"Completed: {filename}")
-                    else:
-                        failed += 1
-                        self.root.after(0, self.update_current_file_progress, 0, f"Failed: {filename}")
-                        
-                except Exception as e:
-                    failed += 1
-                    self.root.after(0, self.update_current_file_progress, 0, f"Error: {filename} - {str(e)}")
+            self.batch_results = results
+            successful = sum(1 for result in results if result["status"] == "success")
+            failed = sum(1 for result in results if result["status"] == "failed")
             
             # Final update
             if self.is_processing:  # Only if not cancelled
-                self.root.after(0, self.batch_compression_complete, successful, failed, total_files)
+                self.root.after(0, self.batch_compression_complete, successful, failed, len(results),
+                                self.engine.batch_stats.summary())
             else:
                 self.root.after(0, self.compression_cancelled)
                 
+        except Exception as e:
+            if self.is_processing:
+                self.root.after(0, self.compression_failed, str(e))
+            else:
+                self.root.after(0, self.compression_cancelled)
+    
+    def run_watch_folder(self):
+        try:
+            self.engine.watch_folder(self.input_folder.get(), self.output_folder.get(),
+                                     self.get_encode_settings(), self.on_batch_event)
+            self.root.after(0, self.compression_cancelled, "Stopped watching")
         except Exception as e:
             self.root.after(0, self.compression_failed, str(e))
     
+    def on_batch_event(self, event):
+        if event["type"] == "stats":
+            self.post(self.update_codec_stats_label)
+        if event["type"] != "batch":
+            return
+        
+        finished = event["finished"]
+        active = event["active"]
+        total_files = max(event["total"], 1)
+        
+        # Running jobs count towards the total by their partial progress
+        overall = (finished + sum(active.values()) / 100) / total_files * 100
+        overall_text = f"Processing: {finished}/{total_files} files completed"
+        if not event["scan_done"]:
+            overall_text += " (still scanning)"
+        if active:
+            overall_text += f" • {len(active)} running"
+        summary = describe_summary(event["summary"])
+        if summary:
+            overall_text += f" • {summary}"
+        
+        current_file_text = event["message"]
+        if current_file_text is None:
+            current_file_text = f"{event['verb']}: " + ", ".join(
+                f"{name} ({value:.1f}%)" for name, value in sorted(active.items()))
+        current_value = sum(active.values()) / len(active) if active else 100
+        
+        self.post(self.update_batch_progress, overall, overall_text, current_file_text)
+        self.post(self.update_current_file_progress, current_value, current_file_text)
+    
     def update_single_progress(self, value, text):
         self.progress.set(value)
         self.progress_text.config(text=text)
@@ -871,9 +1148,111 @@ class VideoCompressor:
         self.current_file_progress.set(value)
         self.current_file_label.config(text=text)
     
-    def single_compression_complete(self):
+    def set_processing_state(self):
+        # While a job runs the main button doubles as its cancel button
+        self.is_processing = True
+        self.engine.ffmpeg_path = self.ffmpeg_path.get()
+        self.engine.parallel_jobs = self.parallel_jobs.get()
+        self.engine.low_priority = self.share_machine.get()
+        self.engine.adaptive = self.share_machine.get()
+        self.engine.dedupe = self.dedupe_inputs.get()
+        self.engine.tracer = Tracer() if self.record_trace.get() else None
+        self.engine.start()
+        self.compress_btn.config(state="normal", bg=self.error, text="CANCEL", command=self.cancel_processing)
+        self.convert_btn.config(state="disabled", bg=self.bg_tertiary)
+        self.predict_btn.config(state="disabled", bg=self.bg_tertiary)
+        self.queue_tree.delete(*self.queue_tree.get_children())
+        self.root.after(500, self.refresh_queue_view)
+    
+    def post(self, callback, *args):
+        # root.after(0) for worker threads. With a trace running, the time a
+        # callback sits waiting for the Tk loop is recorded as its own span
+        tracer = self.engine.tracer
+        if tracer is None:
+            self.root.after(0, callback, *args)
+            return
+        posted = tracer.now()
+        
+        def run():
+            tracer.add_span("callback wait", posted, tracer.now(), "tk")
+            with tracer.span(callback.__name__, "tk"):
+                callback(*args)
+        self.root.after(0, run)
+    
+    def save_trace(self):
+        tracer = self.engine.tracer
+        if tracer is None:
+            return
+        self.engine.tracer = None
+        folder = os.path.join(Path.home(), ".video_compressor", "traces")
+        path = os.path.join(folder, time.strftime("compress-%Y%m%d-%H%M%S.json"))
+        try:
+            tracer.write(path)
+            self.trace_label.config(text=f"Saved {path}")
+        except OSError as e:
+            self.trace_label.config(text=f"Could not save trace: {e}")
+    
+    def refresh_queue_view(self):
+        for job in self.engine.queue_snapshot():
+            iid = str(job["id"])
+            progress = f"{job['progress']:.1f}%" if job["progress"] is not None else ""
+            status = f"{job['status']} on {job['remote']}" if job["remote"] else job["status"]
+            values = (job["name"], "urgent" if job["priority"] == PRIORITY_URGENT else "normal", status, progress)
+            if self.queue_tree.exists(iid):
+                self.queue_tree.item(iid, values=values)
+            else:
+                self.queue_tree.insert("", "end", iid=iid, values=values)
+        if self.is_processing:
+            self.root.after(500, self.refresh_queue_view)
+    
+    def get_selected_jobs(self):
+        return [int(iid) for iid in self.queue_tree.selection()]
+    
+    def prioritize_selected_jobs(self):
+        for job_id in self.get_selected_jobs():
+            self.engine.set_job_priority(job_id, PRIORITY_URGENT)
+        self.refresh_queue_view()
+    
+    def pause_selected_jobs(self):
+        remote = {job["id"]: job for job in self.engine.queue_snapshot() if job["remote"]}
+        refused = []
+        for job_id in self.get_selected_jobs():
+            if not self.engine.pause_job(job_id) and job_id in remote:
+                refused.append(remote[job_id]["name"])
+        self.refresh_queue_view()
+        if refused:
+            messagebox.showinfo("Pause", "Jobs running on a remote worker can't be paused:\n" + "\n".join(refused))
+    
+    def resume_selected_jobs(self):
+        for job_id in self.get_selected_jobs():
+            self.engine.resume_job(job_id)
+        self.refresh_queue_view()
+    
+    def cancel_selected_jobs(self):
+        for job_id in self.get_selected_jobs():
+            self.engine.cancel_job(job_id)
+        self.refresh_queue_view()
+    
+    def reset_processing_state(self):
+        self.is_processing = False
+        self.save_trace()
+        self.refresh_queue_view()
+        mode = self.compression_mode.get()
+        self.compress_btn.config(state="normal", bg=self.accent, command=self.start_compression,
+                                 text="COMPRESS VIDEO" if mode == "single" else "COMPRESS BATCH")
+        self.convert_btn.config(state="normal", bg=self.accent)
+        self.predict_btn.config(state="normal", bg=self.accent)
+    
+    def cancel_processing(self):
+        if not self.is_processing:
+            return
         self.is_processing = False
-        self.compress_btn.config(state="normal", bg=self.accent, text="COMPRESS VIDEO")
+        self.compress_btn.config(state="disabled", bg=self.bg_tertiary, text="CANCELLING...")
+        self.status_label.config(text="Cancelling...", foreground="#ffaa00")
+        self.engine.cancel()
+    
+    def single_compression_complete(self):
+        self.reset_processing_state()
         self.progress.set(100)
         self.status_label.config(text="✓ Compression complete!", foreground=self.success)
         self.progress_text.config(text="Video saved successfully")
@@ -891,9 +1270,8 @@ class VideoCompressor:
         except:
             messagebox.showinfo("Success", "Video compressed successfully!")
     
-    def batch_compression_complete(self, successful, failed, total):
-        self.is_processing = False
-        self.compress_btn.config(state="normal", bg=self.accent, text="COMPRESS BATCH")
+    def batch_compression_complete(self, successful, failed, total, summary):
+        self.reset_processing_state()
         self.progress.set(100)
         self.current_file_progress.set(100)
         
@@ -906,41 +1284,27 @@ class VideoCompressor:
             self.progress_text.config(text=f"{successful} successful, {failed} failed out of {total} files")
             self.current_file_label.config(text="Check individual file results")
         
-        # Calculate total size reduction if possible
-        try:
-            total_input_size = 0
-            total_output_size = 0
+        # Totals come from the per-job records collected while the batch ran
+        if summary["ratio"] is not None:
+            total_input_mb = summary["input_bytes"] / (1024 * 1024)
+            total_output_mb = summary["output_bytes"] / (1024 * 1024)
+            total_reduction = (1 - summary["ratio"]) * 100
             
-            for input_file in self.batch_files:
-                if os.path.exists(input_file):
-                    total_input_size += os.path.getsize(input_file)
-                    
-                    input_path = Path(input_file)
-                    output_file = os.path.join(self.output_folder.get(), 
-                                             f"{input_path.stem}_compressed{input_path.suffix}")
-                    if os.path.exists(output_file):
-                        total_output_size += os.path.getsize(output_file)
+            throughput = ""
+            if summary["source_seconds_per_second"]:
+                throughput = (f"Throughput: {summary['mb_per_second']:.1f} MB/s "
+                              f"({summary['source_seconds_per_second']:.1f}x realtime)\n")
             
-            if total_input_size > 0 and total_output_size > 0:
-                total_input_mb = total_input_size / (1024 * 1024)
-                total_output_mb = total_output_size / (1024 * 1024)
-                total_reduction = ((total_input_size - total_output_size) / total_input_size) * 100
-                
-                messagebox.showinfo("Batch Compression Complete", 
-                                  f"Batch processing finished!\n\n"
-                                  f"Files processed: {successful}/{total}\n"
-                                  f"Failed: {failed}\n\n"
-                                  f"Total original size: {total_input_mb:.1f} MB\n"
-                                  f"Total compressed size: {total_output_mb:.1f} MB\n"
-                                  f"Total size reduction: {total_reduction:.1f}%\n\n"
-                                  f"Output folder: {self.output_folder.get()}")
-            else:
-                messagebox.showinfo("Batch Compression Complete", 
-                                  f"Batch processing finished!\n\n"
-                                  f"Files processed: {successful}/{total}\n"
-                                  f"Failed: {failed}\n\n"
-                                  f"Output folder: {self.output_folder.get()}")
-        except:
+            messagebox.showinfo("Batch Compression Complete", 
+                              f"Batch processing finished!\n\n"
+                              f"Files processed: {successful}/{total}\n"
+                              f"Failed: {failed}\n\n"
+                              f"Total original size: {total_input_mb:.1f} MB\n"
+                              f"Total compressed size: {total_output_mb:.1f} MB\n"
+                              f"Total size reduction: {total_reduction:.1f}%\n"
+                              f"{throughput}\n"
+                              f"Output folder: {self.output_folder.get()}")
+        else:
             messagebox.showinfo("Batch Compression Complete", 
                               f"Batch processing finished!\n\n"
                               f"Files processed: {successful}/{total}\n"
@@ -948,70 +1312,192 @@ class VideoCompressor:
                               f"Output folder: {self.output_folder.get()}")
     
     def compression_failed(self, error):
-        self.is_processing = False
-        mode = self.compression_mode.get()
-        self.compress_btn.config(state="normal", bg=self.accent, 
-                               text="COMPRESS VIDEO" if mode == "single" else "COMPRESS BATCH")
+        self.reset_processing_state()
         self.status_label.config(text="✗ Compression failed", foreground=self.error)
         self.progress_text.config(text=error)
         messagebox.showerror("Error", f"Compression failed:\n{error}")
     
-    def compression_cancelled(self):
-        self.is_processing = False
-        mode = self.compression_mode.get()
-        self.compress_btn.config(state="normal", bg=self.accent, 
-                               text="COMPRESS VIDEO" if mode == "single" else "COMPRESS BATCH")
-        self.status_label.config(text="Compression cancelled", foreground="#ffaa00")
+    def compression_cancelled(self, text="Compression cancelled"):
+        self.reset_processing_state()
+        self.progress.set(0)
+        self.status_label.config(text=text, foreground="#ffaa00")
         self.progress_text.config(text="Operation was cancelled by user")
     
+    def start_crf_prediction(self):
+        if self.is_processing:
+            return
+        if not os.path.exists(self.ffmpeg_path.get()):
+            messagebox.showerror("Error", f"FFmpeg not found at {self.ffmpeg_path.get()}")
+            return
+        if self.compression_mode.get() != "single" or not self.input_file.get():
+            messagebox.showerror("Error", "Please select an input video file in Single File mode")
+            return
+        if self.target_size_enabled.get():
+            try:
+                target_mb = float(self.target_size_mb.get())
+            except ValueError:
+                target_mb = 0
+            if target_mb <= 0:
+                messagebox.showerror("Error", "Please enter a valid target size in MB")
+                return
+        
+        self.set_processing_state()
+        self.progress.set(0)
+        self.status_label.config(text="Predicting CRF from samples...", foreground=self.text_primary)
+        
+        thread = threading.Thread(target=self.run_crf_prediction)
+        thread.daemon = True
+        thread.start()
+    
+    def run_crf_prediction(self):
+        try:
+            result = self.engine.predict_crf(self.input_file.get(), self.get_encode_settings(),
+                                             self.on_single_event)
+            if result is None or not self.is_processing:
+                self.root.after(0, self.compression_cancelled, "Prediction cancelled")
+                return
+            self.root.after(0, self.crf_prediction_complete, result["predictions"], result["choice"],
+                            result["met"], result["metric"])
+        
+        except Exception as e:
+            if self.is_processing:
+                self.root.after(0, self.crf_prediction_failed, str(e))
+            else:
+                self.root.after(0, self.compression_cancelled, "Prediction cancelled")
+    
+    def format_prediction(self, row, metric):
+        crf, size_mb, score = row
+        text = f"CRF {crf}: ~{size_mb:.1f} MB"
+        if score is not None:
+            text += f", {'VMAF' if metric == 'libvmaf' else 'SSIM'} {score:.3f}"
+        return text
+    
+    def finish_crf_prediction(self):
+        self.reset_processing_state()
+        self.progress.set(0)
+    
+    def crf_prediction_complete(self, predictions, choice, met, metric):
+        self.finish_crf_prediction()
+        crf = choice[0]
+        
+        # The Balanced preset is the one that follows the CRF slider
+        self.preset.set("balanced")
+        self.quality.set(crf)
+        self.update_quality_label(crf)
+        if self.target_size_enabled.get() and met:
+            self.target_size_enabled.set(False)
+        
+        self.predict_label.config(text=self.format_prediction(choice, metric) + ("" if met else " (target not reached)"))
+        self.status_label.config(text=f"✓ Predicted CRF {crf}", foreground=self.success)
+        self.progress_text.config(text="Balanced preset now uses the predicted CRF")
+        
+        messagebox.showinfo("CRF Prediction",
+                            "Predicted results for the whole file:\n\n" +
+                            "\n".join(self.format_prediction(row, metric) for row in predictions) +
+                            f"\n\nSelected: CRF {crf}" + ("" if met else "\nNo CRF reached the target; picked the closest."))
+    
+    def crf_prediction_failed(self, error):
+        self.finish_crf_prediction()
+        self.status_label.config(text="✗ Prediction failed", foreground=self.error)
+        self.progress_text.config(text=error)
+        messagebox.showerror("Error", f"CRF prediction failed:\n{error}")
+    
     def convert_video(self):
+        if self.is_processing:
+            return
+        if not os.path.exists(self.ffmpeg_path.get()):
+            messagebox.showerror("Error", f"FFmpeg not found at {self.ffmpeg_path.get()}")
+            return
+        
         mode = self.compression_mode.get()
         
         if mode == "single":
             if not self.input_file.get():
                 messagebox.showerror("Error", "Please select a video file first")
                 return
-            selected_file = self.input_file.get()
+            input_folder = None
+            output_dir = None
         else:
-            messagebox.showerror("Error", "Format conversion only works in Single File mode")
-            return
-            
+            if not self.input_folder.get():
+                messagebox.showerror("Error", "Please select an input folder")
+                return
+            if not self.output_folder.get():
+                messagebox.showerror("Error", "Please specify an output folder")
+                return
+            if not os.path.isdir(self.input_folder.get()):
+                messagebox.showerror("Error", "The input folder does not exist")
+                return
+            input_folder = self.input_folder.get()
+            output_dir = self.output_folder.get()
+            os.makedirs(output_dir, exist_ok=True)
+        
+        to_fmt = self.to_format_combo.get().lower()
+        
+        self.set_processing_state()
+        self.progress.set(0)
+        self.current_file_progress.set(0)
+        self.status_label.config(text="Starting format conversion...", foreground=self.text_primary)
+        
+        thread = threading.Thread(target=self.run_conversion, args=(input_folder, to_fmt, output_dir))
+        thread.daemon = True
+        thread.start()
+    
+    def run_conversion(self, input_folder, to_fmt, output_dir):
         try:
-            self.progress.set(20)
-            self.status_label.config(text="Starting format conversion...")
-            
-            from_fmt = self.from_format_combo.get().lower()
-            to_fmt = self.to_format_combo.get().lower()
-            
-            # Generate output path
-            input_path = Path(selected_file)
-            output_path = input_path.parent / f"{input_path.stem}_converted.{to_fmt.lower()}"
-            
-            cmd = [
-                self.ffmpeg_path.get(),
-                "-i", selected_file,
-                "-c:v", "copy" if from_fmt == to_fmt else "libx264",
-                "-c:a", "copy" if from_fmt == to_fmt else "aac",
-                "-y",
-                str(output_path)
-            ]
-            
-            process = subprocess.run(cmd, capture_output=True, text=True)
+            if input_folder:
+                results = self.engine.convert_batch(input_folder, output_dir, to_fmt, self.on_batch_event)
+                if not results:
+                    self.root.after(0, self.conversion_failed, "No video files found in the input folder")
+                    return
+            else:
+                results = [self.engine.convert_single(self.input_file.get(), to_fmt, self.on_batch_event)]
             
-            if process.returncode == 0:
-                self.progress.set(100)
-                self.status_label.config(text="✓ Format conversion complete!", foreground=self.success)
-                self.progress_text.config(text=f"Video converted and saved to: {output_path}")
-                messagebox.showinfo("Success", f"Video converted successfully!\n\nSaved to:\n{output_path}")
+            if self.is_processing:
+                self.root.after(0, self.conversion_complete, results)
             else:
-                raise Exception(process.stderr)
-                
+                self.root.after(0, self.compression_cancelled, "Conversion cancelled")
+        
         except Exception as e:
-            self.status_label.config(text="✗ Conversion failed", foreground=self.error)
-            self.progress_text.config(text=f"Conversion error: {str(e)}")
-            messagebox.showerror("Error", f"Failed to convert video:\n{str(e)}")
-        finally:
-            self.progress.set(0)
+            self.root.after(0, self.conversion_failed, str(e))
+    
+    def conversion_complete(self, results):
+        self.reset_processing_state()
+        failures = [result for result in results if result["error"]]
+        
+        if len(results) == 1:
+            output_file = results[0]["output"]
+            actions = results[0]["actions"]
+            if results[0]["error"]:
+                self.conversion_failed(results[0]["error"])
+                return
+            self.progress.set(100)
+            self.status_label.config(text="✓ Format conversion complete!", foreground=self.success)
+            self.progress_text.config(text=f"Video converted and saved to: {output_file} ({actions})")
+            messagebox.showinfo("Success", f"Video converted successfully!\n\nSaved to:\n{output_file}")
+            return
+        
+        self.progress.set(100)
+        converted = len(results) - len(failures)
+        if failures:
+            self.status_label.config(text="⚠ Batch conversion completed with errors", foreground="#ffaa00")
+        else:
+            self.status_label.config(text="✓ Batch conversion complete!", foreground=self.success)
+        self.progress_text.config(text=f"{converted} converted, {len(failures)} failed out of {len(results)} files")
+        
+        details = "".join(f"\n{os.path.basename(result['input'])}: {result['error'].splitlines()[-1]}"
+                          for result in failures[:5])
+        messagebox.showinfo("Batch Conversion Complete",
+                            f"Batch conversion finished!\n\n"
+                            f"Files converted: {converted}/{len(results)}\n"
+                            f"Failed: {len(failures)}{details}\n\n"
+                            f"Output folder: {self.output_folder.get()}")
+    
+    def conversion_failed(self, error):
+        self.reset_processing_state()
+        self.progress.set(0)
+        self.status_label.config(text="✗ Conversion failed", foreground=self.error)
+        self.progress_text.config(text=f"Conversion error: {error.splitlines()[-1] if error else ''}")
+        messagebox.showerror("Error", f"Failed to convert video:\n{error}")
 
 if __name__ == "__main__":
     root = tk.Tk()